@@ -0,0 +1,392 @@
+import argparse
+import gzip
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from engine import RuleEngine
+from models import GameState, Meld
+
+# 牌谱统一转换成事件流 (kind, who, data)，牌一律为 34 格式：
+#   init     who=庄家，data=(场风, 宝牌指示牌, 四家配牌)
+#   draw     who 摸 data                      discard  who 打出 data
+#   meld     who 鸣牌，data=(类型, 从手里拿出的牌, 被鸣的牌 (暗杠/加杠为 -1), 放铳者)
+#            类型: chi / pon / kan (大明杠) / ankan / kakan
+#   reach    who 立直成立 (在宣言牌打出之后)     dora     新的宝牌指示牌 data
+#   end      一局结束 (和牌/流局)               game     一整场牌谱结束
+Event = Tuple[str, int, object]
+
+
+def _open(path: str):
+    """按文件头自动识别 gzip (天凤的 .mjlog 即 gzip 压缩的 XML，扩展名不一定是 .gz)"""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    return gzip.open(path, 'rb') if magic == b'\x1f\x8b' else open(path, 'rb')
+
+
+# --- 天凤 mjlog (XML) ---
+def decode_meld(m: int) -> Tuple[str, List[int], int]:
+    """解码 <N m="..."/> 的副露编码，返回 (类型, 从手里拿出的牌 (136), 被鸣的牌 (136，暗杠/加杠为 -1))"""
+    if m & 0x4:  # 吃
+        t = (m >> 10) & 0x3f
+        r, t = t % 3, t // 3
+        base = t // 7 * 9 + t % 7
+        tiles = [(base + i) * 4 + ((m >> (3 + 2 * i)) & 3) for i in range(3)]
+        return 'chi', tiles[:r] + tiles[r + 1:], tiles[r]
+    if m & 0x18:  # 碰 (0x8) / 加杠 (0x10)
+        t = (m >> 9) & 0x7f
+        r, base = t % 3, t // 3
+        t4 = (m >> 5) & 3
+        if m & 0x10: return 'kakan', [base * 4 + t4], -1
+        tiles = [base * 4 + i for i in range(4) if i != t4]
+        return 'pon', tiles[:r] + tiles[r + 1:], tiles[r]
+    if m & 0x20:  # 拔北 (三麻)
+        return 'nuki', [((m >> 8) & 0xff)], -1
+    hai = (m >> 8) & 0xff
+    tiles = [hai // 4 * 4 + i for i in range(4)]
+    if m & 3 == 0: return 'ankan', tiles, -1
+    r = hai % 4
+    return 'kan', tiles[:r] + tiles[r + 1:], tiles[r]
+
+
+def iter_mjlog_events(stream) -> Iterator[Event]:
+    """增量解析 mjlog XML：边读边产出事件，处理完的元素立即清掉，内存占用与牌谱长度无关"""
+    root = None
+    for kind, elem in ET.iterparse(stream, events=('start', 'end')):
+        if kind == 'start':
+            if root is None: root = elem
+            continue
+        tag, attr = elem.tag, elem.attrib
+        if tag == 'INIT':
+            seed = [int(x) for x in attr['seed'].split(',')]
+            hands = [[int(x) // 4 for x in attr.get(f'hai{i}', '').split(',') if x] for i in range(4)]
+            yield 'init', int(attr['oya']), (27 + seed[0] // 4, seed[5] // 4, hands)
+        elif len(tag) > 1 and tag[1:].isdigit() and tag[0] in 'TUVWDEFGtuvwdefg':
+            who = 'TUVWDEFG'.index(tag[0].upper()) % 4
+            yield ('draw' if tag[0].upper() in 'TUVW' else 'discard'), who, int(tag[1:]) // 4
+        elif tag == 'N':
+            who, m = int(attr['who']), int(attr['m'])
+            meld_type, hand_tiles, called = decode_meld(m)
+            if meld_type != 'nuki':
+                yield 'meld', who, (meld_type, [t // 4 for t in hand_tiles], called // 4 if called >= 0 else -1,
+                                    (who + (m & 3)) % 4)
+        elif tag == 'REACH' and attr.get('step') == '2':
+            yield 'reach', int(attr['who']), None
+        elif tag == 'DORA':
+            yield 'dora', -1, int(attr['hai']) // 4
+        elif tag in ('AGARI', 'RYUUKYOKU'):
+            yield 'end', -1, None
+        elif tag == 'mjloggm':
+            yield 'game', -1, None
+        elem.clear()
+        if root is not None and elem is not root: root.clear()
+
+
+# --- tenhou.net/6 (JSON) ---
+def _json_tile(code: int) -> int:
+    """11-19 万 / 21-29 筒 / 31-39 索 / 41-47 字，51-53 为赤五"""
+    if code >= 51: return (code - 51) * 9 + 4
+    return (code // 10 - 1) * 9 + code % 10 - 1
+
+
+def _parse_call(text: str) -> Tuple[str, List[int], int, int]:
+    """
+    解析 tenhou.net/6 的鸣牌字符串 (如 'c275226'、'45p4545'、'424242a42')。
+    返回 (字母, 全部牌 (原始编码), 被鸣/加杠的牌 (原始编码), 字母所在的组序号)
+    """
+    pos = next(i for i, ch in enumerate(text) if ch.isalpha())
+    letter = text[pos]
+    digits = text[:pos] + text[pos + 1:]
+    return letter, [int(digits[i:i + 2]) for i in range(0, len(digits), 2)], int(text[pos + 1:pos + 3]), pos // 2
+
+
+def iter_tenhou_json_events(game: Dict) -> Iterator[Event]:
+    """
+    把一局 tenhou.net/6 JSON 牌谱还原成按时间排序的事件流。
+    JSON 只按座位分别记录摸牌 (含吃碰明杠) 与打牌 (含立直/暗杠/加杠)，
+    这里按"打出的牌是否被下一条鸣牌记录吃/碰"推断行动顺序。
+    """
+    for kyoku in game.get('log', []):
+        kyoku_index = kyoku[0][0]
+        oya = kyoku_index % 4
+        dora = deque(kyoku[2])
+        hands = [[_json_tile(t) for t in kyoku[4 + 3 * i]] for i in range(4)]
+        takes = [deque(kyoku[5 + 3 * i]) for i in range(4)]
+        dahais = [deque(kyoku[6 + 3 * i]) for i in range(4)]
+        yield 'init', oya, (27 + kyoku_index // 4, _json_tile(dora.popleft()), hands)
+
+        who, last_draw, last_discard = oya, None, None
+        while takes[who]:
+            take = takes[who].popleft()
+            if isinstance(take, str):
+                letter, tiles, called, group = _parse_call(take)
+                rest = list(tiles)
+                rest.remove(called)
+                meld_type = {'c': 'chi', 'p': 'pon', 'm': 'kan'}[letter]
+                yield 'meld', who, (meld_type, [_json_tile(t) for t in rest], _json_tile(called), last_discard[0])
+                if meld_type == 'kan':
+                    if dahais[who] and dahais[who][0] == 0: dahais[who].popleft()
+                    if dora: yield 'dora', -1, _json_tile(dora.popleft())
+                    continue  # 明杠后摸岭上牌
+                last_draw = None
+            else:
+                last_draw = take
+                yield 'draw', who, _json_tile(take)
+
+            # 打牌阶段 (暗杠/加杠后摸岭上牌再继续)
+            discard = None
+            while dahais[who]:
+                dahai = dahais[who].popleft()
+                if isinstance(dahai, str) and ('a' in dahai or 'k' in dahai):
+                    letter, tiles, called, _ = _parse_call(dahai)
+                    if letter == 'a':
+                        yield 'meld', who, ('ankan', [_json_tile(t) for t in tiles], -1, who)
+                    else:
+                        yield 'meld', who, ('kakan', [_json_tile(called)], -1, who)
+                    if dora: yield 'dora', -1, _json_tile(dora.popleft())
+                    if not takes[who]: break
+                    last_draw = takes[who].popleft()
+                    yield 'draw', who, _json_tile(last_draw)
+                    continue
+                riichi = isinstance(dahai, str)
+                code = int(dahai[1:]) if riichi else dahai
+                discard = last_draw if code == 60 else code
+                yield 'discard', who, _json_tile(discard)
+                if riichi: yield 'reach', who, None
+                break
+            if discard is None: break  # 自摸 (或数据截断)
+            last_discard = (who, discard)
+
+            # 下一位行动者：鸣这张牌的碰/明杠 (字母位置 0/1/2(3) 对应上家/对家/下家放铳)，
+            # 否则轮到下家 (下家的吃在摸牌阶段按鸣牌处理)
+            nxt = (who + 1) % 4
+            for off in (1, 2, 3):
+                p = (who + off) % 4
+                head = takes[p][0] if takes[p] else None
+                if isinstance(head, str) and 'c' not in head:
+                    _, _, called, group = _parse_call(head)
+                    if called == discard and min(group, 2) == off - 1:
+                        nxt = p
+                        break
+            who = nxt
+        yield 'end', -1, None
+    yield 'game', -1, None
+
+
+# --- 逐巡重建局面并比较 ---
+class LogReplayer:
+    """
+    按事件流重建 GameState / PlayerState，在每一次可自由选择的打牌 (未立直、手牌 3n+2 张) 前
+    询问 RuleEngine 的推荐，与实际打出的牌比较。
+    GameState.visible_tiles 只记录公开信息 (牌河、副露、宝牌指示牌)，决策时再加上自己的手牌。
+    """
+
+    def __init__(self, engine: RuleEngine, budget: float = 0.0):
+        self.engine = engine
+        self.budget = budget
+        self.stats = empty_stats()
+        self.game: Optional[GameState] = None
+        self.oya = 0
+
+    def feed(self, events: Iterable[Event]) -> Dict:
+        for kind, who, data in events:
+            if kind == 'init': self._init(who, *data)
+            elif self.game is None: continue
+            elif kind == 'draw': self.game.players[who].add_tile_to_hand(data)
+            elif kind == 'discard': self._discard(who, data)
+            elif kind == 'meld': self._meld(who, *data)
+            elif kind == 'reach': self.game.players[who].is_riichi = True
+            elif kind == 'dora':
+                self.game.dora_indicators.append(data)
+                self.game.record_visible_tile(data)
+            elif kind == 'game': self.stats['games'] += 1
+        return self.stats
+
+    def _init(self, oya: int, round_wind: int, dora: int, hands: List[List[int]]):
+        self.game = game = GameState()
+        self.oya = oya
+        game.round_wind = round_wind
+        game.dora_indicators = [dora]
+        game.record_visible_tile(dora)
+        for player, tiles in zip(game.players, hands):
+            for t in tiles: player.add_tile_to_hand(t)
+        self.stats['rounds'] += 1
+
+    def _meld(self, who: int, meld_type: str, hand_tiles: List[int], called: int, from_who: int):
+        player = self.game.players[who]
+        for t in hand_tiles:
+            player.hand[t] -= 1
+            self.game.record_visible_tile(t)
+        if meld_type == 'kakan':
+            for meld in player.melds:
+                if meld.type == 'pon' and meld.tiles[0] == hand_tiles[0]:
+                    meld.type = 'kan'
+                    meld.tiles.append(hand_tiles[0])
+            return
+        player.melds.append(Meld('kan' if meld_type == 'ankan' else meld_type,
+                                 sorted(hand_tiles + ([called] if called >= 0 else []))))
+
+    def _discard(self, who: int, tile: int):
+        player = self.game.players[who]
+        if not player.is_riichi and sum(player.hand) % 3 == 2 and player.hand[tile] > 0:
+            self._compare(who, tile)
+        player.discard_tile(tile)
+        self.game.record_visible_tile(tile)
+
+    def _compare(self, who: int, tile: int):
+        game, player = self.game, self.game.players[who]
+        visible = [min(v + h, 4) for v, h in zip(game.visible_tiles, player.hand)]
+        # 引擎的算分只认碰/杠，吃按"无役判断缺少的面子"处理，不影响牌效比较
+        melds_data = [{'type': m.type, 'tile': m.tiles[0]} for m in player.melds]
+        deadline = time.monotonic() + self.budget if self.budget > 0 else None
+        shanten, recs = self.engine.recommend_discards(
+            list(player.hand), visible, melds_data, list(game.dora_indicators), round_wind=game.round_wind,
+            player_wind=27 + (who - self.oya) % 4, deadline=deadline)
+        if shanten == -1 or not recs: return  # 已和牌形 (见逃) 不计入
+
+        stats = self.stats
+        actual = next(r for r in recs if r['discard_tile'] == tile)
+        stats['decisions'] += 1
+        stats['agree'] += recs[0]['discard_tile'] == tile
+        stats['agree_top3'] += any(r['discard_tile'] == tile for r in recs[:3])
+        if actual['shanten_after_discard'] > shanten:
+            stats['retreats'] += 1
+        else:
+            best = max(r['total_ukeire'] for r in recs if r['shanten_after_discard'] == shanten)
+            stats['ukeire_loss'] += best - actual['total_ukeire']
+
+
+def empty_stats() -> Dict:
+    return {"games": 0, "rounds": 0, "decisions": 0, "agree": 0, "agree_top3": 0, "ukeire_loss": 0,
+            "retreats": 0, "errors": 0}
+
+
+# --- 进程池 ---
+_worker: Optional[LogReplayer] = None
+
+
+def _init_worker(search_depth: Optional[int], budget: float):
+    global _worker
+    engine = RuleEngine() if search_depth is None else RuleEngine(search_depth=search_depth)
+    _worker = LogReplayer(engine, budget)
+
+
+def analyze_task(task: Tuple[str, object]) -> Dict:
+    """
+    处理一个任务并返回统计增量：('xml', 文件路径) 在子进程里流式解析整个文件；
+    ('json', [一行一局的 JSON 文本, ...]) 由主进程按行读出后分批送来。
+    """
+    kind, payload = task
+    _worker.stats = stats = empty_stats()
+    for item in ([payload] if kind == 'xml' else payload):
+        try:
+            if kind == 'xml':
+                with _open(item) as f:
+                    _worker.feed(iter_mjlog_events(f))
+            else:
+                _worker.feed(iter_tenhou_json_events(json.loads(item)))
+        except Exception:
+            stats['errors'] += 1  # 单个牌谱损坏不影响其余牌谱
+    return stats
+
+
+def iter_tasks(paths: Iterable[str], batch: int = 16) -> Iterator[Tuple[str, object]]:
+    """
+    遍历文件/目录，按需产出任务 (惰性，不会一次性列出整个归档)：
+    .json / .jsonl / .ndjson (可带 .gz) 按行读取，每行一局 tenhou.net/6 JSON；其余文件视为 mjlog XML。
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, dirs, files in os.walk(path):
+                dirs.sort()
+                yield from iter_tasks((os.path.join(directory, f) for f in sorted(files)), batch)
+            continue
+        name = path[:-3] if path.endswith('.gz') else path
+        if not name.endswith(('.json', '.jsonl', '.ndjson')):
+            yield 'xml', path
+            continue
+        with _open(path) as f:
+            lines = []
+            for line in f:
+                line = line.strip()
+                if not line: continue
+                lines.append(line)
+                if len(lines) >= batch:
+                    yield 'json', lines
+                    lines = []
+            if lines: yield 'json', lines
+
+
+def merge_stats(total: Dict, part: Dict) -> Dict:
+    for k, v in part.items():
+        total[k] = total.get(k, 0) + v
+    return total
+
+
+def run_analysis(paths: List[str], processes: int = 1, search_depth: Optional[int] = None,
+                 budget: float = 0.0) -> Dict:
+    """
+    并行分析牌谱归档。进程池中同时在途的任务数不超过 processes * 4，
+    主进程只保存统计计数，整体内存与归档大小无关。
+    """
+    total = empty_stats()
+    started = time.perf_counter()
+    if processes <= 1:
+        _init_worker(search_depth, budget)
+        for task in iter_tasks(paths):
+            merge_stats(total, analyze_task(task))
+    else:
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(search_depth, budget)) as pool:
+            pending = set()
+            for task in iter_tasks(paths):
+                if len(pending) >= processes * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done: merge_stats(total, future.result())
+                pending.add(pool.submit(analyze_task, task))
+            for future in pending: merge_stats(total, future.result())
+    total['wall_time'] = time.perf_counter() - started
+    return summarize(total)
+
+
+def summarize(stats: Dict) -> Dict:
+    decisions = stats['decisions']
+    kept = decisions - stats['retreats']
+    return dict(
+        stats,
+        agree_rate=stats['agree'] / decisions if decisions else 0.0,
+        agree_top3_rate=stats['agree_top3'] / decisions if decisions else 0.0,
+        avg_ukeire_loss=stats['ukeire_loss'] / kept if kept else 0.0,
+        retreat_rate=stats['retreats'] / decisions if decisions else 0.0,
+        decisions_per_sec=decisions / stats['wall_time'] if stats['wall_time'] else 0.0
+    )
+
+
+def print_summary(summary: Dict):
+    print("=" * 50)
+    print(f"牌谱: {summary['games']} 场 / {summary['rounds']} 局  用时: {summary['wall_time']:.1f}s  "
+          f"(解析失败 {summary['errors']})")
+    print(f"决策次数: {summary['decisions']}  ({summary['decisions_per_sec']:.0f} 次/秒)")
+    print(f"一致率: {summary['agree_rate']:.1%}  (前三: {summary['agree_top3_rate']:.1%})")
+    print(f"平均进张损失 (不含退向听): {summary['avg_ukeire_loss']:.2f} 枚")
+    print(f"退向听率: {summary['retreat_rate']:.1%}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="天凤牌谱 (mjlog XML / tenhou.net/6 JSON) 批量回放分析")
+    parser.add_argument("paths", nargs='+', help="牌谱文件或目录 (支持 gzip)")
+    parser.add_argument("--processes", type=int, default=1, help="并行进程数")
+    parser.add_argument("--search-depth", type=int, help="前瞻搜索深度 (默认取 MAHJONG_SEARCH_DEPTH)")
+    parser.add_argument("--budget-ms", type=float, default=0, help="每次决策的时间预算 (毫秒)，0 表示不限")
+    parser.add_argument("--save", help="把汇总结果保存为 JSON")
+    args = parser.parse_args()
+
+    summary = run_analysis(args.paths, args.processes, args.search_depth, args.budget_ms / 1000.0)
+    print_summary(summary)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
@@ -1,17 +1,87 @@
-from flask import Flask, request, jsonify, render_template
-from models import GameState
+from flask import Flask, request, jsonify, render_template, stream_with_context, g
+from models import GameState, Meld
+from defense import DefenseTracker, defensive_order
 from engine import RuleEngine
-from utils import id_to_str
+from utils import PACKED_SIZE, decode_hands, id_to_str, parse_tiles_bulk, tile_ids_from_packed
 from match_engine import MatchManager
-from typing import Optional
+from cache import create_cache, decision_key
+from executor import EngineExecutor, EvaluatorUnavailable
+from match_registry import MatchRegistry, MatchNotFound, MatchLimitReached, MatchBusy
+from match_ai import check_ron, handle_ai_melds, get_human_actions, advance_ai_turn, resolve_discard, is_ai_turn, \
+    is_furiten
+from metrics import registry, cache_collector, SamplingProfiler, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_TOTAL
+from symmetry import IDENTITY, canonical_perm, invert, may_be_all_green, permute
+import json
+import os
+import time
 import traceback
-import random  # 用于模拟 AI 的随机鸣牌决策
+from typing import Optional
 
 app = Flask(__name__)
 engine = RuleEngine()
+# 可选的进程池评估后端 (MAHJONG_EVAL_PROCESSES=0 时在请求线程内直接计算)
+evaluator = EngineExecutor.from_env(engine)
+
+# 战术面甲会反复提交相同局面，缓存已经序列化好的推荐结果
+# MAHJONG_DECISION_CACHE: memory (默认) / sqlite:/path/to/cache.db (多 worker 共享) / off
+decision_cache = create_cache(
+    os.environ.get('MAHJONG_DECISION_CACHE', 'memory'),
+    maxsize=int(os.environ.get('MAHJONG_DECISION_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('MAHJONG_DECISION_CACHE_TTL', 600))
+)
+
+# 多对局注册表 (MAHJONG_MATCH_STORE: memory / sqlite:/path/to/matches.db)
+matches = MatchRegistry.from_env()
+
+# 运行指标 (MAHJONG_METRICS=0 关闭) 与按比例采样的 cProfile (MAHJONG_PROFILE_SAMPLE=N，每 N 个请求采样一次)
+profiler = SamplingProfiler.from_env()
+registry.add_collector(cache_collector({"score": engine.score_cache, "ukeire": engine.ukeire_cache,
+                                        "mask": engine.mask_cache, "decision": decision_cache}))
+
+
+def _runtime_gauges():
+    return [
+        ('mahjong_eval_pending', 'Evaluations queued or running in the process pool', 'gauge', [({}, evaluator.pending)]),
+        ('mahjong_eval_rejected_total', 'Evaluations rejected because the pool queue was full', 'counter',
+         [({}, evaluator.rejected)]),
+        ('mahjong_eval_timeouts_total', 'Evaluations that exceeded MAHJONG_EVAL_TIMEOUT', 'counter',
+         [({}, evaluator.timeouts)]),
+        ('mahjong_active_matches', 'Matches currently held by the registry', 'gauge', [({}, matches.store.count())]),
+    ]
+
+
+registry.add_collector(_runtime_gauges)
+
+
+@app.before_request
+def _start_request_metrics():
+    if registry.enabled:
+        g.metrics_started = time.perf_counter()
+    g.profiler = profiler.maybe_start()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe((route,), time.perf_counter() - started)
+        HTTP_REQUESTS_TOTAL.inc((route, str(response.status_code)))
+    return response
+
+
+@app.teardown_request
+def _finish_request_profile(exc):
+    active = g.pop('profiler', None)
+    if active is not None:
+        profiler.finish(active, request.path)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 文本格式的运行指标"""
+    return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
 
-# 全局变量存储当前对局
-active_match: Optional[MatchManager] = None
 
 # 强制使用文本变体 \uFE0E 防止浏览器将“中”等字符渲染成立体 Emoji
 UNICODE_TILES = [
@@ -32,216 +102,507 @@ def match_page():
     return render_template('match.html')
 
 
+# 战术面甲展示的推荐条数 (引擎只完整计算这么多打法)
+RECOMMENDATION_COUNT = 5
+
+
+def _render_recommendations(result: dict, perm, danger=None) -> str:
+    """
+    把规范坐标下的推荐结果翻回真实牌 ID (perm 见 symmetry.canonical_perm)，补上牌名/字符后序列化。
+    danger 为各牌的放铳危险度 (defense.DefenseTracker.danger)，不随决策缓存，按请求附加并参与重排。
+    """
+    recommendations = []
+    for rec in result['recommendations']:
+        tile = perm[rec['discard_id']]
+        recommendations.append(dict(
+            rec, discard_id=tile, discard_name=id_to_str(tile), discard_char=UNICODE_TILES[tile],
+            details=[{"name": id_to_str(t), "char": UNICODE_TILES[t], "left": left}
+                     for t, left in sorted((perm[t], left) for t, left in rec['details'])]))
+    if danger is not None:
+        for rec in recommendations:
+            rec["danger"] = round(float(danger[rec['discard_id']]), 3)
+        recommendations = defensive_order(recommendations, danger, tile_key='discard_id', group_key='is_retreat')
+    return json.dumps(dict(result, recommendations=recommendations))
+
+
+def _tile_ids(value) -> list:
+    """牌 ID 列表，或 26 位十六进制的紧凑编码 (utils.pack_hand_bytes)"""
+    return tile_ids_from_packed(value) if isinstance(value, str) else value
+
+
+def build_recommendation_payload(data: dict) -> str:
+    """
+    根据前端提交的局面计算推荐打法，返回序列化好的 JSON。
+    决策缓存以三门数牌互换后的规范形为键 (字牌与风位/役牌/宝牌相关，保持原位；可能成绿一色时不互换)，
+    引擎在规范坐标下计算，缓存内容也使用规范坐标下的牌 ID，命中后再翻回当前局面的真实牌 ID。
+    """
+    hand_ids = _tile_ids(data.get('hand', []))
+    dead_ids = _tile_ids(data.get('dead', []))
+    melds_data = data.get('melds', [])
+    dora_indicators = data.get('dora', [])
+    require_yaku = data.get('require_yaku', True)
+    round_wind = data.get('round_wind', 27)
+    player_wind = data.get('player_wind', 28)
+    own_discards = data.get('discards', [])  # 可选：自己的牌河 (已计入 dead)，用于振听判定
+    opponents = data.get('opponents', [])  # 可选：下家/对家/上家的 {"discards", "riichi", "melds"}，用于危险度
+    budget_ms = data.get('budget_ms')  # 可选：计算时间预算 (毫秒)，到点返回已得到的最好排序
+    deadline = time.monotonic() + float(budget_ms) / 1000.0 if budget_ms else None
+
+    game = GameState()
+    my_player = game.players[0]
+    my_player.discards = list(own_discards)
+
+    for t_id in hand_ids:
+        my_player.add_tile_to_hand(t_id)
+        game.record_visible_tile(t_id, count=1)
+    for t_id in dead_ids:
+        game.record_visible_tile(t_id, count=1)
+    for m in melds_data:
+        game.record_visible_tile(m['tile'], count=4 if m['type'] == 'kan' else 3)
+    for t_id in dora_indicators:
+        game.record_visible_tile(t_id, count=1)
+    for player, opp in zip(game.players[1:], opponents):
+        # 对手的牌河与副露已由前端计入 dead，这里只记录现物/立直/副露数
+        player.discards = list(opp.get('discards', []))
+        player.is_riichi = bool(opp.get('riichi', False))
+        player.melds = [Meld(m['type'], [m['tile']]) for m in opp.get('melds', [])]
+    danger = DefenseTracker.from_game_state(game).danger(0) if opponents else None
+
+    # 引擎直接在规范坐标下计算：候选顺序与同分时的先后只取决于规范形，命中缓存与重新计算的结果一致。
+    # 还可能凑成绿一色时交换花色会改变打点 (前瞻从一次打牌到和牌最多再打 search_depth 张)，保持真实坐标
+    canonical = not may_be_all_green(my_player.hand, [m['tile'] for m in melds_data], engine.search_depth + 1)
+    perm = canonical_perm(my_player.hand, game.visible_tiles, honors=False) if canonical else IDENTITY
+    inv = invert(perm)
+    hand = permute(my_player.hand, perm)
+    visible = permute(game.visible_tiles, perm)
+    melds = [dict(m, tile=inv[m['tile']]) for m in melds_data]
+    dora = [inv[t // 4 if t > 33 else t] for t in dora_indicators if 0 <= t < 136]
+    cache_key = decision_key(hand, visible, melds, dora, round_wind, player_wind, require_yaku,
+                             [inv[t] for t in own_discards if 0 <= t < 34], canonical)
+    cached = decision_cache.get(cache_key)
+    if cached is not None:
+        return _render_recommendations(json.loads(cached), perm, danger)
+
+    current_shanten, recommendations = evaluator.recommend_discards(
+        hand=hand, visible_tiles=visible, melds_data=melds, dora_indicators=dora, require_yaku=require_yaku,
+        round_wind=round_wind, player_wind=player_wind, deadline=deadline, top_k=RECOMMENDATION_COUNT
+    )
+    # 调用方时间预算或前瞻搜索的节点预算内没算完 (truncated) 的结果不写入决策缓存
+    partial = any(rec.get('truncated') or ('ev' in rec and rec['ev'] is None) for rec in recommendations)
+
+    response_data = {"shanten": current_shanten, "partial": partial, "recommendations": []}
+
+    for rec in recommendations:
+        details = [[d['tile'], d['left_count']] for d in rec['details']]
+        # 打完即听牌的选项：用和了牌 (含已无剩余的) 与牌河判断是否振听 (牌河是真实牌 ID)
+        furiten = None
+        if rec.get('shanten_after_discard') == 0:
+            tile = perm[rec['discard_tile']]
+            after = list(my_player.hand)
+            after[tile] -= 1
+            furiten = my_player.update_furiten(engine.get_waits(after), tile)
+        response_data["recommendations"].append({
+            "discard_id": rec['discard_tile'], "total_ukeire": rec['total_ukeire'],
+            "ev": rec.get('ev', None), "err": rec.get('err', None),
+            "is_retreat": rec.get('shanten_after_discard', 0) > current_shanten, "furiten": furiten,
+            "details": details
+        })
+
+    if not partial: decision_cache.put(cache_key, json.dumps(response_data))
+    return _render_recommendations(response_data, perm, danger)
+
+
 @app.route('/api/evaluate_state', methods=['POST'])
 def evaluate_state():
     try:
-        data = request.json
-        hand_ids = data.get('hand', [])
-        dead_ids = data.get('dead', [])
-        melds_data = data.get('melds', [])
-        dora_indicators = data.get('dora', [])
-        require_yaku = data.get('require_yaku', True)
-        round_wind = data.get('round_wind', 27)
-        player_wind = data.get('player_wind', 28)
-
-        game = GameState()
-        my_player = game.players[0]
-
-        for t_id in hand_ids:
-            my_player.add_tile_to_hand(t_id)
-            game.record_visible_tile(t_id, count=1)
-        for t_id in dead_ids:
-            game.record_visible_tile(t_id, count=1)
-        for m in melds_data:
-            game.record_visible_tile(m['tile'], count=4 if m['type'] == 'kan' else 3)
-        for t_id in dora_indicators:
-            game.record_visible_tile(t_id, count=1)
-
-        current_shanten = engine.get_shanten(my_player.hand)
-        recommendations = []
-
-        if current_shanten == -1:
-            pass
-        elif current_shanten == 0:
-            recommendations = engine.evaluate_ev_efficiency(
-                hand=my_player.hand, visible_tiles=game.visible_tiles, current_shanten=current_shanten,
-                melds_data=melds_data, dora_indicators=dora_indicators, require_yaku=require_yaku,
-                round_wind=round_wind, player_wind=player_wind
-            )
-        else:
-            _, recommendations = engine.evaluate_pure_efficiency(
-                hand=my_player.hand, visible_tiles=game.visible_tiles, dora_indicators=dora_indicators
-            )
-
-        response_data = {"shanten": current_shanten, "recommendations": []}
-
-        for rec in recommendations[:5]:
-            details = [{"name": id_to_str(d['tile']), "char": UNICODE_TILES[d['tile']], "left": d['left_count']} for d
-                       in rec['details']]
-            response_data["recommendations"].append({
-                "discard_id": rec['discard_tile'], "discard_name": id_to_str(rec['discard_tile']),
-                "discard_char": UNICODE_TILES[rec['discard_tile']], "total_ukeire": rec['total_ukeire'],
-                "ev": rec.get('ev', None), "err": rec.get('err', None),
-                "is_retreat": rec.get('shanten_after_discard', 0) > current_shanten, "details": details
-            })
-        return jsonify(response_data)
+        return app.response_class(build_recommendation_payload(request.json), mimetype='application/json')
+    except EvaluatorUnavailable as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+# 二进制/天凤字符串格式的批量请求每次整体解码的局面数
+BATCH_CHUNK = 256
+
+
+def _read_chunk(size: int) -> bytes:
+    """从请求流读满 size 字节 (流结束时可能更短)"""
+    parts, remaining = [], size
+    while remaining:
+        part = request.stream.read(remaining)
+        if not part: break
+        parts.append(part)
+        remaining -= len(part)
+    return b''.join(parts)
+
+
+def _count_ids(counts) -> list:
+    return [t for t in range(34) for _ in range(int(counts[t]))]
+
+
+def _iter_batch_states():
+    """
+    逐条读取批量请求中的局面：
+    - application/x-ndjson：按行从请求流中增量读取 (不整体载入内存)，每行一个局面对象
+    - application/octet-stream：每条记录为手牌与可见牌 (牌河/副露/宝牌指示牌) 各 13 字节的紧凑编码
+      (utils.pack_hand_bytes)，按 BATCH_CHUNK 条一批用 decode_hands 整体解码
+    - text/plain：每行一个天凤格式的手牌字符串，按 BATCH_CHUNK 行一批用 parse_tiles_bulk 整体解析
+    - 其余：请求体为局面对象组成的 JSON 数组
+    """
+    if request.mimetype == 'application/x-ndjson':
+        for line in iter(request.stream.readline, b''):
+            line = line.strip()
+            if line: yield line
+    elif request.mimetype == 'application/octet-stream':
+        record = PACKED_SIZE * 2
+        while True:
+            chunk = _read_chunk(record * BATCH_CHUNK)
+            whole = len(chunk) - len(chunk) % record
+            for hand, dead in decode_hands(chunk[:whole]).reshape(-1, 2, 34):
+                yield {'hand': _count_ids(hand), 'dead': _count_ids(dead)}
+            if whole < len(chunk): raise ValueError(f"二进制批量请求的长度应为 {record} 字节的整数倍")
+            if len(chunk) < record * BATCH_CHUNK: return
+    elif request.mimetype == 'text/plain':
+        lines = []
+        for line in iter(request.stream.readline, b''):
+            line = line.strip()
+            if line: lines.append(line.decode('ascii'))
+            if len(lines) == BATCH_CHUNK:
+                for hand in parse_tiles_bulk(lines): yield {'hand': _count_ids(hand)}
+                lines = []
+        for hand in parse_tiles_bulk(lines): yield {'hand': _count_ids(hand)}
+    else:
+        yield from request.get_json() or []
+
+
+@app.route('/api/evaluate_batch', methods=['POST'])
+def evaluate_batch():
+    """
+    批量评估：每算完一个局面就以 NDJSON 的形式流式返回一行 {"index", "result"} 或 {"index", "error"}。
+    请求体的几种格式见 _iter_batch_states
+    """
+
+    def generate():
+        try:
+            for index, item in enumerate(_iter_batch_states()):
+                try:
+                    data = json.loads(item) if isinstance(item, (bytes, str)) else item
+                    payload = build_recommendation_payload(data)
+                    yield '{"index": %d, "result": %s}\n' % (index, payload)
+                except Exception as e:
+                    yield json.dumps({"index": index, "error": str(e)}) + '\n'
+        except ValueError as e:
+            # 请求体本身格式错误 (如二进制记录不完整)：已读出的局面照常返回，最后附一行不带 index 的错误
+            yield json.dumps({"error": str(e)}) + '\n'
+
+    return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 # =====================================================================
 # 沙盒模拟对战核心逻辑 (Match Logic)
 # =====================================================================
 
-def check_ron(discarder_index, discard_tile_34):
-    """全场截胡检查 (优先级 1)"""
-    if not active_match: return False
-    for offset in range(1, 4):
-        p_idx = (discarder_index + offset) % 4
-        hand_34 = active_match.get_hand_34(p_idx)
-        hand_34[discard_tile_34] += 1
-        if engine.get_shanten(hand_34) == -1:
-            active_match.is_game_over = True
-            active_match.winner = p_idx
-            discarded_136 = active_match.players[discarder_index]["discards_136"].pop()
-            active_match.players[p_idx]["hand_136"].append(discarded_136)
-            return True
-        hand_34[discard_tile_34] -= 1
-    return False
-
-
-def handle_ai_melds(discarder_index, tile_34):
-    """【核心修复】AI 拦截鸣牌检查 (优先级 2)，防止战局卡死"""
-    if not active_match: return False
-    for i in range(1, 4):
-        if i == discarder_index: continue
-        can_kan = active_match.can_call_kan(i, tile_34)
-        can_pon = active_match.can_call_pon(i, tile_34)
-        # 简单概率模型：AI 有 30% 概率鸣牌以推进战局
-        if (can_kan or can_pon) and random.random() < 0.3:
-            meld_type = 'kan' if can_kan else 'pon'
-            active_match.perform_meld(i, tile_34, meld_type, discarder_index)
-            return True
-    return False
-
-
-def get_human_actions(discarder_index, tile_34):
-    """检查人类玩家 (P0) 的拦截动作"""
-    if not active_match or discarder_index == 0: return []
-    actions = []
-    if active_match.can_call_kan(0, tile_34): actions.append({"type": "kan", "tile": tile_34})
-    if active_match.can_call_pon(0, tile_34): actions.append({"type": "pon", "tile": tile_34})
-    return actions
+def _request_match_id():
+    """对局 ID：GET 请求取自 query string，POST 请求取自 JSON body"""
+    if request.method == 'GET':
+        return request.args.get('match_id')
+    return (request.get_json(silent=True) or {}).get('match_id')
 
 
-@app.route('/api/match/start', methods=['POST'])
-def start_match():
-    global active_match
-    active_match = MatchManager()
-    return jsonify(get_match_state())
+@app.errorhandler(MatchNotFound)
+def handle_match_not_found(e):
+    return jsonify({"error": "No match"}), 404
 
 
-@app.route('/api/match/state', methods=['GET'])
-def match_state():
-    if not active_match: return jsonify({"error": "No match"}), 400
-    return jsonify(get_match_state())
+@app.errorhandler(MatchLimitReached)
+def handle_match_limit(e):
+    return jsonify({"error": str(e)}), 503
 
 
-@app.route('/api/match/player_discard', methods=['POST'])
-def match_player_discard():
-    global active_match
-    data = request.json
-    discard_tile_34 = data.get('discard_tile')
-    active_match.player_discard(0, discard_tile_34)
+@app.errorhandler(MatchBusy)
+def handle_match_busy(e):
+    return jsonify({"error": str(e)}), 409
 
-    if check_ron(0, discard_tile_34): return jsonify(get_match_state())
-    if handle_ai_melds(0, discard_tile_34): return jsonify(get_match_state())
-    return jsonify(get_match_state())
 
+@app.route('/api/match/start', methods=['POST'])
+def start_match():
+    match_id, match = matches.create()
+    return jsonify(get_match_state(match, match_id))
 
-@app.route('/api/match/ai_turn', methods=['POST'])
-def match_ai_turn():
-    global active_match
-    if not active_match or active_match.current_turn == 0:
-        return jsonify({"error": "Human turn"}), 400
 
-    ai_idx = active_match.current_turn
-    if active_match.is_game_over: return jsonify(get_match_state())
+@app.route('/api/match/state', methods=['GET'])
+def match_state():
+    match_id = _request_match_id()
+    with matches.open(match_id) as match:
+        return jsonify(get_match_state(match, match_id))
 
-    # 【修复点】判定是否需要摸牌：鸣牌后手牌为 14 张，不摸牌直接出牌
-    hand_count = sum(active_match.get_hand_34(ai_idx))
-    if hand_count == 13:
-        if not active_match.player_draw(ai_idx): return jsonify(get_match_state())
 
-    hand_34 = active_match.get_hand_34(ai_idx)
-    shanten = engine.get_shanten(hand_34)
+def _discard_error(match: MatchManager, tile_34) -> Optional[str]:
+    """人类现在不能打出 tile_34 的原因 (可以打出时为 None)"""
+    if match.is_game_over: return "Game over"
+    if match.pending_call: return "Call pending"
+    if match.current_turn != 0 or match.hand_count(0) % 3 != 2: return "Not human turn"
+    if not isinstance(tile_34, int) or not 0 <= tile_34 < 34 or match.players[0].counts[tile_34] == 0:
+        return "Tile not in hand"
+    return None
 
-    if shanten == -1:
-        active_match.is_game_over, active_match.winner = True, ai_idx
-        return jsonify(get_match_state())
 
-    dora_34 = [t // 4 for t in active_match.dora_indicators]
+def _meld_error(match: MatchManager, tile_34, meld_type, discarder) -> Optional[str]:
+    """人类现在不能鸣 discarder 打出的 tile_34 的原因 (可以鸣牌时为 None)"""
+    if match.is_game_over: return "Game over"
+    if match.pending_call is None or match.pending_call != (discarder, tile_34): return "No such call pending"
+    if meld_type == 'pon' and match.can_call_pon(0, tile_34): return None
+    if meld_type == 'kan' and match.can_call_kan(0, tile_34): return None
+    return "Invalid meld"
 
-    # AI 决策
-    visible = active_match.dead_tiles_34
-    if shanten == 0:
-        # 传入格式化后的 dora_34
-        recs = engine.evaluate_ev_efficiency(hand_34, visible, shanten, active_match.players[ai_idx]["melds"], dora_34)
-    else:
-        # 传入格式化后的 dora_34
-        _, recs = engine.evaluate_pure_efficiency(hand_34, visible, dora_34)
 
-    best_tile = recs[0]['discard_tile'] if recs else active_match.players[ai_idx]["hand_136"][-1] // 4
-    active_match.player_discard(ai_idx, best_tile)
+@app.route('/api/match/player_discard', methods=['POST'])
+def match_player_discard():
+    """人类出牌；advance 为 true 时在同一个请求里把 AI 回合推进到下一个人类决策点"""
+    data = request.json
+    match_id = data.get('match_id')
+    discard_tile_34 = data.get('discard_tile')
+    with matches.open(match_id) as match:
+        error = _discard_error(match, discard_tile_34)
+        if error: return jsonify({"error": error}), 409
+        since = match.seq
+        match.player_discard(0, discard_tile_34)
+
+        if not check_ron(engine, match, 0, discard_tile_34):
+            handle_ai_melds(match, 0, discard_tile_34)
+        if data.get('advance'): return jsonify(advance_to_human(match, match_id, since))
+        return jsonify(get_match_state(match, match_id))
+
+
+def advance_to_human(match: MatchManager, match_id: str, since: int) -> dict:
+    """
+    连续推进 AI 回合 (摸打、荣和检查、AI 鸣牌)，直到轮到人类、人类可以鸣牌或对局结束。
+    返回最新局面，并附带 since 之后按序发生的全部事件；评估后端不可用时停在当前位置并附带 error。
+    """
+    error = None
+    try:
+        while is_ai_turn(match):
+            advance_ai_turn(evaluator, engine, match)
+    except EvaluatorUnavailable as e:
+        error = str(e)
+    state = get_match_state(match, match_id)
+    state["events"] = [serialize_event(match, seq) for seq in range(since + 1, match.seq + 1)]
+    if error: state["error"] = error
+    return state
 
-    # 拦截扫描流程
-    if check_ron(ai_idx, best_tile): return jsonify(get_match_state())
 
-    actions = get_human_actions(ai_idx, best_tile)
-    if actions:
-        state = get_match_state()
-        state.update({"available_actions": actions, "last_discarder": ai_idx, "last_tile": best_tile})
-        return jsonify(state)
+@app.route('/api/match/advance', methods=['POST'])
+def match_advance():
+    """把 AI 回合一次推进到下一个人类决策点 (也用于评估后端繁忙后的重试)"""
+    match_id = _request_match_id()
+    since = int((request.get_json(silent=True) or {}).get('since', 0))
+    with matches.open(match_id) as match:
+        return jsonify(advance_to_human(match, match_id, min(since, match.seq)))
 
-    if handle_ai_melds(ai_idx, best_tile): return jsonify(get_match_state())
 
-    if active_match.current_turn == 0 and not active_match.is_game_over:
-        active_match.player_draw(0)
-    return jsonify(get_match_state())
+@app.route('/api/match/ai_turn', methods=['POST'])
+def match_ai_turn():
+    match_id = _request_match_id()
+    with matches.open(match_id) as match:
+        # 兼容旧前端：人类放弃鸣牌后直接请求下一个 AI 回合
+        if match.pending_call:
+            resolve_discard(match, *match.pass_call())
+            return jsonify(get_match_state(match, match_id))
+        if match.current_turn == 0:
+            return jsonify({"error": "Human turn"}), 400
+        if match.is_game_over: return jsonify(get_match_state(match, match_id))
+
+        try:
+            advance_ai_turn(evaluator, engine, match)
+        except EvaluatorUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+        return jsonify(get_match_state(match, match_id))
 
 
 @app.route('/api/match/call_meld', methods=['POST'])
 def match_call_meld():
     data = request.json
-    active_match.perform_meld(0, data['tile'], data['type'], data['discarder'])
-    return jsonify(get_match_state())
-
-
-def get_match_state():
-    if not active_match: return {}
+    match_id = data.get('match_id')
+    with matches.open(match_id) as match:
+        error = _meld_error(match, data.get('tile'), data.get('type'), data.get('discarder'))
+        if error: return jsonify({"error": error}), 409
+        match.perform_meld(0, data['tile'], data['type'], data['discarder'])
+        # 杠后手里是 3n+1 张，摸岭上牌补回 3n+2 张再出牌 (AI 杠后由 ai_take_turn 补摸)
+        if data['type'] == 'kan': match.player_draw(0)
+        return jsonify(get_match_state(match, match_id))
+
+
+@app.route('/api/match/pass', methods=['POST'])
+def match_pass():
+    """人类放弃鸣牌，对局继续 (之后的 AI 回合由事件流推进，或 advance 为 true 时当场推进)"""
+    data = request.get_json(silent=True) or {}
+    match_id = data.get('match_id')
+    with matches.open(match_id) as match:
+        since = match.seq
+        pending = match.pass_call()
+        if pending: resolve_discard(match, *pending)
+        if data.get('advance'): return jsonify(advance_to_human(match, match_id, since))
+        return jsonify(get_match_state(match, match_id))
+
+
+def serialize_event(match: MatchManager, seq: int, viewer: int = 0) -> dict:
+    """把第 seq 号事件转为前端增量；其它座位摸到的牌对 viewer 隐藏，终局事件附带四家手牌"""
+    kind, seat, tile, extra = match.events[seq - 1]
+    event = {"seq": seq, "type": kind, "seat": seat}
+    if kind == 'draw':
+        if seat == viewer: event["tile"] = tile // 4
+    elif kind in ('discard', 'dora'):
+        event["tile"] = tile // 4
+    elif kind in ('pon', 'kan'):
+        event.update({"type": "meld", "meld": kind, "tile": tile, "from": extra})
+    elif kind in ('prompt', 'pass'):
+        event.update({"tile": tile, "from": extra})
+        # 只有仍在等待选择时才附带可用动作
+        if kind == 'prompt' and match.pending_call == (extra, tile) and seq == match.seq:
+            event["actions"] = get_human_actions(match, extra, tile)
+    elif kind == 'ron':
+        event.update({"tile": tile // 4, "from": extra})
+
+    if kind in ('ron', 'tsumo', 'ryuukyoku'):
+        event["winner"] = match.winner
+        event["hands"] = [_expand_hand(match, i) for i in range(4)]
+    return event
+
+
+def _expand_hand(match: MatchManager, player_index: int) -> list:
+    counts = match.players[player_index].counts
+    return [t for t in range(34) for _ in range(counts[t])]
+
+
+# 事件流：空闲时每隔 STREAM_POLL_INTERVAL 秒检查一次对局，STREAM_KEEPALIVE 秒发一次心跳
+STREAM_POLL_INTERVAL = 0.25
+STREAM_KEEPALIVE = 15.0
+
+
+def _pull_events(match_id: str, since: int):
+    """
+    取出 since 之后的事件；轮到 AI 时先在服务端推进一个 AI 回合。
+    返回 (事件列表, 最新序号, 对局是否结束, 是否还轮到 AI)
+    """
+
+    def collect(match):
+        events = [serialize_event(match, seq) for seq in range(since + 1, match.seq + 1)]
+        return events, match.seq, match.is_game_over, is_ai_turn(match)
+
+    # 先只读地看一眼，空闲时不必写回存储
+    with matches.open(match_id, save=False) as match:
+        if not is_ai_turn(match): return collect(match)
+    with matches.open(match_id) as match:
+        if is_ai_turn(match): advance_ai_turn(evaluator, engine, match)
+        return collect(match)
+
+
+def _since_param() -> int:
+    # EventSource 断线重连时会带上 Last-Event-ID
+    return int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+
+
+@app.route('/api/match/stream', methods=['GET'])
+def match_stream():
+    """
+    SSE 事件流：按序推送对局增量 (每条 data 为一个事件，id 为事件序号)，
+    轮到 AI 时由服务端连续推进，前端无需逐个请求 ai_turn。对局结束后关闭。
+    """
+    match_id = _request_match_id()
+    since = _since_param()
+    with matches.open(match_id, save=False):
+        pass
+
+    def generate():
+        last, idle = since, 0.0
+        while True:
+            try:
+                events, last, over, ai_turn = _pull_events(match_id, last)
+            except (EvaluatorUnavailable, MatchBusy) as e:
+                yield 'event: error\ndata: %s\n\n' % json.dumps({"error": str(e)})
+                time.sleep(STREAM_POLL_INTERVAL)
+                continue
+            except MatchNotFound:
+                yield 'event: error\ndata: {"error": "No match"}\n\n'
+                return
+
+            for event in events:
+                yield 'id: %d\ndata: %s\n\n' % (event["seq"], json.dumps(event))
+            if over: return
+            if events or ai_turn:
+                idle = 0.0
+                continue
+            time.sleep(STREAM_POLL_INTERVAL)
+            idle += STREAM_POLL_INTERVAL
+            if idle >= STREAM_KEEPALIVE:
+                yield ': keepalive\n\n'
+                idle = 0.0
+
+    return app.response_class(stream_with_context(generate()), mimetype='text/event-stream',
+                              headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/api/match/events', methods=['GET'])
+def match_events():
+    """长轮询版事件流 (不支持 SSE 的环境)：最多等待 wait 秒，返回 since 之后的事件"""
+    match_id = _request_match_id()
+    since = _since_param()
+    deadline = time.monotonic() + min(float(request.args.get('wait', 20)), 60.0)
+    while True:
+        try:
+            events, seq, over, ai_turn = _pull_events(match_id, since)
+        except EvaluatorUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+        if events or over or time.monotonic() >= deadline:
+            return jsonify({"events": events, "seq": seq, "is_game_over": over})
+        if not ai_turn: time.sleep(STREAM_POLL_INTERVAL)
+
+
+@app.route('/api/match/snapshot', methods=['GET'])
+def match_snapshot():
+    """重新同步：返回序号 seq 时的完整局面 (缺省为最新)，前端检测到事件缺号时调用"""
+    match_id = _request_match_id()
+    seq = request.args.get('seq')
+    with matches.open(match_id, save=False) as match:
+        try:
+            snapshot = match.snapshot(int(seq)) if seq is not None else match
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(get_match_state(snapshot, match_id))
+
+
+def get_match_state(match: MatchManager, match_id: str):
     state = {
-        "current_turn": active_match.current_turn,
-        "wall_remaining": len(active_match.wall),
-        "dora_indicators": [t // 4 for t in active_match.dora_indicators],
-        "is_game_over": active_match.is_game_over,
-        "winner": active_match.winner,
+        "match_id": match_id,
+        "seq": match.seq,
+        "current_turn": match.current_turn,
+        "wall_remaining": len(match.wall),
+        "dora_indicators": [t // 4 for t in match.dora_indicators],
+        "is_game_over": match.is_game_over,
+        "winner": match.winner,
         "players": []
     }
     for i in range(4):
-        h34 = active_match.get_hand_34(i)
+        seat = match.players[i]
         p_data = {
-            "index": i, "discards": active_match.get_discards_34(i),
-            "melds": active_match.players[i]["melds"], "hand_count": sum(h34)
+            "index": i, "discards": match.get_discards_34(i),
+            "melds": seat.melds, "hand_count": seat.tile_count
         }
-        if i == 0 or active_match.is_game_over:
-            p_data["hand"] = [t for t in range(34) for _ in range(h34[t])]
+        if i == 0 or match.is_game_over:
+            p_data["hand"] = _expand_hand(match, i)
+        if i == 0:
+            p_data["is_furiten"] = is_furiten(engine, match, 0)
         state["players"].append(p_data)
+    if match.pending_call:
+        discarder, tile = match.pending_call
+        state.update({"available_actions": get_human_actions(match, discarder, tile),
+                      "last_discarder": discarder, "last_tile": tile})
     return state
 
 
 if __name__ == '__main__':
     # 生产环境通常由 gunicorn 启动，但保留此逻辑方便本地调试
-    import os
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,216 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from engine import RuleEngine
+from utils import parse_tiles, hand_array_to_tenhou_str
+
+# 语料分桶：向听数 -1 (和牌形) ~ 3，以及门清/副露
+SHANTEN_BUCKETS = (-1, 0, 1, 2, 3)
+MAX_MELDS = 2
+
+
+def _random_complete_hand(rng: random.Random) -> Tuple[List[int], List[Tuple[str, int]]]:
+    """随机拼一副 4 面子 + 1 雀头的和牌形，返回 (34 计数手牌, 面子列表)"""
+    while True:
+        hand = [0] * 34
+        groups = []
+        for _ in range(4):
+            if rng.random() < 0.6:
+                suit, start = rng.randrange(3), rng.randrange(7)
+                tiles = [suit * 9 + start + i for i in range(3)]
+                groups.append(('chi', tiles[0]))
+            else:
+                t = rng.randrange(34)
+                tiles = [t] * 3
+                groups.append(('pon', t))
+            for t in tiles: hand[t] += 1
+        hand[rng.randrange(34)] += 2
+        if max(hand) <= 4:
+            return hand, groups
+
+
+def generate_corpus(seed: int = 0, per_bucket: int = 20) -> Dict[str, List[Dict]]:
+    """
+    生成固定种子的基准语料。桶名形如 'closed/s1'、'open/s0'：
+    从和牌形出发随机替换若干张牌，再按实际向听数归桶；副露手把 1-2 个刻子转为碰。
+    """
+    rng = random.Random(seed)
+    corpus: Dict[str, List[Dict]] = {f"{kind}/s{s}": [] for kind in ('closed', 'open') for s in SHANTEN_BUCKETS}
+    engine = RuleEngine(score_cache_size=0)
+
+    attempts = 0
+    while any(len(cases) < per_bucket for cases in corpus.values()) and attempts < per_bucket * 2000:
+        attempts += 1
+        hand, groups = _random_complete_hand(rng)
+        melds = []
+        if rng.random() < 0.5:
+            for kind, t in groups:
+                if kind == 'pon' and len(melds) < MAX_MELDS and rng.random() < 0.8:
+                    hand[t] -= 3
+                    melds.append({'type': 'pon', 'tile': t})
+            if not melds: continue
+
+        # 随机换掉 n 张牌，越多向听数越高
+        for _ in range(rng.choice((0, 1, 1, 2, 2, 3, 3, 4, 5))):
+            out = rng.choice([t for t in range(34) if hand[t]])
+            into = rng.choice([t for t in range(34) if hand[t] < 4 and t != out])
+            hand[out] -= 1
+            hand[into] += 1
+
+        shanten = engine.get_shanten(hand)
+        key = f"{'open' if melds else 'closed'}/s{min(shanten, SHANTEN_BUCKETS[-1])}"
+        if len(corpus[key]) >= per_bucket: continue
+
+        visible = list(hand)
+        for m in melds: visible[m['tile']] = min(4, visible[m['tile']] + 3)
+        for _ in range(rng.randrange(0, 30)):
+            t = rng.randrange(34)
+            if visible[t] < 4: visible[t] += 1
+        dora = [rng.randrange(34)]
+        win_tile = rng.choice([t for t in range(34) if hand[t]])
+        corpus[key].append({
+            'hand': hand, 'melds': melds, 'visible': visible, 'dora': dora, 'win_tile': win_tile,
+            'shanten': shanten, 'tenhou': hand_array_to_tenhou_str(hand)
+        })
+    return corpus
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values: return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def measure(fn: Callable[[Dict], object], cases: List[Dict], rounds: int) -> Dict[str, float]:
+    """预热一轮后计时 rounds 轮，再单独跑一轮 tracemalloc 统计峰值内存"""
+    for case in cases: fn(case)
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for case in cases:
+            t0 = time.perf_counter_ns()
+            fn(case)
+            latencies.append((time.perf_counter_ns() - t0) / 1000.0)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for case in cases: fn(case)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "mean_us": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_us": _percentile(latencies, 0.50),
+        "p90_us": _percentile(latencies, 0.90),
+        "p99_us": _percentile(latencies, 0.99),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "peak_kb": peak / 1024.0
+    }
+
+
+def _targets(engine: RuleEngine) -> Dict[str, Tuple[Callable[[Dict], object], Callable[[str, Dict], bool]]]:
+    """基准目标：名称 -> (被测调用, 该用例是否适用)"""
+    return {
+        "get_shanten": (lambda c: engine.get_shanten(c['hand']), lambda bucket, c: True),
+        "evaluate_pure_efficiency": (
+            lambda c: engine.evaluate_pure_efficiency(c['hand'], c['visible'], c['dora']),
+            lambda bucket, c: c['shanten'] >= 1),
+        "evaluate_ev_efficiency": (
+            lambda c: engine.evaluate_ev_efficiency(c['hand'], c['visible'], 0, c['melds'], c['dora']),
+            lambda bucket, c: c['shanten'] == 0),
+        "calculate_exact_score": (
+            lambda c: engine.calculate_exact_score(c['hand'], c['win_tile'], is_riichi=not c['melds'],
+                                                   melds_data=c['melds'], dora_indicators=c['dora']),
+            lambda bucket, c: c['shanten'] == -1),
+        "parse_tiles": (lambda c: parse_tiles(c['tenhou']), lambda bucket, c: True),
+    }
+
+
+def run_benchmarks(seed: int = 0, per_bucket: int = 20, rounds: int = 3,
+                   only: Optional[List[str]] = None) -> Dict:
+    corpus = generate_corpus(seed, per_bucket)
+    # 关闭算分/牌效结构/掩码缓存，测的是真实计算开销而不是缓存命中
+    engine = RuleEngine(score_cache_size=0, ukeire_cache_size=0, mask_cache_size=0)
+
+    results = {}
+    for name, (fn, applies) in _targets(engine).items():
+        if only and name not in only: continue
+        for bucket, cases in corpus.items():
+            selected = [c for c in cases if applies(bucket, c)]
+            if not selected: continue
+            results[f"{name}[{bucket}]"] = measure(fn, selected, rounds)
+
+    return {
+        "meta": {
+            "seed": seed, "per_bucket": per_bucket, "rounds": rounds,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")
+        },
+        "results": results
+    }
+
+
+def compare(baseline: Dict, current: Dict, threshold: float, metric: str = "p50_us") -> List[str]:
+    """对比两次结果，返回 metric 变慢超过 threshold (比例) 的条目说明"""
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base or not base[metric]: continue
+        ratio = cur[metric] / base[metric] - 1.0
+        if ratio > threshold:
+            regressions.append(f"{name}: {metric} {base[metric]:.1f} -> {cur[metric]:.1f} us (+{ratio:.1%})")
+    return regressions
+
+
+def print_report(report: Dict, baseline: Optional[Dict] = None):
+    header = f"{'benchmark':<48}{'calls':>7}{'p50(us)':>11}{'p90(us)':>11}{'p99(us)':>11}{'ops/s':>10}{'peak(KB)':>10}"
+    if baseline: header += f"{'Δp50':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in report["results"].items():
+        line = (f"{name:<48}{r['calls']:>7}{r['p50_us']:>11.1f}{r['p90_us']:>11.1f}{r['p99_us']:>11.1f}"
+                f"{r['throughput']:>10.0f}{r['peak_kb']:>10.1f}")
+        if baseline:
+            base = baseline["results"].get(name)
+            line += f"{(r['p50_us'] / base['p50_us'] - 1.0):>+9.1%}" if base and base['p50_us'] else f"{'-':>9}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="引擎热点路径基准测试")
+    parser.add_argument("--seed", type=int, default=0, help="语料随机种子")
+    parser.add_argument("--per-bucket", type=int, default=20, help="每个分桶的手牌数")
+    parser.add_argument("--rounds", type=int, default=3, help="计时轮数")
+    parser.add_argument("--only", help="只跑指定目标，逗号分隔 (如 get_shanten,parse_tiles)")
+    parser.add_argument("--save", help="把结果保存为 JSON")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 变慢超过该比例即判定为性能回退")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.seed, args.per_bucket, args.rounds, args.only.split(',') if args.only else None)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if baseline:
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"\n❌ 发现 {len(regressions)} 项性能回退 (阈值 {args.threshold:.0%}):")
+            for r in regressions: print(f"  {r}")
+            sys.exit(1)
+        print("\n✅ 未发现超过阈值的性能回退")
@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from utils import pack_hand_bytes
+
+
+class LRUCache:
+    """
+    线程安全的定长 LRU 缓存 (gunicorn 多线程 worker 共用同一个引擎实例)。
+    超出容量时淘汰最久未使用的条目，并记录命中/未命中/淘汰次数。
+    ttl (秒) 不为空时，过期条目在读取时视为未命中并被清除。
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                self.evictions += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0: return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """命中统计 (供监控/调试使用)"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else None
+            }
+
+
+class SQLiteCache:
+    """
+    基于本地 SQLite 文件的共享缓存，接口与 LRUCache 相同 (get/put/clear/stats)。
+    同一台机器上的多个 gunicorn worker 指向同一个文件即可共享结果。
+    值必须是 str/bytes (例如已经序列化好的 JSON)。
+    """
+
+    # 每写入多少次做一次过期清理与容量裁剪 (超出容量时按写入时间淘汰最旧的条目)
+    PRUNE_INTERVAL = 64
+
+    def __init__(self, path: str, maxsize: int = 65536, ttl: Optional[float] = None):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache ("
+                         "key BLOB PRIMARY KEY, value BLOB NOT NULL, expires REAL, created REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程共享，每个线程各持有一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: bytes, default: Any = None) -> Any:
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires >= ?)", (key, now)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: bytes, value: Any):
+        if self.maxsize <= 0: return
+        now = time.time()
+        expires = now + self.ttl if self.ttl else None
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires, created) VALUES (?, ?, ?, ?)",
+                         (key, value, expires, now))
+        with self._lock:
+            self._writes += 1
+            need_prune = self._writes % self.PRUNE_INTERVAL == 0
+        if need_prune:
+            self._prune(now)
+
+    def _prune(self, now: float):
+        with self._conn() as conn:
+            removed = conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (now,)).rowcount
+            removed += conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,)).rowcount
+        with self._lock:
+            self.evictions += removed
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        size = len(self)
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": size, "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else None
+            }
+
+
+def create_cache(spec: str, maxsize: int = 4096, ttl: Optional[float] = None):
+    """
+    按配置字符串创建缓存后端:
+      'memory'             -> 进程内 LRUCache (默认)
+      'sqlite:/path/to.db' -> 多 worker 共享的 SQLiteCache
+      'off'                -> 容量为 0 的缓存 (不存任何东西)
+    """
+    if spec.startswith('sqlite:'):
+        return SQLiteCache(spec[len('sqlite:'):], maxsize=maxsize, ttl=ttl)
+    if spec == 'off':
+        return LRUCache(0)
+    if spec == 'memory':
+        return LRUCache(maxsize, ttl=ttl)
+    raise ValueError(f"未知的缓存配置: {spec}")
+
+
+# 决策缓存键/值格式的版本号 (变化时递增，共享的 SQLite 缓存不会读到旧格式的结果)
+# 1: 键与值都使用三门数牌互换后的规范坐标 (symmetry.canonical_perm)
+# 2: 手牌与可见牌改用 3 bit 紧凑编码 (utils.pack_hand_bytes，各 13 字节)
+# 3: 加一个字节区分规范坐标与真实坐标 (可能成绿一色的局面不做花色互换)
+DECISION_KEY_VERSION = 3
+
+
+def decision_key(hand: List[int], visible_tiles: List[int], melds_data: Iterable[Dict],
+                 dora_indicators: Iterable[int], round_wind: int, player_wind: int, require_yaku: bool,
+                 own_discards: Iterable[int] = (), canonical: bool = True) -> bytes:
+    """
+    决策缓存的规范化键：手牌与可见牌各 13 字节紧凑编码，副露/宝牌排序后追加，
+    因此牌河顺序不同但局面相同的请求会落到同一个键上。
+    own_discards (自己的牌河，只影响振听判定) 按去重排序后的集合参与键。
+    canonical 为 False 表示各参数是真实坐标 (没有做花色互换)，与规范坐标的键分开。
+    可见牌按 4 张截断 (引擎按 4 - 可见张数算剩余枚数，超出部分不影响结果)，手牌张数超出 0-7 时报错。
+    """
+    melds = sorted((m['tile'], 1 if m['type'] == 'kan' else 0) for m in melds_data)
+    dora = sorted(t // 4 if t > 33 else t for t in dora_indicators if 0 <= t < 136)
+    river = sorted(set(t for t in own_discards if 0 <= t < 34))
+    return b''.join([
+        bytes([DECISION_KEY_VERSION, 1 if canonical else 0]), pack_hand_bytes(hand), pack_hand_bytes([min(v, 4) for v in visible_tiles]),
+        bytes([len(melds)]), bytes(v for m in melds for v in m),
+        bytes([len(dora)]), bytes(dora),
+        bytes([round_wind, player_wind, 1 if require_yaku else 0]),
+        bytes([len(river)]), bytes(river)
+    ])
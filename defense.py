@@ -0,0 +1,132 @@
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# 单张牌对某一家的放铳危险度 (0-1)，按对方能用这张牌和了的听牌形状估计：
+#   两面 RYANMEN，坎张/边张 KANCHAN，双碰 SHANPON，单骑 TANKI，按成立的形状加权求和后归一化
+#   现物：对方打过的牌 (舍牌振听)，对方立直后其他人打出的牌也算 -> 0
+#   筋：两面形状另一侧的牌是对方的现物时，这个两面不成立
+#   壁：形状需要的某种牌已全部可见时该形状不成立；未见枚数不足 2/1 张时双碰/单骑不成立
+RYANMEN, KANCHAN, SHANPON, TANKI = 1.0, 0.35, 0.35, 0.15
+_MAX_RAW = 2 * RYANMEN + KANCHAN + SHANPON + TANKI
+
+# 对手的威胁度：立直为 1，未立直时每个副露 MELD_THREAT (上限 MAX_OPEN_THREAT)，门清未立直视为 0
+MELD_THREAT = 0.3
+MAX_OPEN_THREAT = 0.9
+
+# 攻守权衡 (MAHJONG_DEFENSE_WEIGHT)：候选价值乘以 (1 - 权重 x 危险度)，0 表示只看牌效
+DEFENSE_WEIGHT = float(os.environ.get('MAHJONG_DEFENSE_WEIGHT', 0.5))
+
+
+def _neighbours(tile: int) -> range:
+    """危险度计算会读到 tile 的那些牌：同门 +-3 以内 (筋/壁)，字牌只有自己"""
+    if tile >= 27: return range(tile, tile + 1)
+    base = tile - tile % 9
+    return range(max(tile - 3, base), min(tile + 4, base + 9))
+
+
+class DefenseTracker:
+    """
+    四家的安全度表 (4, 34)：table[s][t] 为打出 t 对 s 家的危险度。
+    现物/立直/可见枚数在摸打鸣牌时增量更新，每次只重算受影响的同门 +-3 以内的几格；
+    查询 danger(viewer) 只是按威胁度加权后取各家最大值，O(4 x 34)。
+    visible 为构造时已可见的 34 格计数 (对局中是公开信息，单次评估可以包含自己的手牌)。
+    """
+    __slots__ = ('genbutsu', 'unseen', 'riichi', 'melds', 'table')
+
+    def __init__(self, visible: Optional[Sequence[int]] = None, genbutsu: Optional[Sequence[int]] = None,
+                 riichi: Optional[Sequence[bool]] = None, melds: Optional[Sequence[int]] = None):
+        self.genbutsu = list(genbutsu or [0] * 4)  # 各家现物的 34 位掩码
+        self.unseen = np.full(34, 4, dtype=np.int8)
+        if visible is not None:
+            self.unseen -= np.minimum(np.asarray(visible, dtype=np.int8), 4)
+        self.riichi = list(riichi or [False] * 4)
+        self.melds = list(melds or [0] * 4)
+        self.table = np.zeros((4, 34), dtype=np.float32)
+        self._refresh(range(34))
+
+    @classmethod
+    def from_game_state(cls, game) -> 'DefenseTracker':
+        """由 models.GameState 构造 (牌河、立直、副露数取自各家的 PlayerState)"""
+        return cls(game.visible_tiles,
+                   genbutsu=[sum(1 << t for t in set(p.discards)) for p in game.players],
+                   riichi=[p.is_riichi for p in game.players], melds=[len(p.melds) for p in game.players])
+
+    def _tile_danger(self, seat: int, tile: int) -> float:
+        gen = self.genbutsu[seat]
+        if gen >> tile & 1: return 0.0
+        unseen = self.unseen
+        raw = (SHANPON if unseen[tile] >= 2 else 0.0) + (TANKI if unseen[tile] >= 1 else 0.0)
+        if tile < 27:
+            r = tile % 9
+            if r >= 2 and unseen[tile - 2] and unseen[tile - 1]:  # 持有 (t-2, t-1)
+                if r == 2: raw += KANCHAN  # 12 边张
+                elif not gen >> (tile - 3) & 1: raw += RYANMEN
+            if r <= 6 and unseen[tile + 1] and unseen[tile + 2]:  # 持有 (t+1, t+2)
+                if r == 6: raw += KANCHAN  # 89 边张
+                elif not gen >> (tile + 3) & 1: raw += RYANMEN
+            if 1 <= r <= 7 and unseen[tile - 1] and unseen[tile + 1]:  # 坎张
+                raw += KANCHAN
+        return raw / _MAX_RAW
+
+    def _refresh(self, tiles):
+        for t in tiles:
+            for s in range(4):
+                self.table[s, t] = self._tile_danger(s, t)
+
+    # --- 增量更新 ---
+    def mark_safe(self, seat: int, tile: int):
+        """tile 成为 seat 家的现物 (seat 立直时，其他人打出的牌也通过这里记入)"""
+        if self.genbutsu[seat] >> tile & 1: return
+        self.genbutsu[seat] |= 1 << tile
+        for t in _neighbours(tile):
+            self.table[seat, t] = self._tile_danger(seat, t)
+
+    def on_visible(self, tile: int, count: int = 1):
+        self.unseen[tile] = max(int(self.unseen[tile]) - count, 0)
+        self._refresh(_neighbours(tile))
+
+    def on_discard(self, seat: int, tile: int):
+        """seat 打出 tile：成为自己的现物，也是所有立直者的现物 (未被荣和)"""
+        for s in range(4):
+            if s == seat or self.riichi[s]: self.mark_safe(s, tile)
+        self.on_visible(tile)
+
+    def on_meld(self, seat: int):
+        self.melds[seat] += 1
+
+    def declare_riichi(self, seat: int):
+        """
+        seat 立直：之后其他人打出的牌通过 on_discard 记为其现物。
+        沙盒对局 (match_engine) 没有立直宣言，不会调用这里；立直只来自无状态接口
+        (/api/evaluate_state 的 opponents[].riichi，经 from_game_state 传入)，供带立直的对局循环增量更新使用。
+        """
+        self.riichi[seat] = True
+
+    # --- 查询 ---
+    def threat(self, seat: int) -> float:
+        return 1.0 if self.riichi[seat] else min(MELD_THREAT * self.melds[seat], MAX_OPEN_THREAT)
+
+    def danger(self, viewer: int) -> np.ndarray:
+        """viewer 打出每种牌的危险度 (34,)：各对手的 威胁度 x 危险度 取最大值"""
+        threats = np.array([0.0 if s == viewer else self.threat(s) for s in range(4)], dtype=np.float32)
+        return (threats[:, None] * self.table).max(axis=0)
+
+
+def defensive_order(recs: List[Dict], danger: np.ndarray, weight: float = DEFENSE_WEIGHT,
+                    tile_key: str = 'discard_tile', group_key: str = 'shanten_after_discard') -> List[Dict]:
+    """
+    把引擎的推荐与危险度合并重排：只在与首选同向听 (group_key 相同) 的候选之间取舍，不为防守主动退向听；
+    价值 (有 EV 时用 EV，否则用进张数) 乘以 (1 - weight x 危险度) 后从高到低排列。
+    """
+    if not recs or weight <= 0 or not danger.any(): return recs
+    target = recs[0].get(group_key)
+    same = [r for r in recs if r.get(group_key) == target]
+    rest = [r for r in recs if r.get(group_key) != target]
+
+    def value(rec: Dict) -> float:
+        base = rec['ev'] if rec.get('ev') is not None else rec['total_ukeire']
+        return base * (1.0 - weight * float(danger[rec[tile_key]]))
+
+    return sorted(same, key=value, reverse=True) + rest
@@ -1,112 +1,490 @@
-from mahjong.shanten import Shanten
 from mahjong.hand_calculating.hand import HandCalculator
 from mahjong.hand_calculating.hand_config import HandConfig, OptionalRules
 from mahjong.meld import Meld
+import os
+import time
+import numpy as np
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional
+from shanten_table import SuitTable, load_suit_table
+from cache import LRUCache
+from metrics import timed
+from symmetry import canonical_perm, invert, permute
+
+# 幺九牌 (老头牌 + 字牌) 的种类 ID，用于国士无双向听计算
+YAOCHU_IDS = frozenset([0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33])
+
+_INF = 99
+
+# 预计算的花色向听表 (内存映射，由 `python shanten_table.py` 生成)，缺失时退回实时 DP
+_suit_table: Optional[SuitTable] = load_suit_table()
+
+
+def _number_suit_step(states: Dict[Tuple[int, int, int, int], int], c: int, max_seq: int) -> \
+        Dict[Tuple[int, int, int, int], int]:
+    """
+    数牌 DP 的单步转移：处理一个点数 (该点数手里有 c 张)。
+    状态: (上一位起的顺子数, 上上位起的顺子数, 面子数, 雀头数) -> 最小代价
+    max_seq 为本位置最多可起的顺子数 (8、9 位置为 0)。
+    """
+    next_states = {}
+    for (s1, s2, m, p), cost in states.items():
+        base = s1 + s2
+        for x in range(0, min(max_seq, 4 - m) + 1):
+            for k in ((0, 1) if c and m + x < 4 else (0,)):
+                for q in ((0, 1) if c and not p else (0,)):
+                    used = base + x + 3 * k + 2 * q
+                    if used > 4: continue
+                    key = (x, s1, m + x + k, p + q)
+                    new_cost = cost + (used - c if used > c else 0)
+                    if new_cost < next_states.get(key, _INF):
+                        next_states[key] = new_cost
+    return next_states
+
+
+def _number_suit_finish(states: Dict[Tuple[int, int, int, int], int]) -> Tuple[int, ...]:
+    """把 DP 终态整理成距离向量"""
+    dist = [_INF] * 10
+    for (_, _, m, p), cost in states.items():
+        if cost < dist[m * 2 + p]:
+            dist[m * 2 + p] = cost
+    return _fill_distance(dist)
+
+
+@lru_cache(maxsize=65536)
+def _number_suit_distance(counts: Tuple[int, ...]) -> Tuple[int, ...]:
+    """
+    数牌单花色的"替换距离"向量 (向听数 + 1 的分量)
+    返回长度为 10 的元组，下标 m * 2 + p 表示：本花色凑出 m 个面子 + p 个雀头，
+    最少还需要摸进多少张牌 (目标形中同种牌不超过 4 张)。
+    只枚举与手牌有交集的面子/雀头，纯空位的面子在 _fill_distance 中按 3/2 张补齐。
+    """
+    states = {(0, 0, 0, 0): 0}
+    for i in range(9):
+        # 同一位置起的顺子超过三张牌中的最大张数时，多出的顺子与空位新面子等价
+        max_seq = max(counts[i], counts[i + 1], counts[i + 2]) if i <= 6 else 0
+        states = _number_suit_step(states, counts[i], max_seq)
+    return _number_suit_finish(states)
+
+
+@lru_cache(maxsize=4096)
+def _honor_distance(counts: Tuple[int, ...]) -> Tuple[int, ...]:
+    """字牌的替换距离向量 (只能组成刻子或雀头)"""
+    states = {(0, 0): 0}
+    for c in counts:
+        if not c: continue
+        next_states = dict(states)
+        for (m, p), cost in states.items():
+            if m < 4:
+                key, new_cost = (m + 1, p), cost + (3 - c if c < 3 else 0)
+                if new_cost < next_states.get(key, _INF): next_states[key] = new_cost
+            if not p:
+                key, new_cost = (m, 1), cost + (2 - c if c < 2 else 0)
+                if new_cost < next_states.get(key, _INF): next_states[key] = new_cost
+        states = next_states
+
+    dist = [_INF] * 10
+    for (m, p), cost in states.items():
+        dist[m * 2 + p] = cost
+    return _fill_distance(dist)
+
+
+def _fill_distance(dist: List[int]) -> Tuple[int, ...]:
+    """用全新的面子 (3 张) / 雀头 (2 张) 补齐没有与手牌相交的部分"""
+    for m in range(5):
+        for p in range(2):
+            best = dist[m * 2 + p]
+            for m0 in range(m + 1):
+                for p0 in range(p + 1):
+                    cand = dist[m0 * 2 + p0] + 3 * (m - m0) + 2 * (p - p0)
+                    if cand < best: best = cand
+            dist[m * 2 + p] = best
+    return tuple(dist)
+
+
+def _merge_distance(a: Tuple[int, ...], b: Tuple[int, ...]) -> Tuple[int, ...]:
+    """合并两组花色的距离向量 (min-plus 卷积)"""
+    res = [_INF] * 10
+    for m1 in range(5):
+        for p1 in range(2):
+            va = a[m1 * 2 + p1]
+            for m2 in range(5 - m1):
+                for p2 in range(2 - p1):
+                    v = va + b[m2 * 2 + p2]
+                    idx = (m1 + m2) * 2 + p1 + p2
+                    if v < res[idx]: res[idx] = v
+    return tuple(res)
+
+
+def _suit_distance(suit: int, counts: Tuple[int, ...]) -> Tuple[int, ...]:
+    """
+    花色距离向量：优先查预计算表，表外 (或未加载) 时走带缓存的 DP。
+    DP 缓存按等价形归一：字牌与顺序无关 (按张数排序)，数牌与 1-9 翻转成 9-1 的形状等价。
+    """
+    if _suit_table is not None:
+        dist = _suit_table.lookup(suit, counts)
+        if dist is not None:
+            return dist
+    if suit == 3:
+        return _honor_distance(tuple(sorted(counts, reverse=True)))
+    return _number_suit_distance(min(counts, counts[::-1]))
+
+
+class SuitShanten:
+    """
+    按花色 (万/筒/索/字) 分解的向听数计算：构造时每门花色查一次距离向量。
+    试探摸进一张牌 (shanten_with) 不修改状态，只让所在花色重新查表，其余三门花色的合并结果按花色缓存，
+    因此对同一手牌逐张试探听牌/进张只需重算一个花色 + 一次向量合并。
+    结果与 mahjong 库的 calculate_shanten (一般形/七对子/国士取最小) 一致。
+    """
+
+    def __init__(self, hand: List[int]):
+        self.counts = list(hand)
+        self.tile_count = sum(hand)
+        self._suits = [tuple(hand[0:9]), tuple(hand[9:18]), tuple(hand[18:27]), tuple(hand[27:34])]
+        self._dists = [_suit_distance(s, self._suits[s]) for s in range(4)]
+        self._rest_cache: Dict[int, Tuple[int, ...]] = {}
+
+        # 七对子 / 国士无双所需的计数器
+        self.kinds = sum(1 for x in hand if x >= 1)
+        self.pairs = sum(1 for x in hand if x >= 2)
+        self.yaochu_kinds = sum(1 for t in YAOCHU_IDS if hand[t] >= 1)
+        self.yaochu_pairs = sum(1 for t in YAOCHU_IDS if hand[t] >= 2)
+
+    def _shifted_suit(self, suit: int, tile: int, delta: int) -> Tuple[int, ...]:
+        pos = tile - suit * 9
+        counts = self._suits[suit]
+        return counts[:pos] + (counts[pos] + delta,) + counts[pos + 1:]
+
+    def _rest_distance(self, suit: int) -> Tuple[int, ...]:
+        """除 suit 以外三门花色合并后的距离向量 (按 suit 缓存)"""
+        rest = self._rest_cache.get(suit)
+        if rest is None:
+            others = [self._dists[s] for s in range(4) if s != suit]
+            rest = _merge_distance(_merge_distance(others[0], others[1]), others[2])
+            self._rest_cache[suit] = rest
+        return rest
+
+    # --- 向听数查询 ---
+    def _regular_shanten(self, suit: int, suit_dist: Tuple[int, ...], tile_count: int) -> int:
+        need = 4 - (14 - tile_count) // 3  # 扣除已副露的面子
+        rest = self._rest_distance(suit)
+        best = _INF
+        for m in range(need + 1):
+            v = suit_dist[m * 2] + rest[(need - m) * 2 + 1]
+            if v < best: best = v
+            v = suit_dist[m * 2 + 1] + rest[(need - m) * 2]
+            if v < best: best = v
+        return best - 1
+
+    def shanten(self) -> int:
+        """当前手牌的向听数"""
+        regular = self._regular_shanten(3, self._dists[3], self.tile_count)
+        return min(regular, self._special_shanten(self.kinds, self.pairs, self.yaochu_kinds, self.yaochu_pairs))
+
+    def shanten_with(self, tile: int) -> int:
+        """假设再摸进 tile 后的向听数 (不修改状态)"""
+        suit = min(tile // 9, 3)
+        before = self.counts[tile]
+        suit_dist = _suit_distance(suit, self._shifted_suit(suit, tile, 1))
+        regular = self._regular_shanten(suit, suit_dist, self.tile_count + 1)
+
+        is_yaochu = tile in YAOCHU_IDS
+        kinds = self.kinds + (before == 0)
+        pairs = self.pairs + (before == 1)
+        yaochu_kinds = self.yaochu_kinds + (is_yaochu and before == 0)
+        yaochu_pairs = self.yaochu_pairs + (is_yaochu and before == 1)
+        return min(regular, self._special_shanten(kinds, pairs, yaochu_kinds, yaochu_pairs))
+
+    @staticmethod
+    def _special_shanten(kinds: int, pairs: int, yaochu_kinds: int, yaochu_pairs: int) -> int:
+        """七对子与国士无双的向听数 (取较小值)"""
+        chiitoitsu = -1 if pairs == 7 else 6 - pairs + (7 - kinds if kinds < 7 else 0)
+        kokushi = 13 - yaochu_kinds - (1 if yaochu_pairs else 0)
+        return min(chiitoitsu, kokushi)
+
+
+# --- 批量 (NumPy 向量化) 向听计算 ---
+_SUIT_SLICES = ((0, 9), (9, 18), (18, 27), (27, 34))
+_YAOCHU_COLS = np.array(sorted(YAOCHU_IDS))
+# 计数向量编码用 8 进制，这样张数异常 (>4) 的行也不会与其它花色形状冲突
+_POW8 = 8 ** np.arange(9, dtype=np.int64)
+# 向量合并时，每个输出下标 (m * 2 + p) 对应的 (a 下标 * 10 + b 下标) 组合
+_MERGE_INDEX = [
+    np.array([(m1 * 2 + p1) * 10 + (m - m1) * 2 + (p - p1) for m1 in range(m + 1) for p1 in range(p + 1)])
+    for m in range(5) for p in range(2)
+]
+
+
+def _batch_suit_distance(rows: np.ndarray, suit: int) -> np.ndarray:
+    """对每一行取某花色的距离向量：同形状只查一次表，再按 inverse 下标整体展开"""
+    lo, hi = _SUIT_SLICES[suit]
+    block = rows[:, lo:hi]
+    codes = block.astype(np.int64) @ _POW8[:hi - lo]
+    _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    dists = np.array([_suit_distance(suit, tuple(block[i].tolist())) for i in first], dtype=np.int16)
+    return dists[inverse.reshape(-1)]
+
+
+def _batch_merge(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """_merge_distance 的批量版本：(n, 10) x (n, 10) -> (n, 10)"""
+    sums = (a[:, :, None] + b[:, None, :]).reshape(len(a), 100)
+    return np.stack([sums[:, idx].min(axis=1) for idx in _MERGE_INDEX], axis=1)
+
+
+def batch_shanten(rows: np.ndarray) -> np.ndarray:
+    """
+    一次性计算 (n, 34) 计数矩阵中每一行的向听数 (一般形/七对子/国士取最小)。
+    结果与 SuitShanten.shanten() 逐行计算一致。
+    """
+    n = len(rows)
+    part_a = _batch_merge(_batch_suit_distance(rows, 0), _batch_suit_distance(rows, 1))
+    part_b = _batch_merge(_batch_suit_distance(rows, 2), _batch_suit_distance(rows, 3))
+
+    need = 4 - (14 - rows.sum(axis=1, dtype=np.int64)) // 3  # 扣除已副露的面子
+    all_rows = np.arange(n)
+    best = np.full(n, _INF, dtype=np.int64)
+    for m in range(5):
+        valid = need >= m
+        col = np.clip(need - m, 0, 4) * 2
+        for p in range(2):
+            cand = part_a[:, m * 2 + p] + part_b[all_rows, col + 1 - p]
+            best = np.where(valid, np.minimum(best, cand), best)
+    regular = best - 1
+
+    pairs = (rows >= 2).sum(axis=1)
+    kinds = (rows >= 1).sum(axis=1)
+    chiitoitsu = np.where(pairs == 7, -1, 6 - pairs + np.clip(7 - kinds, 0, None))
+    yaochu = rows[:, _YAOCHU_COLS]
+    kokushi = 13 - (yaochu >= 1).sum(axis=1) - (yaochu >= 2).any(axis=1)
+    return np.minimum(regular, np.minimum(chiitoitsu, kokushi))
+
+
+# 宝牌指示牌 (34 格式) -> 宝牌：数牌 9 -> 1，风牌 北 -> 东，三元牌 中 -> 白 循环
+DORA_NEXT = np.array([(t // 9) * 9 + (t % 9 + 1) % 9 for t in range(27)] +
+                     [27 + (t + 1) % 4 for t in range(4)] + [31 + (t + 1) % 3 for t in range(3)], dtype=np.int64)
+# 中张 (2-8) 与幺九/字牌的掩码
+_MIDDLE_MASK = np.array([t < 27 and 1 <= t % 9 <= 7 for t in range(34)])
+
+# 战略价值权重 (宝牌, 中张, 幺九/字牌)，每张牌计一次，可用 MAHJONG_UTILITY_WEIGHTS="50,2,-1" 调整
+UTILITY_WEIGHTS = tuple(float(x) for x in os.environ.get('MAHJONG_UTILITY_WEIGHTS', '50,2,-1').split(','))
+
+
+def dora_tiles(dora_indicators: Optional[List[int]]) -> List[int]:
+    """宝牌指示牌 (兼容 34/136 两种 ID) 对应的宝牌种类 ID"""
+    return [int(DORA_NEXT[raw_id // 4 if raw_id > 33 else raw_id]) for raw_id in dora_indicators or []]
+
+
+# 前瞻搜索配置：深度为听牌前展开的摸牌层数 (0 表示关闭，只在听牌时算打点期望)
+# 节点预算 (展开与精确算分都计数) 让结果只取决于局面；复杂形单次算分可达上百毫秒，
+# 因此另有默认 300 毫秒的时间预算给延迟设上限 (0 表示不限，无头模拟为了可复现不设)。
+# 任一预算用完后剩余候选不再算期望，标记为 truncated
+SEARCH_DEPTH = int(os.environ.get('MAHJONG_SEARCH_DEPTH', 2))
+SEARCH_NODE_BUDGET = int(os.environ.get('MAHJONG_SEARCH_NODES', 200))
+SEARCH_TIME_BUDGET = float(os.environ.get('MAHJONG_SEARCH_TIME_MS', 300)) / 1000.0 or float('inf')
 
 
 class RuleEngine:
-    def __init__(self):
-        self.shanten_calculator = Shanten()
+    def __init__(self, score_cache_size: int = 8192, search_depth: int = SEARCH_DEPTH,
+                 search_node_budget: int = SEARCH_NODE_BUDGET, search_time_budget: float = SEARCH_TIME_BUDGET,
+                 ukeire_cache_size: int = 4096, mask_cache_size: int = 32768,
+                 utility_weights: Tuple[float, float, float] = UTILITY_WEIGHTS):
         self.hand_calculator = HandCalculator()
+        # 算分结果缓存：同一听牌形在多次请求/多个回合间反复出现 (与宝牌/风位相关，不做对称归一)
+        self.score_cache = LRUCache(score_cache_size)
+        # 牌效结构缓存：按手牌规范形 (symmetry.canonical_perm) 保存"打 X 摸 Y"的向听矩阵，
+        # 花色互换/字牌重新编号后的等价手牌共用同一条目
+        self.ukeire_cache = LRUCache(ukeire_cache_size)
+        # 前瞻搜索节点的有效进张/保持向听掩码：只与手牌有关，可见牌变化 (对手每打一张) 后直接复用
+        self.mask_cache = LRUCache(mask_cache_size)
+        # 不含宝牌部分的每张牌权重 (中张 / 幺九字牌)，宝牌权重按每次调用的指示牌叠加
+        self.dora_weight, middle, terminal = utility_weights
+        self._base_utility = np.where(_MIDDLE_MASK, middle, terminal)
+        self.search_depth = search_depth
+        self.search_node_budget = search_node_budget
+        self.search_time_budget = search_time_budget
 
     # --- 基础工具方法 ---
+    @timed('get_shanten')
     def get_shanten(self, hand: List[int]) -> int:
         """计算向听数 (核心方法)"""
-        return self.shanten_calculator.calculate_shanten(hand)
+        return SuitShanten(hand).shanten()
 
-    def _calculate_hand_utility(self, hand: List[int], dora_indicators: List[int] = None) -> float:
+    @timed('get_waits')
+    def get_waits(self, hand: List[int]) -> List[int]:
+        """听牌 (3n+1 张) 时的和了牌列表：再进哪些牌即和牌；未听牌时返回空列表"""
+        probe = SuitShanten(hand)
+        if probe.shanten() != 0: return []
+        return [t for t in range(34) if probe.shanten_with(t) == -1]
+
+    def utility_vector(self, dora_indicators: List[int] = None) -> np.ndarray:
         """
-        计算手牌的战略价值评分 (用于在进张数相等时打破平局)
+        每种牌一张的战略价值 (用于在进张数相等时打破平局)，手牌价值即 hand @ vector。
         权重逻辑：Dora > 中张(2-8) > 幺九/字牌
         """
-        score = 0.0
-
-        # 1. 确定当前所有的宝牌 ID (0-33)
-        dora_ids = []
-        if dora_indicators:
-            for raw_id in dora_indicators:
-                # 兼容性处理：如果是物理 ID 则转换为种类 ID
-                ind = raw_id // 4 if raw_id > 33 else raw_id
-                if ind < 27:  # 数牌 (万筒索)
-                    dora_ids.append((ind // 9) * 9 + (ind % 9 + 1) % 9)
-                elif ind < 31:  # 风牌 (东南西北)
-                    dora_ids.append(27 + (ind - 27 + 1) % 4)
-                else:  # 三元牌 (白发中)
-                    dora_ids.append(31 + (ind - 31 + 1) % 3)
-
-        for t_id in range(34):
-            count = hand[t_id]
-            if count == 0: continue
+        vector = self._base_utility.copy()
+        doras = dora_tiles(dora_indicators)
+        if doras: vector[doras] += self.dora_weight  # 多张指示牌指向同一宝牌时只计一次
+        return vector
 
-            # 权重 A：宝牌持有量 (每张宝牌 +50分)
-            if t_id in dora_ids:
-                score += count * 50.0
-
-            # 权重 B：中张灵活性 (2-8)
-            t_val = t_id % 9
-            if t_id < 27 and 1 <= t_val <= 7:
-                score += count * 2.0
-
-            # 权重 C：幺九/字牌扣分
-            if t_id >= 27 or t_val == 0 or t_val == 8:
-                score -= count * 1.0
-
-        return score
+    def _discard_utilities(self, hand: List[int], discards: List[int], dora_indicators: List[int] = None) -> List[float]:
+        """全部候选打法打出后的战略价值：(打后手牌矩阵 @ vector) 展开后即 hand @ vector - vector[打出的牌]"""
+        vector = self.utility_vector(dora_indicators)
+        return (float(np.dot(hand, vector)) - vector[discards]).tolist()
 
     # --- 核心引擎方法 ---
 
-    def evaluate_pure_efficiency(self, hand: List[int], visible_tiles: List[int], dora_indicators: List[int] = None) -> \
-            Tuple[int, List[Dict]]:
-        """基础纯牌效引擎 (包含二阶评分逻辑)"""
-        current_shanten = self.get_shanten(hand)
-        best_discards = []
-
-        for discard_tile in range(34):
-            if hand[discard_tile] == 0: continue
-            hand[discard_tile] -= 1
-
-            shanten_after_discard = self.get_shanten(hand)
-            ukeire_details = []
-            total_ukeire_count = 0
-
-            for draw_tile in range(34):
-                if visible_tiles[draw_tile] >= 4: continue
-                hand[draw_tile] += 1
-                if self.get_shanten(hand) < shanten_after_discard:
-                    real_left = 4 - visible_tiles[draw_tile]
-                    if real_left > 0:
-                        ukeire_details.append({'tile': draw_tile, 'left_count': real_left})
-                        total_ukeire_count += real_left
-                hand[draw_tile] -= 1
-
-            # 计算战略价值
-            utility = self._calculate_hand_utility(hand, dora_indicators)
-
-            best_discards.append({
-                'discard_tile': discard_tile,
-                'shanten_after_discard': shanten_after_discard,
-                'total_ukeire': total_ukeire_count,
-                'quality_score': utility,
-                'details': ukeire_details
-            })
-            hand[discard_tile] += 1
-
-        # 排序：进张有效性 > 向听推进 > 进张数量 > 战略价值
-        best_discards.sort(key=lambda x: (
-            x['total_ukeire'] > 0,
-            -x['shanten_after_discard'],
-            x['total_ukeire'],
-            x['quality_score']
+    @timed('recommend_discards')
+    def recommend_discards(self, hand: List[int], visible_tiles: List[int], melds_data: List[Dict] = None,
+                           dora_indicators: List[int] = None, require_yaku: bool = True, round_wind: int = 27,
+                           player_wind: int = 28, deadline: Optional[float] = None,
+                           top_k: Optional[int] = None) -> Tuple[int, List[Dict]]:
+        """
+        按当前向听数选择引擎：已和牌返回空列表；
+        听牌以及前瞻深度覆盖得到的一/两向听走打点期望引擎，其余走纯牌效引擎。
+        deadline 为 time.monotonic() 时间点，到点后返回已得到的最好排序 (见 evaluate_ev_efficiency)；
+        top_k 不为空时只返回 (也只完整计算) 排名前 top_k 的打法
+        """
+        # 向听数取自按手牌缓存的牌效结构，可见牌变化后的重复查询不再重新计算
+        current_shanten = self._ukeire_candidates(hand, visible_tiles)[0]
+        if current_shanten == -1:
+            return current_shanten, []
+        if current_shanten <= max(self.search_depth, 0):
+            return current_shanten, self.evaluate_ev_efficiency(
+                hand, visible_tiles, current_shanten, melds_data=melds_data, dora_indicators=dora_indicators,
+                require_yaku=require_yaku, round_wind=round_wind, player_wind=player_wind, deadline=deadline,
+                top_k=top_k
+            )
+        _, recommendations = self.evaluate_pure_efficiency(hand, visible_tiles, dora_indicators, top_k=top_k)
+        return current_shanten, recommendations
+
+    def _ukeire_candidates(self, hand: List[int], visible_tiles: List[int]) -> \
+            Tuple[int, List[int], np.ndarray, np.ndarray, np.ndarray, List[int]]:
+        """
+        构造全部 (打牌, 摸牌) 候选的 int8 计数矩阵并一次性求向听。
+        向听矩阵只与手牌有关，按规范形缓存，命中时只需把行列换回真实牌 ID，
+        再用本次的剩余张数做掩码求和，不重新计算任何向听。
+        返回: (当前向听, 可打的牌, 打后向听 (k,), 打后再摸向听 (k, 34), 有效进张掩码 (k, 34), 每种牌剩余张数)
+        """
+        perm = canonical_perm(hand)
+        base = np.asarray(permute(hand, perm), dtype=np.int8)
+        key = base.tobytes()
+        cached = self.ukeire_cache.get(key)
+        if cached is None:
+            canon_discards = np.flatnonzero(base)
+            k = len(canon_discards)
+            after = np.repeat(base[None, :], k, axis=0)
+            after[np.arange(k), canon_discards] -= 1
+            drawn = np.repeat(after, 34, axis=0)
+            drawn[np.arange(k * 34), np.tile(np.arange(34), k)] += 1
+
+            shantens = batch_shanten(np.concatenate([base[None, :], after, drawn])).astype(np.int8)
+            cached = (int(shantens[0]), canon_discards, shantens[1:k + 1], shantens[k + 1:].reshape(k, 34))
+            self.ukeire_cache.put(key, cached)
+        current, canon_discards, canon_after, canon_draw = cached
+
+        # 规范坐标 -> 真实牌 ID：行按真实打牌 ID 升序，列按逆排列取
+        real = np.asarray(perm)[canon_discards]
+        order = np.argsort(real)
+        discards = real[order]
+        shanten_after = canon_after[order].astype(np.int64)
+        draw_shanten = canon_draw[order][:, list(invert(perm))].astype(np.int64)
+
+        left = np.clip(4 - np.asarray(visible_tiles, dtype=np.int64), 0, None)
+        effective = (draw_shanten < shanten_after[:, None]) & (left > 0)[None, :]
+        return current, discards.tolist(), shanten_after, draw_shanten, effective, left.tolist()
+
+    def advance_mask(self, hand: np.ndarray) -> Tuple[int, np.ndarray]:
+        """3n+1 张手牌 (int8 计数)：(向听数, 摸进后向听前进的牌掩码 (34,))，按手牌缓存"""
+        key = hand.tobytes()
+        cached = self.mask_cache.get(key)
+        if cached is None:
+            drawn = np.repeat(hand[None, :], 34, axis=0)
+            drawn[np.arange(34), np.arange(34)] += 1
+            shantens = batch_shanten(np.concatenate([hand[None, :], drawn]))
+            cached = (int(shantens[0]), (shantens[1:] < shantens[0]) & (hand < 4))
+            self.mask_cache.put(key, cached)
+        return cached
+
+    def keep_masks(self, rows: np.ndarray) -> Tuple[List[int], np.ndarray]:
+        """
+        一批 3n+2 张手牌 (k, 34)：(各自的向听数, 打出后向听不变的牌掩码 (k, 34))。
+        按手牌缓存，未命中的行合并成一次批量计算。
+        """
+        shantens, masks = [0] * len(rows), np.zeros(rows.shape, dtype=bool)
+        missing = []
+        for r, row in enumerate(rows):
+            cached = self.mask_cache.get(row.tobytes())
+            if cached is None:
+                missing.append(r)
+            else:
+                shantens[r], masks[r] = cached
+        if missing:
+            block = rows[missing]
+            target = batch_shanten(block)
+            idx, discard = np.nonzero(block > 0)
+            after = block[idx]
+            after[np.arange(len(idx)), discard] -= 1
+            keep = batch_shanten(after) == target[idx]
+            computed = np.zeros(block.shape, dtype=bool)
+            computed[idx[keep], discard[keep]] = True
+            for j, r in enumerate(missing):
+                shantens[r], masks[r] = int(target[j]), computed[j]
+                self.mask_cache.put(rows[r].tobytes(), (shantens[r], computed[j]))
+        return shantens, masks
+
+    @timed('evaluate_pure_efficiency')
+    def evaluate_pure_efficiency(self, hand: List[int], visible_tiles: List[int], dora_indicators: List[int] = None,
+                                 top_k: Optional[int] = None) -> Tuple[int, List[Dict]]:
+        """基础纯牌效引擎 (包含二阶评分逻辑)；top_k 不为空时只展开排名前 top_k 的打法"""
+        current_shanten, discards, shanten_after, _, effective, left = self._ukeire_candidates(hand, visible_tiles)
+        totals = (effective @ np.asarray(left)).tolist()
+        shanten_after = shanten_after.tolist()
+        utilities = self._discard_utilities(hand, discards, dora_indicators)
+
+        # 排序：进张有效性 > 向听推进 > 进张数量 > 战略价值 (先按下标排序，只为入选的打法构造 dict)
+        order = sorted(range(len(discards)), key=lambda i: (
+            totals[i] > 0,
+            -shanten_after[i],
+            totals[i],
+            utilities[i]
         ), reverse=True)
-
+        if top_k: order = order[:top_k]
+
+        best_discards = [{
+            'discard_tile': discards[i],
+            'shanten_after_discard': shanten_after[i],
+            'total_ukeire': totals[i],
+            'quality_score': utilities[i],
+            'details': [{'tile': t, 'left_count': left[t]} for t in np.flatnonzero(effective[i]).tolist()]
+        } for i in order]
         return current_shanten, best_discards
 
+    @timed('calculate_exact_score')
     def calculate_exact_score(self, hand: List[int], win_tile: int, is_riichi: bool = False,
                               melds_data: List[Dict] = None, dora_indicators: List[int] = None,
                               require_yaku: bool = True, round_wind: int = 27, player_wind: int = 28) -> Tuple[
         int, str]:
-        """高精度算分引擎"""
+        """高精度算分引擎 (结果按规范化的手牌/副露/和牌/宝牌/风位/立直缓存)"""
+        dora_key = tuple(sorted(raw_id // 4 if raw_id > 33 else raw_id for raw_id in dora_indicators or []))
+        melds_key = tuple(sorted((m['type'], m['tile']) for m in melds_data or []))
+        key = (tuple(hand), win_tile, is_riichi, melds_key, dora_key, round_wind, player_wind)
+
+        cached = self.score_cache.get(key)
+        if cached is None:
+            cached = self._estimate_score(hand, win_tile, is_riichi, melds_data, dora_indicators,
+                                          round_wind, player_wind)
+            self.score_cache.put(key, cached)
+
+        cost, error = cached
+        if error:
+            return (0, error) if require_yaku else (1000, None)
+        return cost, None
+
+    def _estimate_score(self, hand: List[int], win_tile: int, is_riichi: bool, melds_data: Optional[List[Dict]],
+                        dora_indicators: Optional[List[int]], round_wind: int, player_wind: int) -> \
+            Tuple[int, Optional[str]]:
+        """调用 mahjong 库计算和牌点数，返回 (点数, 错误信息)"""
         hand_136 = []
         used_counts = [0] * 34
 
@@ -158,62 +536,128 @@ class RuleEngine:
         )
 
         if result.error:
-            return (0, result.error) if require_yaku else (1000, None)
+            return 0, result.error
         return result.cost['main'], None
 
+    @timed('evaluate_ev_efficiency')
     def evaluate_ev_efficiency(self, hand: List[int], visible_tiles: List[int], current_shanten: int,
                                melds_data: List[Dict] = None, dora_indicators: List[int] = None,
-                               require_yaku: bool = True, round_wind: int = 27, player_wind: int = 28) -> List[Dict]:
-        """打点期望引擎 (包含二阶评分逻辑)"""
-        best_discards = []
+                               require_yaku: bool = True, round_wind: int = 27, player_wind: int = 28,
+                               deadline: Optional[float] = None, top_k: Optional[int] = None) -> List[Dict]:
+        """
+        打点期望引擎 (包含二阶评分逻辑)。
+        和牌进张按精确点数计分；未直接和牌的进张交给前瞻搜索 (search.LookaheadSearch) 估值，
+        前瞻关闭时沿用固定估值 1000。
+
+        top_k 剪枝：排序的前两项 (有无进张、打后向听) 只取决于牌效结构，
+        排在第 top_k 名所在分组之后的打法不可能进入结果，直接跳过算分与前瞻。
+
+        随时可中断：候选先按纯牌效 (打后向听、进张数) 排好，再依次补算打点期望；
+        到达 deadline (time.monotonic() 时间点) 后剩余候选不再计算，ev 为 None，
+        排在同向听、已算出期望的候选之后并按自己的进张数与战略价值排序。
+        前瞻搜索的预算在某个候选之前或之中用完时同样处理；只要有候选没算完，返回的每一项都带
+        truncated=True (调用方不应缓存这样的结果)。
+        """
         can_riichi = not melds_data or all(m['type'] == 'kan' for m in melds_data)
+        _, discards, shanten_after, draw_shanten, effective, left = self._ukeire_candidates(hand, visible_tiles)
+        totals = (effective @ np.asarray(left)).tolist()
+        shanten_after = shanten_after.tolist()
+        utilities = self._discard_utilities(hand, discards, dora_indicators)
+
+        # 时间预算与调用方的 deadline 取较早者，同时限制候选循环与前瞻搜索
+        if self.search_time_budget != float('inf'):
+            deadline = min(time.monotonic() + self.search_time_budget, deadline or float('inf'))
+        search = None
+        if self.search_depth > 0:
+            from search import LookaheadSearch
+            search = LookaheadSearch(self, hand, visible_tiles, melds_data, dora_indicators, require_yaku,
+                                     round_wind, player_wind, depth=self.search_depth,
+                                     node_budget=self.search_node_budget, deadline=deadline)
+
+        # 先算纯牌效最好的候选，时间与搜索预算优先花在它们身上 (结果仍按原打牌顺序排列)
+        group = [(totals[i] == 0, shanten_after[i]) for i in range(len(discards))]
+        order = sorted(range(len(discards)), key=lambda i: (group[i], -totals[i]))
+        if top_k and top_k < len(order):
+            cutoff = group[order[top_k - 1]]
+            order = [i for i in order if group[i] <= cutoff]
+
+        def unscored(i: int) -> Dict:
+            return {
+                'discard_tile': discards[i], 'shanten_after_discard': shanten_after[i],
+                'total_ukeire': totals[i], 'ev': None,
+                'quality_score': utilities[i], 'err': None,
+                'details': [{'tile': t, 'left_count': left[t]} for t in np.flatnonzero(effective[i]).tolist()]
+            }
+
+        results: List[Optional[Dict]] = [None] * len(discards)
+        truncated = False
+        for i in order:
+            if deadline is not None and time.monotonic() >= deadline:
+                results[i] = unscored(i)
+                truncated = True
+                continue
+            discard_tile = discards[i]
+            draws = np.flatnonzero(effective[i]).tolist()
+            pending = [t for t in draws if draw_shanten[i, t] != -1]
+            # 退向听的打法排序时必然落后，不花搜索预算
+            searched = search is not None and pending and shanten_after[i] == current_shanten
+            if searched and search.exhausted():
+                results[i] = unscored(i)
+                truncated = True
+                continue
 
-        for discard_tile in range(34):
-            if hand[discard_tile] == 0: continue
             hand[discard_tile] -= 1
-
-            shanten_after_discard = self.get_shanten(hand)
             ukeire_details, total_ukeire_count, expected_value = [], 0, 0.0
             last_error = None
-
-            for draw_tile in range(34):
-                if visible_tiles[draw_tile] >= 4: continue
-                hand[draw_tile] += 1
-                new_shanten = self.get_shanten(hand)
-
-                if new_shanten < shanten_after_discard:
-                    real_left = 4 - visible_tiles[draw_tile]
-                    if real_left > 0:
-                        if new_shanten == -1:
-                            score, err = self.calculate_exact_score(
-                                hand, draw_tile, is_riichi=can_riichi, melds_data=melds_data,
-                                dora_indicators=dora_indicators, require_yaku=require_yaku,
-                                round_wind=round_wind, player_wind=player_wind
-                            )
-                            score_estimate = score
-                            if err: last_error = err
-                        else:
-                            score_estimate = 1000
-
-                        expected_value += real_left * score_estimate
-                        ukeire_details.append(
-                            {'tile': draw_tile, 'left_count': real_left, 'estimated_score': score_estimate})
-                        total_ukeire_count += real_left
-                hand[draw_tile] -= 1
-
-            utility = self._calculate_hand_utility(hand, dora_indicators)
-
-            best_discards.append({
-                'discard_tile': discard_tile, 'shanten_after_discard': shanten_after_discard,
-                'total_ukeire': total_ukeire_count, 'ev': expected_value, 'quality_score': utility,
+            lookahead = {}
+            if searched:
+                cutoffs = search.cutoffs
+                rows = np.repeat(np.asarray(hand, dtype=np.int8)[None, :], len(pending), axis=0)
+                rows[np.arange(len(pending)), pending] += 1
+                lookahead = dict(zip(pending, search.draw_values(rows)))
+                if search.cutoffs != cutoffs:
+                    hand[discard_tile] += 1
+                    results[i] = unscored(i)
+                    truncated = True
+                    continue
+
+            for draw_tile in draws:
+                real_left = left[draw_tile]
+                if draw_shanten[i, draw_tile] == -1:
+                    hand[draw_tile] += 1
+                    score, err = self.calculate_exact_score(
+                        hand, draw_tile, is_riichi=can_riichi, melds_data=melds_data,
+                        dora_indicators=dora_indicators, require_yaku=require_yaku,
+                        round_wind=round_wind, player_wind=player_wind
+                    )
+                    hand[draw_tile] -= 1
+                    # 直接和牌的算分同样计入前瞻搜索的节点预算
+                    if search is not None: search.nodes += 1
+                    score_estimate = score
+                    if err: last_error = err
+                else:
+                    score_estimate = lookahead.get(draw_tile, 1000)
+
+                expected_value += real_left * score_estimate
+                ukeire_details.append({'tile': draw_tile, 'left_count': real_left, 'estimated_score': score_estimate})
+                total_ukeire_count += real_left
+
+            results[i] = {
+                'discard_tile': discard_tile, 'shanten_after_discard': shanten_after[i],
+                'total_ukeire': total_ukeire_count, 'ev': expected_value, 'quality_score': utilities[i],
                 'err': last_error if expected_value == 0 and last_error else None,
                 'details': ukeire_details
-            })
+            }
             hand[discard_tile] += 1
 
-        # 排序：进张有效性 > 向听推进 > 期望分(EV) > 进张数量 > 战略价值
+        best_discards = [r for r in results if r is not None]
+        # 排序：进张有效性 > 向听推进 > 期望分(EV，未算出的排后) > 进张数量 > 战略价值
         best_discards.sort(
-            key=lambda x: (x['total_ukeire'] > 0, -x['shanten_after_discard'], x['ev'], x['total_ukeire'],
-                           x['quality_score']),
+            key=lambda x: (x['total_ukeire'] > 0, -x['shanten_after_discard'], x['ev'] is not None, x['ev'] or 0,
+                           x['total_ukeire'], x['quality_score']),
             reverse=True)
+        best_discards = best_discards[:top_k] if top_k else best_discards
+        # 有候选没算完时 (包括被 top_k 截掉的)，整份排序都不是完整计算的结果
+        if truncated:
+            for rec in best_discards: rec['truncated'] = True
         return best_discards
\ No newline at end of file
@@ -0,0 +1,114 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
+
+from engine import RuleEngine
+
+
+class EvaluatorUnavailable(RuntimeError):
+    """评估后端暂时无法受理请求 (路由层应返回 503)"""
+
+
+class EvaluatorBusy(EvaluatorUnavailable):
+    """排队任务数已达上限"""
+
+
+class EvaluatorTimeout(EvaluatorUnavailable):
+    """任务超出单次时限"""
+
+
+# --- 子进程侧 ---
+_worker_engine: Optional[RuleEngine] = None
+
+
+def _init_worker():
+    """子进程启动时构造常驻引擎，并跑一手牌预热查表/缓存"""
+    global _worker_engine
+    _worker_engine = RuleEngine()
+    warmup_hand = [1, 1, 1, 0, 0, 0, 0, 0, 0] * 3 + [2, 0, 0, 0, 0, 0, 0]
+    _worker_engine.evaluate_pure_efficiency(warmup_hand[:], warmup_hand[:])
+
+
+def _call_engine(method: str, args: tuple, kwargs: dict):
+    return getattr(_worker_engine, method)(*args, **kwargs)
+
+
+class EngineExecutor:
+    """
+    引擎调用的统一入口。
+    processes 为 0 时直接在请求线程中调用本进程的引擎；
+    大于 0 时把 CPU 密集的评估分发到常驻进程池，绕开 GIL 对多线程 worker 的串行化。
+    进程池在第一次使用时才创建，兼容 gunicorn --preload 之后再 fork worker 的场景。
+    """
+
+    def __init__(self, engine: RuleEngine, processes: int = 0, timeout: float = 10.0,
+                 max_pending: Optional[int] = None):
+        self.engine = engine
+        self.processes = processes
+        self.timeout = timeout
+        self.max_pending = max_pending if max_pending is not None else processes * 4
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(self.max_pending, 1))
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls, engine: RuleEngine) -> 'EngineExecutor':
+        """从环境变量读取配置: MAHJONG_EVAL_PROCESSES / MAHJONG_EVAL_TIMEOUT / MAHJONG_EVAL_MAX_PENDING"""
+        processes = int(os.environ.get('MAHJONG_EVAL_PROCESSES', 0))
+        max_pending = os.environ.get('MAHJONG_EVAL_MAX_PENDING')
+        return cls(engine, processes=processes, timeout=float(os.environ.get('MAHJONG_EVAL_TIMEOUT', 10)),
+                   max_pending=int(max_pending) if max_pending else None)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker)
+            return self._pool
+
+    def _release(self, _future=None):
+        with self._pool_lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def call(self, method: str, *args, **kwargs):
+        """调用 RuleEngine 的同名方法"""
+        if self.processes <= 0:
+            return getattr(self.engine, method)(*args, **kwargs)
+
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise EvaluatorBusy("评估队列已满，请稍后重试")
+        with self._pool_lock:
+            self.pending += 1
+        try:
+            future = self._get_pool().submit(_call_engine, method, args, kwargs)
+        except Exception:
+            self._release()
+            raise
+        # 名额在任务真正结束时才归还，超时任务仍计入队列深度
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            raise EvaluatorTimeout(f"评估超时 (>{self.timeout}s)")
+
+    def recommend_discards(self, hand: List[int], visible_tiles: List[int], melds_data: List[Dict] = None,
+                           dora_indicators: List[int] = None, require_yaku: bool = True, round_wind: int = 27,
+                           player_wind: int = 28, deadline: Optional[float] = None,
+                           top_k: Optional[int] = None) -> Tuple[int, List[Dict]]:
+        # deadline 是 time.monotonic() 时间点，同一台机器上的子进程共用同一个单调时钟
+        return self.call('recommend_discards', hand, visible_tiles, melds_data=melds_data,
+                         dora_indicators=dora_indicators, require_yaku=require_yaku,
+                         round_wind=round_wind, player_wind=player_wind, deadline=deadline, top_k=top_k)
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,125 @@
+import os
+import random
+import time
+from typing import List, Dict, Iterable, Optional
+
+from defense import DEFENSE_WEIGHT, defensive_order
+from match_engine import MatchManager
+
+# 每一手 AI 决策的时间预算 (MAHJONG_AI_BUDGET_MS，0 表示不限)，用来给 AI 回合的延迟设硬上限
+AI_MOVE_BUDGET = float(os.environ.get('MAHJONG_AI_BUDGET_MS', 0)) / 1000.0
+
+# 有对手构成威胁时，向引擎多要几个候选，与危险度合并后再选
+DEFENSE_CANDIDATES = 5
+
+
+def wait_mask(engine, match: MatchManager, player_index: int) -> int:
+    """玩家和了牌的 34 位掩码；只在手牌变化后的第一次查询时重算，其余时候直接读缓存"""
+    seat = match.players[player_index]
+    if seat.waits < 0:
+        waits = 0
+        if seat.tile_count % 3 == 1:
+            for t in engine.get_waits(seat.counts): waits |= 1 << t
+        seat.waits = waits
+    return seat.waits
+
+
+def is_furiten(engine, match: MatchManager, player_index: int) -> bool:
+    """舍牌振听：和了牌中有自己打出过的牌"""
+    return bool(wait_mask(engine, match, player_index) & match.players[player_index].discarded)
+
+
+def check_ron(engine, match: MatchManager, discarder_index: int, discard_tile_34: int) -> bool:
+    """全场截胡检查 (优先级 1)：和了牌集合的成员判断，振听时不能荣和"""
+    for offset in range(1, 4):
+        p_idx = (discarder_index + offset) % 4
+        if wait_mask(engine, match, p_idx) >> discard_tile_34 & 1 and not is_furiten(engine, match, p_idx):
+            match.declare_ron(p_idx, discarder_index)
+            return True
+    return False
+
+
+def handle_ai_melds(match: MatchManager, discarder_index: int, tile_34: int,
+                    ai_seats: Iterable[int] = (1, 2, 3), rng=random) -> bool:
+    """【核心修复】AI 拦截鸣牌检查 (优先级 2)，防止战局卡死"""
+    for i in ai_seats:
+        if i == discarder_index: continue
+        can_kan = match.can_call_kan(i, tile_34)
+        can_pon = match.can_call_pon(i, tile_34)
+        # 简单概率模型：AI 有 30% 概率鸣牌以推进战局
+        if (can_kan or can_pon) and rng.random() < 0.3:
+            meld_type = 'kan' if can_kan else 'pon'
+            match.perform_meld(i, tile_34, meld_type, discarder_index)
+            return True
+    return False
+
+
+def get_human_actions(match: MatchManager, discarder_index: int, tile_34: int) -> List[Dict]:
+    """检查人类玩家 (P0) 的拦截动作"""
+    if discarder_index == 0: return []
+    actions = []
+    if match.can_call_kan(0, tile_34): actions.append({"type": "kan", "tile": tile_34})
+    if match.can_call_pon(0, tile_34): actions.append({"type": "pon", "tile": tile_34})
+    return actions
+
+
+def ai_take_turn(evaluator, match: MatchManager, ai_idx: int, budget: float = AI_MOVE_BUDGET) -> Optional[int]:
+    """
+    AI 的一次摸打：必要时摸牌，自摸则结束对局，否则按引擎推荐打出一张牌。
+    evaluator 可以是 RuleEngine 或 EngineExecutor (都提供 recommend_discards)。
+    budget 为这一手的时间预算 (秒，0 表示不限)，到点时按已得到的最好排序出牌。
+    返回打出的牌 (34 格式)；对局因自摸或流局结束时返回 None。
+    """
+    deadline = time.monotonic() + budget if budget > 0 else None
+    # 【修复点】判定是否需要摸牌：碰牌后轮到自己时已是 3n+2 张，不摸牌直接出牌；
+    # 3n+1 张 (13 张，或副露后的 10/7/4/1 张) 时才需要摸牌
+    if match.hand_count(ai_idx) % 3 == 1:
+        if not match.player_draw(ai_idx): return None
+
+    hand_34 = match.get_hand_34(ai_idx)
+    dora_34 = [t // 4 for t in match.dora_indicators]
+
+    # AI 决策 (听牌走打点期望，其余走纯牌效；传入格式化后的 dora_34)
+    # 有对手副露/立直时按危险度在同向听的候选里取舍 (安全度表由对局增量维护，这里只是 O(34) 查询)
+    danger = match.defense.danger(ai_idx) if DEFENSE_WEIGHT > 0 else None
+    defend = danger is not None and bool(danger.any())
+    shanten, recs = evaluator.recommend_discards(hand_34, match.dead_tiles_34, match.players[ai_idx].melds, dora_34,
+                                                 deadline=deadline, top_k=DEFENSE_CANDIDATES if defend else 1)
+    if defend: recs = defensive_order(recs, danger)
+
+    if shanten == -1:
+        match.declare_tsumo(ai_idx)
+        return None
+
+    best_tile = recs[0]['discard_tile'] if recs else match.players[ai_idx].any_tile()
+    match.player_discard(ai_idx, best_tile)
+    return best_tile
+
+
+def is_ai_turn(match: MatchManager) -> bool:
+    """轮到 AI 行动 (对局未结束，且没有在等人类决定是否鸣牌)"""
+    return not match.is_game_over and match.current_turn != 0 and match.pending_call is None
+
+
+def resolve_discard(match: MatchManager, discarder_index: int, tile_34: int):
+    """没人荣和、人类也不鸣牌之后：检查 AI 鸣牌，轮到人类时替其摸牌"""
+    if handle_ai_melds(match, discarder_index, tile_34): return
+    if match.current_turn == 0 and not match.is_game_over:
+        match.player_draw(0)
+
+
+def advance_ai_turn(evaluator, engine, match: MatchManager):
+    """
+    推进当前 AI 座位的一个回合：摸打 -> 全场荣和检查 -> 人类可鸣牌时挂起 -> AI 鸣牌 -> 人类摸牌。
+    所有变化都记录在 match.events 中。
+    """
+    ai_idx = match.current_turn
+    best_tile = ai_take_turn(evaluator, match, ai_idx)
+    if best_tile is None: return
+
+    # 拦截扫描流程
+    if check_ron(engine, match, ai_idx, best_tile): return
+    if get_human_actions(match, ai_idx, best_tile):
+        match.offer_call(ai_idx, best_tile)
+        return
+    resolve_discard(match, ai_idx, best_tile)
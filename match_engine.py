@@ -1,107 +1,290 @@
 import random
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional, Tuple
 
+from defense import DefenseTracker
+
+
+class PlayerSeat:
+    """
+    单个座位的紧凑状态：
+    - counts: 34 格式计数 (bytearray)，供引擎与鸣牌判定直接读取
+    - bits: 136 位的物理牌位图，第 t 位表示手里有 ID 为 t 的物理牌
+    摸/打/鸣牌时两者同步增量更新，张数与某种牌的枚数查询都是 O(1)。
+    - waits: 听牌时和了牌的 34 位掩码，手牌变化时置为 -1 (待重算，见 match_ai.wait_mask)
+    - discarded: 自己打出过的牌种的 34 位掩码 (被鸣走的也算)，用于舍牌振听判定
+    """
+    __slots__ = ('counts', 'bits', 'tile_count', 'discards', 'melds', 'waits', 'discarded')
 
-class MatchManager:
     def __init__(self):
+        self.counts = bytearray(34)
+        self.bits = 0
+        self.tile_count = 0
+        self.discards = bytearray()  # 牌河 (136 格式，按打出顺序)
+        self.melds: List[Dict] = []  # 副露暂留
+        self.waits = -1
+        self.discarded = 0
+
+    def __getstate__(self):
+        # 计数与张数由位图推出，听牌掩码是缓存，都不进序列化结果
+        return self.bits, bytes(self.discards), self.melds, self.discarded
+
+    def __setstate__(self, state):
+        self.bits, discards, self.melds, self.discarded = state
+        self.discards = bytearray(discards)
+        self.counts = bytearray(bin((self.bits >> (t * 4)) & 0xF).count('1') for t in range(34))
+        self.tile_count = sum(self.counts)
+        self.waits = -1
+
+    def add(self, tile_136: int):
+        self.bits |= 1 << tile_136
+        self.counts[tile_136 >> 2] += 1
+        self.tile_count += 1
+        self.waits = -1
+
+    def remove(self, tile_34: int) -> int:
+        """移除一张指定种类的牌，返回被移除的物理牌 ID (手里没有该牌时返回 -1)"""
+        nibble = (self.bits >> (tile_34 * 4)) & 0xF
+        if not nibble: return -1
+        tile_136 = tile_34 * 4 + (nibble & -nibble).bit_length() - 1
+        self.bits &= ~(1 << tile_136)
+        self.counts[tile_34] -= 1
+        self.tile_count -= 1
+        self.waits = -1
+        return tile_136
+
+    def hand_136(self) -> List[int]:
+        """手里的物理牌 ID (升序)"""
+        bits, tiles = self.bits, []
+        while bits:
+            low = bits & -bits
+            tiles.append(low.bit_length() - 1)
+            bits ^= low
+        return tiles
+
+    def any_tile(self) -> int:
+        """手里编号最大的一种牌 (34 格式)，手牌为空时返回 -1"""
+        return (self.bits.bit_length() - 1) >> 2 if self.bits else -1
+
+
+# 对局事件 (kind, seat, tile, extra)，序号为其在 events 中的下标 + 1：
+#   draw      seat 摸到 tile (136)             discard   seat 打出 tile (136)
+#   pon/kan   seat 鸣 tile (34)，extra=放铳者    ron       seat 荣和 tile (136)，extra=放铳者
+#   tsumo     seat 自摸                         ryuukyoku 牌山摸空流局 (seat 为本应摸牌的人)
+#   dora      翻开宝牌指示牌 tile (136)
+#   prompt    人类可以对 extra 打出的 tile (34) 鸣牌，等待其选择    pass  人类放弃鸣牌
+Event = Tuple[str, int, int, int]
+EVENT_KINDS = ('draw', 'discard', 'pon', 'kan', 'ron', 'tsumo', 'ryuukyoku', 'dora', 'prompt', 'pass')
+_KIND_CODES = {kind: code for code, kind in enumerate(EVENT_KINDS)}
+
+
+def encode_events(events: Iterable[Event]) -> bytes:
+    """事件 -> 每个 4 字节 (种类, 座位 + 1, 牌 + 1, 附加 + 1)，对局序列化与二进制日志 (match_log) 共用"""
+    return b''.join(bytes((_KIND_CODES[kind], seat + 1, tile + 1, extra + 1)) for kind, seat, tile, extra in events)
+
+
+def decode_events(data: bytes) -> List[Event]:
+    return [(EVENT_KINDS[data[i]], data[i + 1] - 1, data[i + 2] - 1, data[i + 3] - 1) for i in range(0, len(data), 4)]
+
+
+class MatchManager:
+    """
+    一局对局的完整状态。序列化 (SQLite 对局存储) 时只保存初始牌山、牌山剩余张数、各座位的位图/牌河/副露
+    与 4 字节一条的事件，安全度表在读回时由公开信息重建：新局约 450 字节，此后每个事件约增加 5 字节。
+    """
+    __slots__ = ('initial_wall', 'wall', 'players', 'current_turn', 'dora_indicators', 'dead_tiles_34',
+                 'is_game_over', 'winner', 'events', 'pending_call', 'defense')
+
+    def __init__(self, rng: Optional[random.Random] = None):
         # 136张物理牌 (0-135，每4个ID代表同一种牌，例如 0,1,2,3 都是一万)
-        self.wall = list(range(136))
-        random.shuffle(self.wall)
+        # rng 用于固定随机种子 (无头模拟/复现)；不保存在实例上，保证对局对象可被序列化
+        wall = bytearray(range(136))
+        (rng or random).shuffle(wall)
+        self._reset(wall)
+
+        # 开局发牌
+        self._deal_initial_hands()
+
+    def _reset(self, wall: bytes):
+        self.initial_wall = bytes(wall)
+        self.wall = bytearray(wall)
 
         # 4名玩家 (0 是人类，1, 2, 3 是 AI)
-        self.players = {
-            i: {
-                "hand_136": [],  # 玩家手里的物理牌
-                "discards_136": [],  # 玩家的牌河
-                "melds": []  # 副露暂留
-            } for i in range(4)
-        }
+        self.players = [PlayerSeat() for _ in range(4)]
 
         self.current_turn = 0
         self.dora_indicators = []
         self.dead_tiles_34 = [0] * 34  # 全局计数器，供 AI 算进张用
         self.is_game_over = False
         self.winner = -1
+        self.events: List[Event] = []
+        self.pending_call: Optional[Tuple[int, int]] = None  # 等待人类选择是否鸣牌的 (放铳者, 牌 34)
+        self.defense = DefenseTracker()  # 四家的安全度表 (只用公开信息)，随打牌/鸣牌/宝牌增量更新
 
-        # 开局发牌
-        self._deal_initial_hands()
+    def __getstate__(self):
+        return (self.initial_wall, len(self.wall), self.players, self.current_turn, bytes(self.dora_indicators),
+                self.dead_tiles_34, self.is_game_over, self.winner, encode_events(self.events), self.pending_call)
 
-    def _deal_initial_hands(self):
-        """洗牌并给四家发牌"""
+    def __setstate__(self, state):
+        (self.initial_wall, wall_len, self.players, self.current_turn, dora, self.dead_tiles_34,
+         self.is_game_over, self.winner, events, self.pending_call) = state
+        self.wall = bytearray(self.initial_wall[:wall_len])  # 牌山总是从末尾摸，剩余部分是初始牌山的前缀
+        self.dora_indicators = list(dora)
+        self.events = decode_events(events)
+        self.rebuild_defense()
+
+    def rebuild_defense(self):
+        """由可见牌、各家打过的牌与副露数重建安全度表 (对局内没有立直，结果与增量维护的相同)"""
+        self.defense = DefenseTracker(self.dead_tiles_34, genbutsu=[p.discarded for p in self.players],
+                                      melds=[len(p.melds) for p in self.players])
+
+    def _deal_hands(self):
         for _ in range(13):
             for i in range(4):
-                self.players[i]["hand_136"].append(self.wall.pop())
+                self.players[i].add(self.wall.pop())
 
         # 给庄家 (玩家0) 多发一张，开始回合
-        self.players[0]["hand_136"].append(self.wall.pop())
+        self.players[0].add(self.wall.pop())
+
+    def _deal_initial_hands(self):
+        """洗牌并给四家发牌"""
+        self._deal_hands()
+        # 翻开第一张宝牌指示牌 (第 1 号事件)
+        self.reveal_dora()
 
-        # 翻开第一张宝牌指示牌
+    @property
+    def seq(self) -> int:
+        """最新事件的序号 (0 表示刚配完牌)"""
+        return len(self.events)
+
+    def _emit(self, kind: str, seat: int = -1, tile: int = -1, extra: int = -1):
+        self.events.append((kind, seat, tile, extra))
+
+    def reveal_dora(self):
         dora_tile = self.wall.pop()
         self.dora_indicators.append(dora_tile)
         self.dead_tiles_34[dora_tile // 4] += 1
+        self.defense.on_visible(dora_tile // 4)
+        self._emit('dora', tile=dora_tile)
 
     def get_hand_34(self, player_index: int) -> List[int]:
-        """将玩家的 136 格式手牌转换为 AI 引擎需要的 34 计数格式"""
-        hand_34 = [0] * 34
-        for t in self.players[player_index]["hand_136"]:
-            hand_34[t // 4] += 1
-        return hand_34
+        """玩家手牌的 34 计数格式 (返回副本，调用方可以随意修改)"""
+        return list(self.players[player_index].counts)
+
+    def hand_count(self, player_index: int) -> int:
+        return self.players[player_index].tile_count
 
     def get_discards_34(self, player_index: int) -> List[int]:
         """获取玩家打出的牌 (转换为 34 格式方便前端渲染)"""
-        return [t // 4 for t in self.players[player_index]["discards_136"]]
+        return [t // 4 for t in self.players[player_index].discards]
 
     def player_draw(self, player_index: int) -> bool:
         """玩家摸牌，如果牌山空了返回 False (流局)"""
         if not self.wall:
             self.is_game_over = True
+            self._emit('ryuukyoku', player_index)
             return False
-        self.players[player_index]["hand_136"].append(self.wall.pop())
+        tile_136 = self.wall.pop()
+        self.players[player_index].add(tile_136)
+        self._emit('draw', player_index, tile_136)
         return True
 
     def player_discard(self, player_index: int, tile_34: int):
         """玩家打出一张牌 (传入 34 格式 ID，系统自动在手里找对应的物理牌扔掉)"""
-        for t in self.players[player_index]["hand_136"]:
-            if t // 4 == tile_34:
-                self.players[player_index]["hand_136"].remove(t)
-                self.players[player_index]["discards_136"].append(t)
-                self.dead_tiles_34[tile_34] += 1
-                break
+        seat = self.players[player_index]
+        tile_136 = seat.remove(tile_34)
+        if tile_136 >= 0:
+            seat.discards.append(tile_136)
+            seat.discarded |= 1 << tile_34
+            self.dead_tiles_34[tile_34] += 1
+            self.defense.on_discard(player_index, tile_34)
+            self._emit('discard', player_index, tile_136)
         # 轮转回合
         self.current_turn = (self.current_turn + 1) % 4
 
+    def declare_ron(self, player_index: int, discarder_index: int):
+        """荣和：把打牌者牌河里最后一张牌收进 player_index 的手里并结束对局"""
+        tile_136 = self.players[discarder_index].discards.pop()
+        self.players[player_index].add(tile_136)
+        self.is_game_over, self.winner = True, player_index
+        self.pending_call = None
+        self._emit('ron', player_index, tile_136, discarder_index)
+
+    def declare_tsumo(self, player_index: int):
+        self.is_game_over, self.winner = True, player_index
+        self._emit('tsumo', player_index)
+
+    def offer_call(self, discarder_index: int, tile_34: int):
+        """挂起对局，等待人类决定是否鸣 discarder_index 打出的牌"""
+        self.pending_call = (discarder_index, tile_34)
+        self._emit('prompt', 0, tile_34, discarder_index)
+
+    def pass_call(self) -> Optional[Tuple[int, int]]:
+        """人类放弃鸣牌，返回被放弃的 (放铳者, 牌 34)"""
+        pending, self.pending_call = self.pending_call, None
+        if pending: self._emit('pass', 0, pending[1], pending[0])
+        return pending
+
     def can_call_pon(self, player_index: int, tile_34: int) -> bool:
         """判定某玩家是否可以碰"""
         if player_index == self.current_turn: return False  # 不能碰自己打的
-        hand_34 = self.get_hand_34(player_index)
-        return hand_34[tile_34] >= 2
+        return self.players[player_index].counts[tile_34] >= 2
 
     def can_call_kan(self, player_index: int, tile_34: int) -> bool:
         """判定某玩家是否可以明杠"""
         if player_index == self.current_turn: return False
-        hand_34 = self.get_hand_34(player_index)
-        return hand_34[tile_34] == 3
+        return self.players[player_index].counts[tile_34] == 3
 
     def perform_meld(self, player_index: int, tile_34: int, meld_type: str, discarder_index: int):
         """执行副露动作"""
+        seat = self.players[player_index]
         # 1. 从手中移除相应数量的牌
         num_to_remove = 2 if meld_type == 'pon' else 3
-        removed = 0
-        for t in list(self.players[player_index]["hand_136"]):
-            if t // 4 == tile_34 and removed < num_to_remove:
-                self.players[player_index]["hand_136"].remove(t)
-                removed += 1
+        for _ in range(min(num_to_remove, seat.counts[tile_34])):
+            seat.remove(tile_34)
 
         # 2. 将打出的牌从牌河中捞回，并加入副露区
-        if self.players[discarder_index]["discards_136"]:
-            self.players[discarder_index]["discards_136"].pop()
+        if self.players[discarder_index].discards:
+            self.players[discarder_index].discards.pop()
             self.dead_tiles_34[tile_34] -= 1  # 牌河计数减1
 
-        self.players[player_index]["melds"].append({"type": meld_type, "tile": tile_34})
+        seat.melds.append({"type": meld_type, "tile": tile_34})
+        self.pending_call = None
 
         # 3. 记录副露用掉的牌到全局可见池
         # 实际上副露的牌已经全部公开，在计算 AI 进张时应视为死牌
         self.dead_tiles_34[tile_34] += num_to_remove + 1  # (手中2/3张 + 捞回的1张)
+        self.defense.on_visible(tile_34, num_to_remove)
+        self.defense.on_meld(player_index)
 
         # 4. 鸣牌后，回合直接跳到该玩家，进入其出牌阶段（不摸牌）
-        self.current_turn = player_index
\ No newline at end of file
+        self.current_turn = player_index
+        self._emit(meld_type, player_index, tile_34, discarder_index)
+
+    def apply_event(self, event: Event):
+        """按事件推进对局 (重放用，推进时会重新记录同样的事件)"""
+        kind, seat, tile, extra = event
+        if kind == 'draw' or kind == 'ryuukyoku': self.player_draw(seat)
+        elif kind == 'discard': self.player_discard(seat, tile // 4)
+        elif kind in ('pon', 'kan'): self.perform_meld(seat, tile, kind, extra)
+        elif kind == 'ron': self.declare_ron(seat, extra)
+        elif kind == 'tsumo': self.declare_tsumo(seat)
+        elif kind == 'dora': self.reveal_dora()
+        elif kind == 'prompt': self.offer_call(extra, tile)
+        elif kind == 'pass': self.pass_call()
+        else: raise ValueError(f"未知的对局事件: {kind}")
+
+    @classmethod
+    def replay(cls, wall: bytes, events: Iterable[Event]) -> 'MatchManager':
+        """从初始牌山重放事件，得到任意序号时的对局快照"""
+        match = cls.__new__(cls)
+        match._reset(wall)
+        match._deal_hands()
+        for event in events:
+            match.apply_event(event)
+        return match
+
+    def snapshot(self, seq: int) -> 'MatchManager':
+        """序号 seq 时的对局状态 (0 <= seq <= self.seq)"""
+        if not 0 <= seq <= self.seq:
+            raise ValueError(f"序号超出范围: {seq}")
+        return MatchManager.replay(self.initial_wall, self.events[:seq])
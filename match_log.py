@@ -0,0 +1,267 @@
+import argparse
+import bisect
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from match_engine import EVENT_KINDS, Event, MatchManager, encode_events
+from utils import pack_hand_bytes, unpack_hand_bytes
+
+# 每局两个只追加的文件：
+#   <match_id>.mjev   文件头 (魔数 + 版本 + 136 字节初始牌山) + 定长 4 字节事件记录
+#                     (种类, 座位 + 1, 牌 + 1, 附加 + 1)，第 seq 号事件位于 HEADER_SIZE + 4 * (seq - 1)
+#   <match_id>.mjsnap 周期快照：[seq u32][长度 u32][局面] 依次追加，局面格式见 encode_state
+# 事件文件是唯一的事实来源；快照只用来跳过前面的重放，序号超出事件文件的快照 (写到一半崩溃) 被忽略。
+MAGIC = b'MJEV'
+VERSION = 1
+HEADER = struct.Struct('<4sB136s')
+HEADER_SIZE = HEADER.size
+RECORD_SIZE = 4
+SNAPSHOT_HEADER = struct.Struct('<II')
+SNAPSHOT_INTERVAL = 32  # 每写入多少个事件补一个快照
+
+MELD_KINDS = ('pon', 'kan')
+
+_STATE_HEAD = struct.Struct('<HbbbbB')  # 牌山剩余, 当前回合, 赢家, 挂起鸣牌 (放铳者, 牌), 是否结束
+
+
+def log_paths(directory: str, match_id: str) -> Tuple[str, str]:
+    """一局的 (事件文件, 快照文件) 路径"""
+    base = os.path.join(directory, match_id)
+    return base + '.mjev', base + '.mjsnap'
+
+
+def decode_records(records: np.ndarray) -> List[Event]:
+    """(n, 4) uint8 记录 -> 事件列表"""
+    return [(EVENT_KINDS[k], s - 1, t - 1, e - 1) for k, s, t, e in records.tolist()]
+
+
+def encode_state(match: MatchManager) -> bytes:
+    """
+    对局局面 (不含事件历史) 的紧凑编码。牌山总是初始牌山的前缀，只记剩余张数；
+    手牌只记 136 位物理牌位图 (计数由位图推出)，可见牌计数用 3 bit 紧凑编码。
+    """
+    pending = match.pending_call or (-1, -1)
+    parts = [
+        _STATE_HEAD.pack(len(match.wall), match.current_turn, match.winner, pending[0], pending[1],
+                         1 if match.is_game_over else 0),
+        pack_hand_bytes(match.dead_tiles_34),
+        bytes([len(match.dora_indicators)]), bytes(match.dora_indicators)
+    ]
+    for seat in match.players:
+        parts += [
+            seat.bits.to_bytes(17, 'little'), seat.discarded.to_bytes(5, 'little'),
+            bytes([len(seat.discards)]), bytes(seat.discards),
+            bytes([len(seat.melds)]), bytes(v for m in seat.melds for v in (MELD_KINDS.index(m['type']), m['tile']))
+        ]
+    return b''.join(parts)
+
+
+def decode_state(wall: bytes, blob: bytes) -> MatchManager:
+    """encode_state 的逆操作 (events 为空，由调用方补上)"""
+    match = MatchManager.__new__(MatchManager)
+    match._reset(wall)
+    wall_len, match.current_turn, match.winner, discarder, tile, over = _STATE_HEAD.unpack_from(blob)
+    del match.wall[wall_len:]
+    match.pending_call = (discarder, tile) if discarder >= 0 else None
+    match.is_game_over = bool(over)
+    pos = _STATE_HEAD.size
+    match.dead_tiles_34 = unpack_hand_bytes(blob[pos:pos + 13])
+    pos += 13
+    match.dora_indicators = list(blob[pos + 1:pos + 1 + blob[pos]])
+    pos += 1 + blob[pos]
+    for seat in match.players:
+        seat.bits = int.from_bytes(blob[pos:pos + 17], 'little')
+        seat.discarded = int.from_bytes(blob[pos + 17:pos + 22], 'little')
+        pos += 22
+        seat.discards = bytearray(blob[pos + 1:pos + 1 + blob[pos]])
+        pos += 1 + blob[pos]
+        n = blob[pos]
+        seat.melds = [{"type": MELD_KINDS[blob[pos + 1 + 2 * i]], "tile": blob[pos + 2 + 2 * i]} for i in range(n)]
+        pos += 1 + 2 * n
+        for t_id in range(34):
+            seat.counts[t_id] = bin((seat.bits >> (t_id * 4)) & 0xF).count('1')
+        seat.tile_count = sum(seat.counts)
+    match.rebuild_defense()
+    return match
+
+
+class MatchLogWriter:
+    """
+    把对局事件追加写入 directory 下的二进制日志。每次 append 只写入上次之后的新事件，
+    每满 snapshot_interval 个事件追加一个快照，还原任意序号最多只需重放 snapshot_interval - 1 个事件。
+    调用方负责同一局的串行写入 (MatchRegistry.open 持有对局锁)。
+    """
+
+    def __init__(self, directory: str, snapshot_interval: int = SNAPSHOT_INTERVAL):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, match_id: str, match: MatchManager):
+        event_path, snap_path = log_paths(self.directory, match_id)
+        try:
+            written = (os.path.getsize(event_path) - HEADER_SIZE) // RECORD_SIZE
+        except OSError:
+            written = -1
+        if written < 0:
+            with open(event_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, match.initial_wall))
+            written = 0
+        if written >= match.seq: return
+        with open(event_path, 'ab') as f:
+            f.write(encode_events(match.events[written:]))
+
+        # 新写入的事件越过的每个整数倍序号都补一个快照：恰好是当前序号时直接编码对局本身，
+        # 否则从上一个快照 (没有则从初始牌山) 开始只重放增量事件
+        interval = self.snapshot_interval
+        boundaries = range((written // interval + 1) * interval, match.seq + 1, interval)
+        if not boundaries: return
+        state = None
+        if boundaries[0] < match.seq:
+            last = _last_snapshot(snap_path)
+            if last is None:
+                state = MatchManager.replay(match.initial_wall, ())
+            else:
+                state = decode_state(match.initial_wall, last[1])
+                state.events = match.events[:last[0]]
+        with open(snap_path, 'ab') as f:
+            for seq in boundaries:
+                if seq == match.seq:
+                    blob = encode_state(match)
+                else:
+                    for event in match.events[state.seq:seq]:
+                        state.apply_event(event)
+                    blob = encode_state(state)
+                f.write(SNAPSHOT_HEADER.pack(seq, len(blob)) + blob)
+
+
+def _parse_snapshots(data: bytes) -> Tuple[List[int], List[int]]:
+    """快照文件内容 -> (序号列表, 局面偏移列表)，按序号递增；末尾写了一半的快照被忽略"""
+    seqs, offsets = [], []
+    pos = 0
+    while pos + SNAPSHOT_HEADER.size <= len(data):
+        seq, size = SNAPSHOT_HEADER.unpack_from(data, pos)
+        pos += SNAPSHOT_HEADER.size
+        if pos + size > len(data): break
+        seqs.append(seq)
+        offsets.append(pos)
+        pos += size
+    return seqs, offsets
+
+
+def _last_snapshot(snap_path: str) -> Optional[Tuple[int, bytes]]:
+    """快照文件里最后一个完整快照的 (序号, 局面)，只读各快照头与最后一个局面"""
+    try:
+        f = open(snap_path, 'rb')
+    except OSError:
+        return None
+    last = None
+    with f:
+        end = os.fstat(f.fileno()).st_size
+        pos = 0
+        while pos + SNAPSHOT_HEADER.size <= end:
+            f.seek(pos)
+            seq, size = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+            if pos + SNAPSHOT_HEADER.size + size > end: break
+            last = (seq, pos + SNAPSHOT_HEADER.size, size)
+            pos += SNAPSHOT_HEADER.size + size
+        if last is None: return None
+        f.seek(last[1])
+        return last[0], f.read(last[2])
+
+
+class MatchLogReader:
+    """
+    内存映射读取一局的事件日志：事件按序号直接定位，state_at(seq) 从不晚于 seq 的最近快照开始重放，
+    结果与 MatchManager.snapshot(seq) 相同。
+    """
+
+    def __init__(self, event_path: str, snap_path: Optional[str] = None):
+        with open(event_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.initial_wall = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"不是可识别的对局日志: {event_path}")
+        count = (len(self._mmap) - HEADER_SIZE) // RECORD_SIZE
+        self.records = np.frombuffer(self._mmap, dtype=np.uint8, count=count * RECORD_SIZE,
+                                     offset=HEADER_SIZE).reshape(count, RECORD_SIZE)
+
+        self._snap_data = b''
+        self._snap_seqs: List[int] = []
+        self._snap_offsets: List[int] = []
+        snap_path = snap_path or event_path[:-len('.mjev')] + '.mjsnap'
+        if os.path.exists(snap_path):
+            with open(snap_path, 'rb') as f:
+                self._snap_data = f.read()
+            self._snap_seqs, self._snap_offsets = _parse_snapshots(self._snap_data)
+
+    @classmethod
+    def open(cls, directory: str, match_id: str) -> 'MatchLogReader':
+        return cls(*log_paths(directory, match_id))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def events(self, start: int = 0, stop: Optional[int] = None) -> List[Event]:
+        """第 start+1 到第 stop 号事件 (与 MatchManager.events[start:stop] 相同)"""
+        return decode_records(self.records[start:stop])
+
+    def state_at(self, seq: int) -> MatchManager:
+        """序号 seq 时的对局状态 (0 <= seq <= len(self))"""
+        if not 0 <= seq <= len(self):
+            raise ValueError(f"序号超出范围: {seq}")
+        i = bisect.bisect_right(self._snap_seqs, seq) - 1
+        if i < 0:
+            return MatchManager.replay(self.initial_wall, self.events(0, seq))
+        base = self._snap_seqs[i]
+        offset = self._snap_offsets[i]
+        size = SNAPSHOT_HEADER.unpack_from(self._snap_data, offset - SNAPSHOT_HEADER.size)[1]
+        match = decode_state(self.initial_wall, self._snap_data[offset:offset + size])
+        match.events = self.events(0, base)
+        for event in self.events(base, seq):
+            match.apply_event(event)
+        return match
+
+    def close(self):
+        self.records = None
+        self._mmap.close()
+
+
+def summarize_logs(directory: str) -> Dict:
+    """目录下全部对局日志的汇总：局数、事件数、和牌/流局分布"""
+    games, events, wins = 0, 0, [0] * 4
+    ryuukyoku = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.mjev'): continue
+        reader = MatchLogReader(os.path.join(directory, name))
+        games += 1
+        events += len(reader)
+        if len(reader):
+            kind, seat = EVENT_KINDS[reader.records[-1, 0]], int(reader.records[-1, 1]) - 1
+            if kind in ('ron', 'tsumo'): wins[seat] += 1
+            elif kind == 'ryuukyoku': ryuukyoku += 1
+        reader.close()
+    return {"games": games, "events": events, "wins": wins, "ryuukyoku": ryuukyoku}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对局二进制事件日志查询")
+    parser.add_argument("directory", help="日志目录 (MAHJONG_MATCH_LOG / simulate.py --log-dir)")
+    parser.add_argument("--match", help="只看这一局 (对局 ID)")
+    parser.add_argument("--seq", type=int, help="配合 --match：输出该序号时四家的手牌")
+    args = parser.parse_args()
+
+    if args.match:
+        from utils import hand_array_to_tenhou_str
+        reader = MatchLogReader.open(args.directory, args.match)
+        seq = len(reader) if args.seq is None else args.seq
+        state = reader.state_at(seq)
+        print(f"事件数: {len(reader)}  序号: {seq}  牌山剩余: {len(state.wall)}")
+        for i in range(4):
+            print(f"  P{i}: {hand_array_to_tenhou_str(state.get_hand_34(i))}")
+    else:
+        print(summarize_logs(args.directory))
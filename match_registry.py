@@ -0,0 +1,225 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from match_engine import MatchManager
+from match_log import MatchLogWriter
+
+
+class MatchNotFound(LookupError):
+    """对局不存在 (ID 错误或已因闲置被回收)"""
+
+
+class MatchLimitReached(RuntimeError):
+    """同时进行的对局数已达上限"""
+
+
+class MatchBusy(RuntimeError):
+    """对局正被其它请求占用，等待锁超时"""
+
+
+class MemoryMatchStore:
+    """进程内对局存储 (单 worker 部署的默认选项)，对局对象直接驻留内存"""
+
+    def __init__(self):
+        self._matches: Dict[str, Tuple[MatchManager, float]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def load(self, match_id: str) -> Optional[MatchManager]:
+        entry = self._matches.get(match_id)
+        return entry[0] if entry else None
+
+    def save(self, match_id: str, match: MatchManager):
+        self._matches[match_id] = (match, time.time())
+
+    def delete(self, match_id: str):
+        with self._guard:
+            self._matches.pop(match_id, None)
+            self._locks.pop(match_id, None)
+
+    def count(self) -> int:
+        return len(self._matches)
+
+    def evict_idle(self, cutoff: float) -> int:
+        """删除最后活动时间早于 cutoff 且当前未被占用的对局"""
+        removed = 0
+        with self._guard:
+            for match_id, (_, updated) in list(self._matches.items()):
+                lock = self._locks.get(match_id)
+                if updated < cutoff and not (lock and lock.locked()):
+                    del self._matches[match_id]
+                    self._locks.pop(match_id, None)
+                    removed += 1
+        return removed
+
+    def acquire(self, match_id: str, timeout: float) -> bool:
+        with self._guard:
+            # 对局不存在时不创建锁，交给调用方抛出 MatchNotFound
+            if match_id not in self._matches:
+                return True
+            lock = self._locks.setdefault(match_id, threading.Lock())
+        return lock.acquire(timeout=timeout)
+
+    def release(self, match_id: str):
+        lock = self._locks.get(match_id)
+        if lock and lock.locked():
+            lock.release()
+
+
+class SQLiteMatchStore:
+    """
+    基于本地 SQLite 文件的对局存储：对局序列化后落盘，worker 重启后仍可继续，
+    同一台机器上的任意 worker 都能接手同一局。
+    跨进程的单局互斥通过带过期时间的租约 (lock_owner / lock_expires) 实现。
+    """
+
+    LEASE_SECONDS = 30.0
+    POLL_INTERVAL = 0.02
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._owner = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS matches ("
+                         "id TEXT PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL, "
+                         "lock_owner TEXT, lock_expires REAL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _lock_token(self) -> str:
+        # 同一进程内不同线程也必须互斥，所以租约持有者精确到线程
+        return f"{self._owner}:{threading.get_ident()}"
+
+    def load(self, match_id: str) -> Optional[MatchManager]:
+        row = self._conn().execute("SELECT data FROM matches WHERE id = ?", (match_id,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def save(self, match_id: str, match: MatchManager):
+        data = pickle.dumps(match, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._conn() as conn:
+            updated = conn.execute("UPDATE matches SET data = ?, updated = ? WHERE id = ?",
+                                   (data, time.time(), match_id)).rowcount
+            if not updated:
+                conn.execute("INSERT INTO matches (id, data, updated) VALUES (?, ?, ?)",
+                             (match_id, data, time.time()))
+
+    def delete(self, match_id: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM matches WHERE id = ?", (match_id,))
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+
+    def evict_idle(self, cutoff: float) -> int:
+        with self._conn() as conn:
+            return conn.execute(
+                "DELETE FROM matches WHERE updated < ? AND (lock_owner IS NULL OR lock_expires < ?)",
+                (cutoff, time.time())).rowcount
+
+    def acquire(self, match_id: str, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        token = self._lock_token()
+        while True:
+            now = time.time()
+            with self._conn() as conn:
+                acquired = conn.execute(
+                    "UPDATE matches SET lock_owner = ?, lock_expires = ? "
+                    "WHERE id = ? AND (lock_owner IS NULL OR lock_expires < ?)",
+                    (token, now + self.LEASE_SECONDS, match_id, now)).rowcount
+                exists = acquired or conn.execute(
+                    "SELECT 1 FROM matches WHERE id = ?", (match_id,)).fetchone() is not None
+            # 对局不存在时不用等待，交给调用方抛出 MatchNotFound
+            if acquired or not exists:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL)
+
+    def release(self, match_id: str):
+        with self._conn() as conn:
+            conn.execute("UPDATE matches SET lock_owner = NULL, lock_expires = NULL WHERE id = ? AND lock_owner = ?",
+                         (match_id, self._lock_token()))
+
+
+def create_match_store(spec: str):
+    """'memory' -> MemoryMatchStore；'sqlite:/path/to/matches.db' -> SQLiteMatchStore"""
+    if spec.startswith('sqlite:'):
+        return SQLiteMatchStore(spec[len('sqlite:'):])
+    if spec == 'memory':
+        return MemoryMatchStore()
+    raise ValueError(f"未知的对局存储配置: {spec}")
+
+
+class MatchRegistry:
+    """
+    多对局注册表：按对局 ID 管理 MatchManager。
+    - 新建对局前先回收闲置超过 idle_timeout 秒的对局，并受 max_matches 上限约束
+    - open() 期间持有该局的锁，同一局的并发请求串行执行，退出时写回存储
+    - event_log 不为空时，每次写回后把新增事件追加到该局的二进制日志 (match_log)，供离线归档与查询
+    """
+
+    def __init__(self, store, max_matches: int = 100, idle_timeout: float = 1800.0, lock_timeout: float = 10.0,
+                 event_log: Optional[MatchLogWriter] = None):
+        self.store = store
+        self.max_matches = max_matches
+        self.idle_timeout = idle_timeout
+        self.lock_timeout = lock_timeout
+        self.event_log = event_log
+
+    @classmethod
+    def from_env(cls) -> 'MatchRegistry':
+        """MAHJONG_MATCH_STORE / MAHJONG_MAX_MATCHES / MAHJONG_MATCH_IDLE_TIMEOUT / MAHJONG_MATCH_LOG"""
+        log_dir = os.environ.get('MAHJONG_MATCH_LOG')
+        return cls(create_match_store(os.environ.get('MAHJONG_MATCH_STORE', 'memory')),
+                   max_matches=int(os.environ.get('MAHJONG_MAX_MATCHES', 100)),
+                   idle_timeout=float(os.environ.get('MAHJONG_MATCH_IDLE_TIMEOUT', 1800)),
+                   event_log=MatchLogWriter(log_dir) if log_dir else None)
+
+    def evict_idle(self) -> int:
+        return self.store.evict_idle(time.time() - self.idle_timeout)
+
+    def create(self) -> Tuple[str, MatchManager]:
+        """开新局，返回 (对局 ID, 对局)"""
+        self.evict_idle()
+        if self.store.count() >= self.max_matches:
+            raise MatchLimitReached("当前对局数已满，请稍后再试")
+        match_id = uuid.uuid4().hex
+        match = MatchManager()
+        self.store.save(match_id, match)
+        if self.event_log: self.event_log.append(match_id, match)
+        return match_id, match
+
+    @contextmanager
+    def open(self, match_id: Optional[str], save: bool = True) -> Iterator[MatchManager]:
+        """加锁取出对局，with 块结束时写回 (save=False 表示只读，不写回)"""
+        if not match_id:
+            raise MatchNotFound("No match")
+        if not self.store.acquire(match_id, self.lock_timeout):
+            raise MatchBusy("对局正在处理其它请求")
+        try:
+            match = self.store.load(match_id)
+            if match is None:
+                raise MatchNotFound("No match")
+            yield match
+            if save:
+                self.store.save(match_id, match)
+                if self.event_log: self.event_log.append(match_id, match)
+        finally:
+            self.store.release(match_id)
+
+    def remove(self, match_id: str):
+        self.store.delete(match_id)
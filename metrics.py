@@ -0,0 +1,191 @@
+import cProfile
+import functools
+import itertools
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 默认直方图分桶 (秒)，覆盖从单次向听计算到深度 EV 搜索的量级
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{k}="{str(v)}"' for k, v in zip(labelnames, values)]
+    if extra: parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [各分桶计数..., 总和, 总次数]
+        self._values: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float):
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, row in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, row):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {row[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {row[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {row[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    轻量指标注册表，输出 Prometheus 文本格式。
+    enabled 为 False 时所有埋点只多一次布尔判断。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics = []
+        # 采集时回调：返回 [(指标名, 说明, 类型, [(标签字典, 值), ...]), ...]，用于缓存命中率等瞬时值
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict, float]]]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, documentation, metric_type, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(enabled=os.environ.get('MAHJONG_METRICS', '1') != '0')
+
+ENGINE_CALL_SECONDS = registry.histogram(
+    'mahjong_engine_call_seconds', 'RuleEngine hot-path call latency', ('method',))
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'mahjong_http_request_seconds', 'Flask route latency (until the response object is returned)', ('route',))
+HTTP_REQUESTS_TOTAL = registry.counter(
+    'mahjong_http_requests_total', 'Flask requests by route and status code', ('route', 'status'))
+
+
+def timed(method: str):
+    """给 RuleEngine 方法计时计数的装饰器 (关闭指标时直接透传)"""
+
+    def decorator(fn):
+        labels = (method,)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                ENGINE_CALL_SECONDS.observe(labels, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def cache_collector(caches: Dict[str, object]) -> Callable:
+    """把一组 LRUCache/SQLiteCache 的 stats() 转成命中率与计数指标"""
+
+    def collect():
+        ratio, counts, sizes = [], [], []
+        for name, cache in caches.items():
+            stats = cache.stats()
+            if stats['hit_ratio'] is not None: ratio.append(({'cache': name}, stats['hit_ratio']))
+            for key in ('hits', 'misses', 'evictions'):
+                counts.append(({'cache': name, 'result': key}, stats[key]))
+            sizes.append(({'cache': name}, stats['size']))
+        return [
+            ('mahjong_cache_hit_ratio', 'Cache hit ratio since process start', 'gauge', ratio),
+            ('mahjong_cache_events_total', 'Cache hits / misses / evictions', 'counter', counts),
+            ('mahjong_cache_entries', 'Current number of cached entries', 'gauge', sizes),
+        ]
+
+    return collect
+
+
+class SamplingProfiler:
+    """
+    按 1/N 的比例对请求做 cProfile，并把统计结果写到 directory 下 (可用 snakeviz / pstats 查看)。
+    every 为 0 时关闭。
+    """
+
+    def __init__(self, every: int = 0, directory: str = 'profiles'):
+        self.every = every
+        self.directory = directory
+        self._counter = itertools.count(1)
+
+    @classmethod
+    def from_env(cls) -> 'SamplingProfiler':
+        """MAHJONG_PROFILE_SAMPLE (每 N 个请求采样一次) / MAHJONG_PROFILE_DIR"""
+        return cls(int(os.environ.get('MAHJONG_PROFILE_SAMPLE', 0)), os.environ.get('MAHJONG_PROFILE_DIR', 'profiles'))
+
+    def maybe_start(self) -> Optional[cProfile.Profile]:
+        if self.every <= 0 or next(self._counter) % self.every:
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def finish(self, profiler: cProfile.Profile, label: str):
+        profiler.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        safe_label = label.strip('/').replace('/', '_') or 'root'
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{safe_label}-{time.perf_counter_ns()}.prof"
+        profiler.dump_stats(os.path.join(self.directory, filename))
@@ -1,4 +1,4 @@
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional
 
 
 class TileConst:
@@ -54,6 +54,16 @@ class PlayerState:
         else:
             raise ValueError(f"手里没有这张牌(ID:{tile_id})，无法打出！")
 
+    def update_furiten(self, waits: Iterable[int], pending_discard: Optional[int] = None) -> bool:
+        """
+        根据听牌的和了牌与自己的牌河判定舍牌振听 (不含同巡/立直振听)。
+        pending_discard 为即将打出的牌，同样计入牌河。
+        """
+        river = set(self.discards)
+        if pending_discard is not None: river.add(pending_discard)
+        self.is_furiten = any(t in river for t in waits)
+        return self.is_furiten
+
 
 class GameState:
     """
@@ -0,0 +1,123 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class LookaheadSearch:
+    """
+    打点期望的前瞻搜索 (expectimax)：
+    - 机会节点：按剩余枚数加权遍历有效进张 (只展开能推进向听的摸牌)
+    - 决策节点：摸牌后在保持向听推进的打法中取期望最高的一种
+    - 听牌节点：对每张和了牌精确算分 (RuleEngine.calculate_exact_score，带 LRU 缓存)
+    depth 为听牌之前还允许展开的摸牌层数 (2 即可覆盖两向听手)。
+    置换表按手牌计数向量缓存节点价值，不同打法/摸牌顺序汇合到同一手牌时只计算一次。
+    节点的有效进张与保持向听的打法只与手牌有关，取自引擎的掩码缓存 (跨搜索复用)，
+    搜索本身只按剩余枚数做掩码求和。
+    每次展开 (包括深度用完时按"有效进张概率 x LEAF_SCORE"估值的叶子) 与听牌节点的每次精确算分都计入节点预算
+    (不论算分缓存是否命中，保证计数只取决于局面)；预算用完后不再展开新节点、不再算分：
+    机会节点按自己的有效进张估值 (与深度用完的叶子相同)，决策节点直接取 LEAF_SCORE，并记入 cutoffs。cutoffs 不为 0 的搜索结果是截断的估计值，
+    调用方应把受影响的候选标记为未算完 (见 RuleEngine.evaluate_ev_efficiency)。
+    只用节点预算 (deadline 为空) 时，同一局面的结果与机器速度、缓存冷热无关。
+
+    单次搜索内剩余枚数按根局面计算，再扣掉手里比根局面多出来的牌，因此节点价值只取决于手牌本身。
+    """
+
+    # 来不及展开 (或超出深度) 时，每张有效进张的估计打点，与原先听牌前的固定估值一致
+    LEAF_SCORE = 1000
+
+    def __init__(self, engine, hand: List[int], visible_tiles: List[int], melds_data: Optional[List[Dict]] = None,
+                 dora_indicators: Optional[List[int]] = None, require_yaku: bool = True, round_wind: int = 27,
+                 player_wind: int = 28, depth: int = 2, node_budget: int = 200, deadline: Optional[float] = None):
+        self.engine = engine
+        self.root = np.asarray(hand, dtype=np.int8)
+        self.left_root = np.clip(4 - np.asarray(visible_tiles, dtype=np.int64), 0, None)
+        self.unseen = max(int(self.left_root.sum()), 1)
+        self.melds_data = melds_data
+        self.dora_indicators = dora_indicators
+        self.require_yaku = require_yaku
+        self.round_wind, self.player_wind = round_wind, player_wind
+        self.can_riichi = not melds_data or all(m['type'] == 'kan' for m in melds_data)
+        self.depth = depth
+        self.node_budget = node_budget
+        self.deadline = deadline  # time.monotonic() 时间点
+
+        self.table: Dict[Tuple[bytes, int], float] = {}
+        self.nodes = 0
+        self.cutoffs = 0  # 因预算用完而按估值截断的节点数
+
+    def exhausted(self) -> bool:
+        return self.nodes >= self.node_budget or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    @property
+    def truncated(self) -> bool:
+        return self.cutoffs > 0
+
+    def _left(self, hand: np.ndarray) -> np.ndarray:
+        return np.maximum(self.left_root - np.maximum(hand.astype(np.int64) - self.root, 0), 0)
+
+    # --- 决策节点 (3n+2 张) ---
+    def draw_values(self, drawn: np.ndarray, depth: Optional[int] = None) -> List[float]:
+        """
+        一批摸牌后的手牌 (k, 34)：每一行取"打出一张、保持向听推进"的最优后续价值。
+        调用方保证这些手牌都还没和牌。
+        """
+        depth = self.depth if depth is None else depth
+        if len(drawn) == 0: return []
+        if self.exhausted():
+            self.cutoffs += 1
+            return [float(self.LEAF_SCORE)] * len(drawn)
+        _, keep = self.engine.keep_masks(drawn)
+
+        rows, discard = np.nonzero(keep)
+        after = drawn[rows]
+        after[np.arange(len(rows)), discard] -= 1
+
+        values = [0.0] * len(drawn)
+        for r, child in zip(rows.tolist(), after):
+            v = self.value(child, depth - 1)
+            if v > values[r]: values[r] = v
+        return values
+
+    # --- 机会节点 (3n+1 张) ---
+    def value(self, hand: np.ndarray, depth: int) -> float:
+        """3n+1 张手牌在下一次摸牌时的期望价值 (已按剩余枚数归一化)"""
+        key = (hand.tobytes(), max(depth, 0))
+        cached = self.table.get(key)
+        if cached is not None: return cached
+        cutoffs = self.cutoffs
+
+        current, advance = self.engine.advance_mask(hand)
+        left = self._left(hand)
+        eff_tiles = np.flatnonzero(advance & (left > 0))
+        eff_left = left[eff_tiles]
+        eff_hands = np.repeat(hand[None, :], len(eff_tiles), axis=0)
+        eff_hands[np.arange(len(eff_tiles)), eff_tiles] += 1
+
+        self.nodes += 1
+        if current > 0 and (depth <= 0 or self.exhausted()):
+            # 超出深度 (或预算用完)：按自己的有效进张概率估值
+            if depth > 0: self.cutoffs += 1
+            total = float(eff_left.sum()) * self.LEAF_SCORE
+        elif current == 0:
+            total = 0.0
+            for k, (t, n, won) in enumerate(zip(eff_tiles.tolist(), eff_left.tolist(), eff_hands)):
+                # 精确算分是搜索里最贵的一步 (复杂形一次可达上百毫秒)，每次调用都计入节点预算
+                if self.exhausted():
+                    self.cutoffs += 1
+                    total += float(eff_left[k:].sum()) * self.LEAF_SCORE
+                    break
+                self.nodes += 1
+                score, _ = self.engine.calculate_exact_score(
+                    won.tolist(), t, is_riichi=self.can_riichi, melds_data=self.melds_data,
+                    dora_indicators=self.dora_indicators, require_yaku=self.require_yaku,
+                    round_wind=self.round_wind, player_wind=self.player_wind)
+                total += n * score
+        else:
+            follow = self.draw_values(eff_hands, depth)
+            total = float(np.dot(eff_left, follow))
+
+        result = total / self.unseen
+        # 含截断子树的价值不进置换表，避免被预算内的完整计算读到
+        if self.cutoffs == cutoffs: self.table[key] = result
+        return result
@@ -0,0 +1,144 @@
+import mmap
+import os
+import sys
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+
+# 表文件格式：16 字节文件头 + 数牌表 (5^9 条) + 字牌表 (5^7 条)
+# 每条记录 10 字节，对应 engine._number_suit_distance / _honor_distance 返回的距离向量，
+# 记录下标为该花色计数向量的 5 进制编码 (第 i 个点数的张数 * 5^i)
+MAGIC = b'MJSHANTEN\x00\x01'
+HEADER_SIZE = 16
+RECORD_SIZE = 10
+MAX_SUIT_TILES = 14
+NUMBER_PATTERNS = 5 ** 9
+HONOR_PATTERNS = 5 ** 7
+TABLE_SIZE = HEADER_SIZE + (NUMBER_PATTERNS + HONOR_PATTERNS) * RECORD_SIZE
+
+DEFAULT_TABLE_PATH = os.environ.get(
+    'MAHJONG_SHANTEN_TABLE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'shanten_table.bin'))
+
+_POW5 = tuple(5 ** i for i in range(9))
+
+
+def pattern_index(counts: Tuple[int, ...]) -> int:
+    """花色计数向量 -> 5 进制编码下标"""
+    idx = 0
+    for c, w in zip(counts, _POW5):
+        idx += c * w
+    return idx
+
+
+class SuitTable:
+    """
+    只读的花色向听查表 (内存映射)。
+    多个 gunicorn worker 映射同一个文件时共享操作系统的页缓存，不会各自复制一份。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) != TABLE_SIZE or self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"向听表文件格式不正确: {path}")
+        self._honor_base = HEADER_SIZE + NUMBER_PATTERNS * RECORD_SIZE
+
+    def lookup(self, suit: int, counts: Tuple[int, ...]) -> Optional[Tuple[int, ...]]:
+        """查询某花色 (0-2 数牌, 3 字牌) 的距离向量，超出表范围时返回 None"""
+        idx = 0
+        total = 0
+        for c, w in zip(counts, _POW5):
+            if c > 4: return None
+            idx += c * w
+            total += c
+        if total > MAX_SUIT_TILES: return None
+
+        offset = (self._honor_base if suit == 3 else HEADER_SIZE) + idx * RECORD_SIZE
+        return tuple(self._mm[offset:offset + RECORD_SIZE])
+
+    def close(self):
+        self._mm.close()
+
+
+def load_suit_table(path: str = DEFAULT_TABLE_PATH) -> Optional[SuitTable]:
+    """加载向听表；文件不存在或损坏时返回 None (引擎退回到实时 DP 计算)"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return SuitTable(path)
+    except (OSError, ValueError):
+        return None
+
+
+# =====================================================================
+# 表生成器
+# =====================================================================
+
+def _walk_number_patterns(prefix: Tuple[int, ...]) -> List[Tuple[int, bytes]]:
+    """从给定前缀开始深度优先枚举数牌花色，同前缀的 DP 中间状态只计算一次"""
+    from engine import _number_suit_step, _number_suit_finish
+
+    results = []
+    states = {(0, 0, 0, 0): 0}
+    for i, c in enumerate(prefix):
+        states = _number_suit_step(states, c, 4 if i <= 6 else 0)
+
+    def walk(i, states, idx, total):
+        if i == 9:
+            results.append((idx, bytes(_number_suit_finish(states))))
+            return
+        for c in range(0, min(4, MAX_SUIT_TILES - total) + 1):
+            walk(i + 1, _number_suit_step(states, c, 4 if i <= 6 else 0), idx + c * _POW5[i], total + c)
+
+    walk(len(prefix), states, pattern_index(prefix), sum(prefix))
+    return results
+
+
+def _honor_patterns() -> List[Tuple[int, bytes]]:
+    from engine import _honor_distance
+
+    results = []
+
+    def walk(prefix, total):
+        if len(prefix) == 7:
+            results.append((pattern_index(prefix), bytes(_honor_distance(prefix))))
+            return
+        for c in range(0, min(4, MAX_SUIT_TILES - total) + 1):
+            walk(prefix + (c,), total + c)
+
+    walk((), 0)
+    return results
+
+
+def build_suit_table(path: str = DEFAULT_TABLE_PATH, processes: Optional[int] = None) -> str:
+    """生成向听表文件 (按前两位点数拆分任务并行计算，写入临时文件后原子替换)"""
+    buf = bytearray(TABLE_SIZE)
+    buf[:len(MAGIC)] = MAGIC
+
+    prefixes = [(a, b) for a in range(5) for b in range(5)]
+    with Pool(processes) as pool:
+        for chunk in pool.imap_unordered(_walk_number_patterns, prefixes):
+            for idx, record in chunk:
+                offset = HEADER_SIZE + idx * RECORD_SIZE
+                buf[offset:offset + RECORD_SIZE] = record
+
+    honor_base = HEADER_SIZE + NUMBER_PATTERNS * RECORD_SIZE
+    for idx, record in _honor_patterns():
+        offset = honor_base + idx * RECORD_SIZE
+        buf[offset:offset + RECORD_SIZE] = record
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buf)
+    os.replace(tmp_path, path)
+    return path
+
+
+if __name__ == "__main__":
+    # 用法: python shanten_table.py [输出路径]
+    out_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TABLE_PATH
+    print(f"正在生成向听表: {out_path}")
+    build_suit_table(out_path)
+    print("生成完毕")
@@ -0,0 +1,105 @@
+import argparse
+import random
+import time
+from functools import partial
+from multiprocessing import Pool
+from typing import Dict, List, Optional
+
+from engine import RuleEngine
+from match_engine import MatchManager
+from match_ai import check_ron, handle_ai_melds, ai_take_turn
+from match_log import MatchLogWriter
+
+ALL_SEATS = (0, 1, 2, 3)
+
+_worker_engine: Optional[RuleEngine] = None
+
+
+def _get_engine() -> RuleEngine:
+    global _worker_engine
+    if _worker_engine is None:
+        # 不设时间预算 (忽略 MAHJONG_SEARCH_TIME_MS)：前瞻只受节点数限制，结果与机器负载无关
+        _worker_engine = RuleEngine(search_time_budget=float('inf'))
+    return _worker_engine
+
+
+def play_game(seed: int, engine: Optional[RuleEngine] = None, log_dir: Optional[str] = None) -> Dict:
+    """
+    无头跑一局四家全 AI 的对局，决策逻辑与 /api/match/ai_turn 相同：
+    摸打 -> 全场荣和检查 -> AI 概率鸣牌。每一手都不设时间预算 (忽略 MAHJONG_AI_BUDGET_MS)，
+    传入的 engine 也应只用节点预算，这样同一个 seed 得到同一局。
+    log_dir 不为空时，终局后把整局事件写入该目录的二进制日志 (对局 ID 为 "seed-<seed>")。
+    """
+    engine = engine or _get_engine()
+    rng = random.Random(seed)
+    match = MatchManager(rng=rng)
+    turns, decisions = 0, 0
+    started = time.perf_counter()
+
+    while not match.is_game_over:
+        seat = match.current_turn
+        tile = ai_take_turn(engine, match, seat, budget=0)
+        decisions += 1
+        if tile is None: break
+        turns += 1
+        if check_ron(engine, match, seat, tile): break
+        handle_ai_melds(match, seat, tile, ai_seats=ALL_SEATS, rng=rng)
+
+    if log_dir: MatchLogWriter(log_dir).append(f"seed-{seed}", match)
+    return {
+        "seed": seed, "winner": match.winner, "turns": turns, "decisions": decisions,
+        "elapsed": time.perf_counter() - started
+    }
+
+
+def run_simulation(games: int, seed: int = 0, processes: int = 1, log_dir: Optional[str] = None) -> Dict:
+    """并行跑 games 局 (第 i 局的种子为 seed + i)，返回汇总统计"""
+    seeds = range(seed, seed + games)
+    play = partial(play_game, log_dir=log_dir)
+    started = time.perf_counter()
+    if processes > 1:
+        with Pool(processes) as pool:
+            results = pool.map(play, seeds, chunksize=max(1, games // (processes * 8)))
+    else:
+        results = [play(s) for s in seeds]
+    wall_time = time.perf_counter() - started
+    return summarize(results, wall_time)
+
+
+def summarize(results: List[Dict], wall_time: float) -> Dict:
+    games = len(results)
+    wins = [0] * 4
+    for r in results:
+        if r["winner"] >= 0: wins[r["winner"]] += 1
+    decisions = sum(r["decisions"] for r in results)
+    return {
+        "games": games,
+        "win_rate": [w / games if games else 0.0 for w in wins],
+        "ryuukyoku_rate": (games - sum(wins)) / games if games else 0.0,
+        "avg_turns": sum(r["turns"] for r in results) / games if games else 0.0,
+        "decisions": decisions,
+        "decisions_per_sec": decisions / wall_time if wall_time else 0.0,
+        "games_per_min": games / wall_time * 60 if wall_time else 0.0,
+        "wall_time": wall_time
+    }
+
+
+def print_summary(summary: Dict):
+    print("=" * 50)
+    print(f"对局数: {summary['games']}  用时: {summary['wall_time']:.1f}s  ({summary['games_per_min']:.0f} 局/分钟)")
+    for seat, rate in enumerate(summary['win_rate']):
+        print(f"  P{seat} 和牌率: {rate:.1%}")
+    print(f"流局率: {summary['ryuukyoku_rate']:.1%}")
+    print(f"平均巡目 (打牌次数): {summary['avg_turns']:.1f}")
+    print(f"决策次数: {summary['decisions']}  ({summary['decisions_per_sec']:.0f} 次/秒)")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="四家 AI 无头自对战模拟")
+    parser.add_argument("--games", type=int, default=100, help="对局数")
+    parser.add_argument("--seed", type=int, default=0, help="起始随机种子")
+    parser.add_argument("--processes", type=int, default=1, help="并行进程数")
+    parser.add_argument("--log-dir", help="把每局事件写入该目录的二进制日志 (用 match_log.py 查询)")
+    args = parser.parse_args()
+    print_summary(run_simulation(args.games, seed=args.seed, processes=args.processes, log_dir=args.log_dir))
@@ -0,0 +1,47 @@
+from typing import List, Sequence, Tuple
+
+# 手牌结构 (向听数、有效进张) 在以下变换下不变：
+#   - 三门数牌 (万/筒/索) 之间任意交换
+#   - 七种字牌之间任意重新编号
+# 规范形：数牌按各门计数 (字典序) 从大到小排列，字牌按张数从多到少排列 (稳定排序)。
+# 打点与宝牌、场风/自风、役牌相关，字牌重新编号只能用于纯结构的缓存 (honors=False 时字牌保持原位)。
+# 例外：绿一色只由 23468 索与发组成，还可能凑成绿一色的手牌交换花色后打点会变 (见 may_be_all_green)。
+
+Perm = Tuple[int, ...]
+
+IDENTITY: Perm = tuple(range(34))
+
+# 绿一色可用的牌：2/3/4/6/8 索与发
+ALL_GREEN = frozenset((19, 20, 21, 23, 25, 32))
+
+
+def canonical_perm(hand: Sequence[int], *tie_breaks: Sequence[int], honors: bool = True) -> Perm:
+    """
+    返回规范化排列 perm：规范形的第 i 格取原数组的第 perm[i] 格。
+    tie_breaks 为需要一起变换的其它 34 格数组 (如可见牌)，手牌相同的花色再按它们排序。
+    """
+    arrays = (hand,) + tie_breaks
+    suits = sorted(range(3), key=lambda s: [tuple(a[s * 9:s * 9 + 9]) for a in arrays], reverse=True)
+    honor_ids = list(range(27, 34))
+    if honors:
+        honor_ids.sort(key=lambda t: [a[t] for a in arrays], reverse=True)
+    return tuple([s * 9 + i for s in suits for i in range(9)] + honor_ids)
+
+
+def permute(values: Sequence[int], perm: Perm) -> List[int]:
+    """按 perm 把 34 格数组变换到规范坐标"""
+    return [values[p] for p in perm]
+
+
+def invert(perm: Perm) -> Perm:
+    """逆排列：inv[真实牌 ID] = 规范坐标下的牌 ID"""
+    inv = [0] * 34
+    for i, p in enumerate(perm):
+        inv[p] = i
+    return tuple(inv)
+
+
+def may_be_all_green(hand: Sequence[int], meld_tiles: Sequence[int], discards: int) -> bool:
+    """副露全是绿牌，且手里的非绿牌不超过和牌前还能打出的张数 discards 时，绿一色仍有可能"""
+    if any(t not in ALL_GREEN for t in meld_tiles): return False
+    return sum(n for t, n in enumerate(hand) if t not in ALL_GREEN) <= discards
@@ -0,0 +1,41 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def random_hand(rng: random.Random, size: int = 14) -> list:
+    """从完整牌山随机抽 size 张，返回 34 格计数手牌"""
+    wall = [t // 4 for t in range(136)]
+    rng.shuffle(wall)
+    hand = [0] * 34
+    for t in wall[:size]:
+        hand[t] += 1
+    return hand
+
+
+def structured_hand(rng: random.Random, size: int = 14) -> list:
+    """由面子/雀头拼出接近听牌的手牌 (随机手牌很少覆盖 0-1 向听)"""
+    while True:
+        hand = [0] * 34
+        for _ in range(4):
+            if rng.random() < 0.5:
+                s, r = rng.randrange(3), rng.randrange(7)
+                for k in range(3): hand[s * 9 + r + k] += 1
+            else:
+                hand[rng.randrange(34)] += 3
+        hand[rng.randrange(34)] += 2
+        for _ in range(rng.randrange(3)):
+            hand[rng.choice([t for t in range(34) if hand[t]])] -= 1
+            hand[rng.randrange(34)] += 1
+        while sum(hand) > size:
+            hand[rng.choice([t for t in range(34) if hand[t]])] -= 1
+        if max(hand) <= 4: return hand
+
+
+@pytest.fixture
+def rng():
+    return random.Random(20240601)
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+import app
+from cache import decision_key
+from symmetry import canonical_perm, invert, permute
+from utils import parse_tiles
+
+
+def _relabel(rng):
+    """三门数牌随机互换的排列 (字牌保持原位)"""
+    suits = [0, 1, 2]
+    rng.shuffle(suits)
+    return [s * 9 + i for s in suits for i in range(9)] + list(range(27, 34))
+
+
+def _request(rng):
+    wall = list(range(136))
+    rng.shuffle(wall)
+    return {'hand': [t // 4 for t in wall[:14]], 'dead': [t // 4 for t in wall[14:34]], 'dora': [wall[34] // 4],
+            'discards': [wall[14] // 4]}
+
+
+def _relabeled(data, perm):
+    return dict(data, **{key: [perm[t] for t in data[key]] for key in ('hand', 'dead', 'dora', 'discards')})
+
+
+def _key(hand, visible, dora, discards):
+    perm = canonical_perm(hand, visible, honors=False)
+    inv = invert(perm)
+    return decision_key(permute(hand, perm), permute(visible, perm), [], [inv[t] for t in dora], 27, 28, True,
+                        [inv[t] for t in discards])
+
+
+def test_decision_key_invariant_under_suit_relabeling(rng):
+    for _ in range(200):
+        data = _request(rng)
+        hand, visible = [0] * 34, [0] * 34
+        for t in data['hand']: hand[t] += 1
+        for t in data['hand'] + data['dead'] + data['dora']: visible[t] += 1
+        perm = _relabel(rng)
+        assert _key(hand, visible, data['dora'], data['discards']) == \
+            _key(permute(hand, invert(perm)), permute(visible, invert(perm)),
+                 [perm[t] for t in data['dora']], [perm[t] for t in data['discards']])
+
+
+@pytest.fixture
+def decision_cache(monkeypatch):
+    # 只用节点预算，重新计算的结果不受机器负载影响
+    monkeypatch.setattr(app.engine, 'search_time_budget', float('inf'))
+    app.decision_cache.clear()
+    yield app.decision_cache
+    app.decision_cache.clear()
+
+
+def test_cache_hit_equals_recompute(rng, decision_cache):
+    hits = 0
+    for _ in range(40):
+        data = _request(rng)
+        relabeled = _relabeled(data, _relabel(rng))
+        decision_cache.clear()
+        first = json.loads(app.build_recommendation_payload(data))
+        cached = json.loads(app.build_recommendation_payload(relabeled))
+        decision_cache.clear()
+        fresh = json.loads(app.build_recommendation_payload(relabeled))
+        assert cached == fresh
+        hits += not first['partial']
+    assert hits
+
+
+def test_all_green_keeps_real_coordinates(decision_cache):
+    # 打 1 万即两向听的绿一色形：换到其它花色就只剩清一色，打点不同
+    hand = parse_tiles('1m22334466688s66z')
+    counts = [hand.count(t) for t in range(34)]
+    visible = list(counts)
+    visible[0] += 1
+    _, expected = app.engine.recommend_discards(counts, visible, dora_indicators=[0], top_k=app.RECOMMENDATION_COUNT)
+    for _ in range(2):  # 第二次命中缓存
+        result = json.loads(app.build_recommendation_payload({'hand': hand, 'dora': [0]}))
+        assert not result['partial']
+        assert [(rec['discard_id'], rec['ev']) for rec in result['recommendations']] == \
+            [(rec['discard_tile'], rec['ev']) for rec in expected]
+        assert result['recommendations'][0]['ev'] == 64000
+    assert len(decision_cache) == 1
+    # 同一形状放到万子就不是绿一色，不能共用缓存条目
+    relabeled = [t - 18 if 18 <= t < 27 else t + 18 if t < 9 else t for t in hand]
+    result = json.loads(app.build_recommendation_payload({'hand': relabeled, 'dora': [18]}))
+    assert result['recommendations'][0]['ev'] < 64000 and len(decision_cache) == 2
@@ -0,0 +1,84 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from defense import DefenseTracker, defensive_order
+from engine import RuleEngine
+from match_ai import ai_take_turn, check_ron, handle_ai_melds
+from match_engine import MatchManager
+
+
+def test_genbutsu_and_suji():
+    tracker = DefenseTracker()
+    assert tracker.table[1, 3] > 0
+    before = tracker.table[1, 3]
+    tracker.mark_safe(1, 0)  # 1 万是现物，4 万的 23 两面不成立 (筋)
+    assert tracker.table[1, 0] == 0 and 0 < tracker.table[1, 3] < before
+    tracker.mark_safe(1, 3)
+    assert tracker.table[1, 3] == 0
+    # 其他家的表不受影响
+    assert tracker.table[2, 3] == before
+
+
+def test_walls_remove_shapes():
+    tracker = DefenseTracker()
+    before = tracker.table[0, 27]
+    tracker.on_visible(27, 3)  # 只剩 1 张：双碰不成立，只剩单骑
+    assert 0 < tracker.table[0, 27] < before
+    tracker.on_visible(27)
+    assert tracker.table[0, 27] == 0
+
+
+def test_incremental_equals_rebuild(rng):
+    tracker = DefenseTracker()
+    visible = [0] * 34
+    for _ in range(300):
+        seat, tile = rng.randrange(4), rng.randrange(34)
+        if rng.random() < 0.05: tracker.declare_riichi(seat)
+        if rng.random() < 0.1: tracker.on_meld(seat)
+        if visible[tile] < 4:
+            visible[tile] += 1
+            tracker.on_discard(seat, tile)
+        rebuilt = DefenseTracker(visible, genbutsu=tracker.genbutsu, riichi=tracker.riichi, melds=tracker.melds)
+        assert np.array_equal(tracker.table, rebuilt.table)
+        assert np.array_equal(tracker.danger(0), rebuilt.danger(0))
+
+
+def test_danger_weights_threats():
+    tracker = DefenseTracker()
+    assert not tracker.danger(0).any()  # 门清未立直不构成威胁
+    tracker.on_meld(2)
+    assert np.allclose(tracker.danger(0), 0.3 * tracker.table[2])
+    assert not tracker.danger(2).any()
+    tracker.declare_riichi(1)
+    assert np.allclose(tracker.danger(0), np.maximum(tracker.table[1], 0.3 * tracker.table[2]))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_match_rebuild_equals_incremental(seed):
+    engine = RuleEngine(search_depth=0)
+    rng = random.Random(seed)
+    match = MatchManager(rng=rng)
+    while not match.is_game_over:
+        seat = match.current_turn
+        tile = ai_take_turn(engine, match, seat, budget=0)
+        if tile is None or check_ron(engine, match, seat, tile): break
+        handle_ai_melds(match, seat, tile, ai_seats=(0, 1, 2, 3), rng=rng)
+        rebuilt = copy.copy(match)
+        rebuilt.rebuild_defense()
+        assert np.array_equal(rebuilt.defense.table, match.defense.table)
+        assert rebuilt.defense.melds == match.defense.melds
+
+
+def test_defensive_order_stays_within_shanten_group():
+    recs = [{'discard_tile': t, 'shanten_after_discard': s, 'total_ukeire': u, 'ev': None}
+            for t, s, u in [(0, 1, 20), (1, 1, 18), (2, 1, 12), (3, 2, 40)]]
+    danger = np.zeros(34, dtype=np.float32)
+    assert defensive_order(recs, danger) is recs
+    danger[0] = 1.0
+    order = [r['discard_tile'] for r in defensive_order(recs, danger, weight=0.5)]
+    # 危险的首选让位给同向听的安全牌，退向听的候选仍排在最后
+    assert order == [1, 2, 0, 3]
+    assert defensive_order(recs, danger, weight=0) is recs
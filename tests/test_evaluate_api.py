@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+import app
+from conftest import structured_hand
+from engine import RuleEngine
+from match_ai import ai_take_turn
+from match_engine import MatchManager
+from utils import encode_hands, hand_array_to_tenhou_str
+
+
+def _request(rng):
+    """一至两向听的局面 (前瞻搜索覆盖的范围，才会用到时间预算)"""
+    probe = RuleEngine(search_depth=0)
+    while True:
+        counts = structured_hand(rng)
+        if probe.get_shanten(counts) in (1, 2): break
+    hand = [t for t in range(34) for _ in range(counts[t])]
+    rest = [t for t in range(34) for _ in range(4 - counts[t])]
+    rng.shuffle(rest)
+    return {'hand': hand, 'dead': rest[:20], 'dora': [rest[20]], 'discards': [rest[0]]}
+
+
+@pytest.fixture
+def decision_cache(monkeypatch):
+    # 只用节点预算，测试结果不受机器负载影响
+    monkeypatch.setattr(app.engine, 'search_time_budget', float('inf'))
+    app.decision_cache.clear()
+    yield app.decision_cache
+    app.decision_cache.clear()
+
+
+def test_budget_returns_partial_and_skips_cache(rng, decision_cache):
+    complete = 0
+    for _ in range(10):
+        data = _request(rng)
+        partial = json.loads(app.build_recommendation_payload(dict(data, budget_ms=1e-6)))
+        assert partial['partial'] and len(decision_cache) == 0
+        # 没算完的候选 ev 为 null，排序退回纯牌效，推荐的仍是手里的牌
+        assert any(rec['ev'] is None for rec in partial['recommendations'])
+        assert {rec['discard_id'] for rec in partial['recommendations']} <= set(data['hand'])
+        full = json.loads(app.build_recommendation_payload(data))
+        assert all(rec['ev'] is not None for rec in full['recommendations']) or full['partial']
+        assert len(decision_cache) == (0 if full['partial'] else 1)
+        complete += not full['partial']
+        decision_cache.clear()
+    assert complete
+
+
+def test_evaluate_state_reports_partial(rng, decision_cache):
+    client = app.app.test_client()
+    data = _request(rng)
+    response = client.post('/api/evaluate_state', json=dict(data, budget_ms=1e-6))
+    assert response.status_code == 200 and response.json['partial'] is True
+    assert all(rec['ev'] is None for rec in response.json['recommendations'])
+
+
+def test_ai_move_under_budget_is_legal():
+    engine = RuleEngine()
+    match = MatchManager()
+    for budget in (1e-6, 0.05, 0):
+        # 预算再小也要打出一张 (必要时先摸牌)，打完回到 13 张
+        tile = ai_take_turn(engine, match, 0, budget=budget)
+        assert match.players[0].discards[-1] // 4 == tile and match.hand_count(0) == 13
+        match.player_draw(1)
+        match.player_discard(1, next(t for t in range(34) if match.players[1].counts[t]))
+        match.current_turn = 0
+
+
+def _batch(client, body: bytes, mimetype: str) -> list:
+    response = client.post('/api/evaluate_batch', data=body, content_type=mimetype)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+
+def test_batch_formats_agree(rng, decision_cache, monkeypatch):
+    monkeypatch.setattr(app, 'BATCH_CHUNK', 2)  # 5 个局面跨越多个解码批次
+    states = [_request(rng) for _ in range(5)]
+    client = app.app.test_client()
+    counts = lambda ids: [ids.count(t) for t in range(34)]
+    expected = [json.loads(app.build_recommendation_payload({'hand': s['hand'], 'dead': s['dead']})) for s in states]
+
+    as_json = _batch(client, json.dumps([{'hand': s['hand'], 'dead': s['dead']} for s in states]).encode(),
+                     'application/json')
+    packed = encode_hands([counts(s[key]) for s in states for key in ('hand', 'dead')]).tobytes()
+    as_binary = _batch(client, packed, 'application/octet-stream')
+    for lines in (as_json, as_binary):
+        assert [line['result'] for line in lines] == expected
+
+    text = '\n'.join(hand_array_to_tenhou_str(counts(s['hand'])) for s in states).encode()
+    as_text = _batch(client, text, 'text/plain')
+    assert [line['result'] for line in as_text] == \
+        [json.loads(app.build_recommendation_payload({'hand': s['hand']})) for s in states]
+
+
+def test_batch_binary_reports_truncated_record(rng, decision_cache):
+    counts = [_request(rng)['hand'].count(t) for t in range(34)]
+    body = encode_hands([counts, [0] * 34]).tobytes() + b'\x00' * 5
+    lines = _batch(app.app.test_client(), body, 'application/octet-stream')
+    assert lines[0]['index'] == 0 and 'result' in lines[0]
+    assert 'index' not in lines[1] and 'error' in lines[1]
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from conftest import structured_hand
+from engine import RuleEngine
+from executor import EngineExecutor, EvaluatorBusy, EvaluatorTimeout
+
+# 只用节点预算，进程池与进程内的结果不受机器负载影响
+INF = float('inf')
+
+
+@pytest.fixture(scope='module')
+def pool():
+    executor = EngineExecutor(RuleEngine(search_time_budget=INF), processes=1, timeout=30.0, max_pending=2)
+    yield executor
+    executor.shutdown()
+
+
+def _positions(rng, count: int = 5):
+    return [structured_hand(rng) for _ in range(count)]
+
+
+def test_inline_executor_calls_engine(rng):
+    engine = RuleEngine(search_time_budget=INF)
+    executor = EngineExecutor(engine, processes=0)
+    for hand in _positions(rng):
+        assert executor.recommend_discards(list(hand), list(hand), top_k=3) == \
+            engine.recommend_discards(list(hand), list(hand), top_k=3)
+    assert executor.pending == 0
+
+
+def test_pool_matches_in_process_engine(rng, pool):
+    engine = RuleEngine(search_time_budget=INF)
+    for hand in _positions(rng):
+        assert pool.recommend_discards(list(hand), list(hand), dora_indicators=[3]) == \
+            engine.recommend_discards(list(hand), list(hand), dora_indicators=[3])
+    assert pool.pending == 0
+
+
+def test_pool_rejects_when_queue_full(rng, pool):
+    # 占满全部名额，模拟排队中的任务
+    for _ in range(pool.max_pending): pool._slots.acquire()
+    try:
+        with pytest.raises(EvaluatorBusy):
+            pool.recommend_discards(structured_hand(rng), [0] * 34)
+        assert pool.rejected == 1
+    finally:
+        for _ in range(pool.max_pending): pool._slots.release()
+
+
+def test_pool_timeout_keeps_slot_until_done(rng, pool):
+    # 先让唯一的子进程忙上一阵，评估任务只能排队等到超时
+    pool._get_pool().submit(time.sleep, 0.5)
+    pool.timeout = 0.05
+    try:
+        with pytest.raises(EvaluatorTimeout):
+            pool.recommend_discards(structured_hand(rng), [0] * 34)
+    finally:
+        pool.timeout = 30.0
+    assert pool.timeouts == 1 and pool.pending == 1
+    # 超时的任务仍在子进程里跑完，之后才归还名额
+    for _ in range(300):
+        if pool.pending == 0: break
+        time.sleep(0.01)
+    assert pool.pending == 0
@@ -0,0 +1,59 @@
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+from engine import RuleEngine
+from match_ai import ai_take_turn, check_ron, handle_ai_melds
+from match_engine import MatchManager
+from match_log import encode_state
+
+ALL_SEATS = (0, 1, 2, 3)
+
+
+def _play(seed: int, on_turn=None) -> MatchManager:
+    engine = RuleEngine(search_depth=0)
+    rng = random.Random(seed)
+    match = MatchManager(rng=rng)
+    while not match.is_game_over:
+        seat = match.current_turn
+        tile = ai_take_turn(engine, match, seat, budget=0)
+        if tile is None or check_ron(engine, match, seat, tile): break
+        handle_ai_melds(match, seat, tile, ai_seats=ALL_SEATS, rng=rng)
+        if on_turn: on_turn(match)
+    return match
+
+
+def _assert_same(a: MatchManager, b: MatchManager):
+    assert encode_state(a) == encode_state(b)
+    assert a.events == b.events and a.wall == b.wall and a.initial_wall == b.initial_wall
+    assert [bytes(p.counts) for p in a.players] == [bytes(p.counts) for p in b.players]
+    assert [p.tile_count for p in a.players] == [p.tile_count for p in b.players]
+    assert np.array_equal(a.defense.table, b.defense.table)
+    assert np.array_equal(a.defense.unseen, b.defense.unseen)
+
+
+def test_seat_counts_follow_bits():
+    match = _play(0)
+    for seat in match.players:
+        assert sum(seat.counts) == seat.tile_count == len(seat.hand_136())
+        assert [sum(1 for t in seat.hand_136() if t // 4 == k) for k in range(34)] == list(seat.counts)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_pickle_round_trip(seed):
+    _play(seed, on_turn=lambda match: _assert_same(pickle.loads(pickle.dumps(match)), match))
+
+
+def test_pickled_size():
+    new = len(pickle.dumps(MatchManager(rng=random.Random(0)), protocol=pickle.HIGHEST_PROTOCOL))
+    match = _play(1)
+    size = len(pickle.dumps(match, protocol=pickle.HIGHEST_PROTOCOL))
+    assert new < 600
+    assert size < new + 8 * match.seq
+
+
+def test_replay_matches_live_match():
+    match = _play(2)
+    _assert_same(MatchManager.replay(match.initial_wall, match.events), match)
@@ -0,0 +1,64 @@
+import random
+
+import numpy as np
+import pytest
+
+from engine import RuleEngine
+from match_ai import ai_take_turn, check_ron, handle_ai_melds
+from match_engine import MatchManager
+from match_log import MatchLogReader, MatchLogWriter, encode_state
+
+ALL_SEATS = (0, 1, 2, 3)
+
+
+@pytest.fixture(scope='module')
+def finished_match():
+    engine = RuleEngine(search_depth=0)
+    rng = random.Random(7)
+    match = MatchManager(rng=rng)
+    while not match.is_game_over:
+        seat = match.current_turn
+        tile = ai_take_turn(engine, match, seat, budget=0)
+        if tile is None or check_ron(engine, match, seat, tile): break
+        handle_ai_melds(match, seat, tile, ai_seats=ALL_SEATS, rng=rng)
+    return match
+
+
+def _write(directory, match: MatchManager, chunk: int, interval: int = 8):
+    """像 MatchRegistry 那样边打边追加：每推进 1..chunk 个事件写一次"""
+    writer = MatchLogWriter(str(directory), snapshot_interval=interval)
+    live = MatchManager.replay(match.initial_wall, ())
+    writer.append('m', live)
+    steps = random.Random(chunk)
+    while live.seq < match.seq:
+        for event in match.events[live.seq:live.seq + steps.randint(1, chunk)]:
+            live.apply_event(event)
+        writer.append('m', live)
+
+
+@pytest.mark.parametrize("chunk", [1, 5, 20, 1000])
+def test_state_at_equals_snapshot(tmp_path, finished_match, chunk):
+    _write(tmp_path, finished_match, chunk)
+    reader = MatchLogReader.open(str(tmp_path), 'm')
+    try:
+        assert len(reader) == finished_match.seq
+        assert reader.events() == finished_match.events
+        for seq in range(finished_match.seq + 1):
+            state = reader.state_at(seq)
+            expected = finished_match.snapshot(seq)
+            assert encode_state(state) == encode_state(expected)
+            assert state.events == expected.events
+            assert [state.get_hand_34(i) for i in ALL_SEATS] == [expected.get_hand_34(i) for i in ALL_SEATS]
+            # 安全度表不进日志，读回时由公开信息重建
+            assert np.array_equal(state.defense.table, expected.defense.table)
+    finally:
+        reader.close()
+
+
+def test_snapshots_independent_of_append_chunking(tmp_path, finished_match):
+    blobs = []
+    for chunk in (1, 7, 1000):
+        directory = tmp_path / str(chunk)
+        _write(directory, finished_match, chunk)
+        blobs.append((directory / 'm.mjsnap').read_bytes())
+    assert blobs[0] and blobs.count(blobs[0]) == len(blobs)
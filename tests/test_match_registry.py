@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from match_log import MatchLogReader, MatchLogWriter
+from match_registry import MatchBusy, MatchLimitReached, MatchNotFound, MatchRegistry, SQLiteMatchStore, \
+    create_match_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    return create_match_store('memory' if request.param == 'memory' else f"sqlite:{tmp_path / 'matches.db'}")
+
+
+def test_open_saves_changes(store):
+    registry = MatchRegistry(store)
+    match_id, match = registry.create()
+    with registry.open(match_id) as match:
+        match.player_discard(0, next(t for t in range(34) if match.players[0].counts[t]))
+        seq = match.seq
+    with registry.open(match_id, save=False) as match:
+        assert match.seq == seq
+        match.player_draw(1)
+    if isinstance(store, SQLiteMatchStore):
+        # save=False 的修改不写回 (内存存储直接持有对象，只有落盘的存储能区分)
+        with registry.open(match_id) as match:
+            assert match.seq == seq
+
+
+def test_unknown_match(store):
+    registry = MatchRegistry(store)
+    for match_id in (None, '', 'missing'):
+        with pytest.raises(MatchNotFound):
+            with registry.open(match_id):
+                pass
+
+
+def test_limit_and_idle_eviction(store):
+    registry = MatchRegistry(store, max_matches=2)
+    registry.create()
+    registry.create()
+    with pytest.raises(MatchLimitReached):
+        registry.create()
+    # 闲置时间降为 0 后，新建对局前会先回收其它对局
+    registry.idle_timeout = -1.0
+    match_id, _ = registry.create()
+    assert store.count() == 1
+    registry.remove(match_id)
+    assert store.count() == 0
+
+
+def test_concurrent_open_is_serialized(store):
+    registry = MatchRegistry(store, lock_timeout=0.05)
+    match_id, _ = registry.create()
+    entered, release = threading.Event(), threading.Event()
+
+    def hold():
+        with registry.open(match_id):
+            entered.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    try:
+        assert entered.wait(5)
+        with pytest.raises(MatchBusy):
+            with registry.open(match_id):
+                pass
+        # 被占用的对局不会因闲置被回收
+        assert store.evict_idle(float('inf')) == 0
+    finally:
+        release.set()
+        holder.join()
+    with registry.open(match_id):
+        pass
+
+
+def test_event_log_follows_saves(store, tmp_path):
+    registry = MatchRegistry(store, event_log=MatchLogWriter(str(tmp_path / 'log')))
+    match_id, _ = registry.create()
+    with registry.open(match_id) as match:
+        match.player_discard(0, next(t for t in range(34) if match.players[0].counts[t]))
+        match.player_draw(1)
+        events = list(match.events)
+    reader = MatchLogReader.open(str(tmp_path / 'log'), match_id)
+    try:
+        assert reader.events() == events
+    finally:
+        reader.close()
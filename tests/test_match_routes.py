@@ -0,0 +1,192 @@
+import json
+import random
+
+import pytest
+
+import app
+from executor import EvaluatorBusy
+from match_engine import MatchManager
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def _call_position() -> MatchManager:
+    """人类手里有 3 张 t、下家打出第 4 张 t 并等待人类选择的局面"""
+    for seed in range(10000):
+        match = MatchManager(rng=random.Random(seed))
+        hand, right = match.players[0].counts, match.players[1].counts
+        t = next((t for t in range(34) if hand[t] == 3 and right[t] == 1), None)
+        if t is None: continue
+        match.player_discard(0, next(d for d in range(34) if hand[d] and d != t))
+        match.player_draw(1)
+        match.player_discard(1, t)
+        match.offer_call(1, t)
+        return match
+    raise AssertionError("no seed with a kan call")
+
+
+def _install(match: MatchManager) -> str:
+    match_id = 'rigged%d' % random.getrandbits(32)
+    app.matches.store.save(match_id, match)
+    return match_id
+
+
+def _discard(client, match_id, tile):
+    return client.post('/api/match/player_discard', json={'match_id': match_id, 'discard_tile': tile})
+
+
+@pytest.mark.parametrize("meld_type", ['kan', 'pon'])
+def test_human_meld_then_discard(client, meld_type):
+    match_id = _install(_call_position())
+    discarder, tile = app.matches.store.load(match_id).pending_call
+    state = client.post('/api/match/call_meld', json={'match_id': match_id, 'tile': tile, 'type': meld_type,
+                                                      'discarder': discarder}).json
+    assert state['current_turn'] == 0
+    # 杠后补摸一张，碰后直接出牌：两种情况下人类手里都是 3n+2 张
+    match = app.matches.store.load(match_id)
+    assert match.hand_count(0) == 11
+    assert match.events[-1][0] == ('draw' if meld_type == 'kan' else 'pon')
+    response = _discard(client, match_id, next(t for t in range(34) if match.players[0].counts[t]))
+    assert response.status_code == 200 and response.json['current_turn'] == 1
+
+
+def test_out_of_turn_requests_conflict(client):
+    match_id = _install(_call_position())
+    match = app.matches.store.load(match_id)
+    discarder, tile = match.pending_call
+    held = next(t for t in range(34) if match.players[0].counts[t])
+
+    def meld(**overrides):
+        data = {'match_id': match_id, 'tile': tile, 'type': 'pon', 'discarder': discarder, **overrides}
+        return client.post('/api/match/call_meld', json=data)
+
+    assert _discard(client, match_id, held).json == {"error": "Call pending"}
+    assert meld(type='chi').status_code == 409
+    assert meld(discarder=2).json == {"error": "No such call pending"}
+    assert meld(tile=(tile + 1) % 34).status_code == 409
+
+    state = client.post('/api/match/pass', json={'match_id': match_id}).json
+    assert state['current_turn'] == 2
+    assert _discard(client, match_id, held).json == {"error": "Not human turn"}
+    assert meld().json == {"error": "No such call pending"}
+    seq = app.matches.store.load(match_id).seq
+    assert _discard(client, match_id, held).status_code == 409
+    assert app.matches.store.load(match_id).seq == seq
+
+
+def test_discard_rejects_tiles_not_in_hand(client):
+    match_id = client.post('/api/match/start').json['match_id']
+    counts = app.matches.store.load(match_id).players[0].counts
+    for tile in (next(t for t in range(34) if counts[t] == 0), 34, -1, '3', None):
+        response = _discard(client, match_id, tile)
+        assert response.status_code == 409 and response.json == {"error": "Tile not in hand"}
+
+
+def _read_stream(response, stop) -> list:
+    """读 SSE 流直到 stop(事件) 为真或流结束，返回收到的事件"""
+    events, buf = [], ''
+    try:
+        for chunk in response.response:
+            buf += chunk.decode() if isinstance(chunk, bytes) else chunk
+            while '\n\n' in buf:
+                message, buf = buf.split('\n\n', 1)
+                fields = dict(line.split(': ', 1) for line in message.split('\n') if not line.startswith(':'))
+                if 'data' not in fields: continue
+                event = json.loads(fields['data'])
+                assert int(fields['id']) == event['seq']
+                events.append(event)
+                if stop(event): return events
+    finally:
+        response.close()
+    return events
+
+
+def test_stream_advances_ai_turns(client):
+    state = client.post('/api/match/start').json
+    match_id, since = state['match_id'], state['seq']
+    state = _discard(client, match_id, state['players'][0]['hand'][0]).json
+    assert state['current_turn'] == 1 and state['seq'] == since + 1
+
+    response = client.get(f'/api/match/stream?match_id={match_id}&since={since}', buffered=False)
+    events = _read_stream(response, lambda e: e['type'] in ('prompt', 'ron', 'tsumo', 'ryuukyoku')
+                          or e['type'] == 'draw' and e['seat'] == 0)
+    assert [e['seq'] for e in events] == list(range(since + 1, since + 1 + len(events)))
+    assert events[0]['type'] == 'discard' and events[0]['seat'] == 0
+    # 其它座位摸到的牌不下发
+    assert all('tile' not in e for e in events if e['type'] == 'draw' and e['seat'] != 0)
+
+    match = app.matches.store.load(match_id)
+    assert match.seq == events[-1]['seq']
+    polled = client.get(f'/api/match/events?match_id={match_id}&since={since}&wait=0').json
+    assert polled['events'] == events and polled['seq'] == match.seq
+    # Last-Event-ID 续传：之前的事件不再重发
+    resumed = client.get(f'/api/match/events?match_id={match_id}&wait=0',
+                         headers={'Last-Event-ID': str(match.seq)}).json
+    assert resumed['events'] == [] and resumed['seq'] == match.seq
+
+
+def test_snapshot_replays_prefix(client):
+    state = client.post('/api/match/start').json
+    match_id = state['match_id']
+    _discard(client, match_id, state['players'][0]['hand'][0])
+    client.post('/api/match/ai_turn', json={'match_id': match_id})
+    assert client.get(f'/api/match/snapshot?match_id={match_id}').json == \
+        client.get(f'/api/match/state?match_id={match_id}').json
+    first = client.get(f'/api/match/snapshot?match_id={match_id}&seq=1').json
+    assert first['seq'] == 1 and first['current_turn'] == 0
+    assert client.get(f'/api/match/snapshot?match_id={match_id}&seq=999').status_code == 400
+
+
+def test_unknown_match(client):
+    assert client.get('/api/match/stream?match_id=missing').status_code == 404
+    assert client.get('/api/match/events?match_id=missing').status_code == 404
+    assert client.post('/api/match/call_meld', json={'match_id': 'missing'}).status_code == 404
+
+
+def _at_human_decision(match: MatchManager) -> bool:
+    if match.is_game_over or match.pending_call: return True
+    return match.current_turn == 0 and match.hand_count(0) % 3 == 2
+
+
+def test_discard_with_advance_stops_at_human(client):
+    state = client.post('/api/match/start').json
+    match_id = state['match_id']
+    for _ in range(40):
+        if state['is_game_over']: break
+        since = state['seq']
+        if state.get('available_actions'):
+            state = client.post('/api/match/pass', json={'match_id': match_id, 'advance': True}).json
+        else:
+            state = client.post('/api/match/player_discard', json={
+                'match_id': match_id, 'discard_tile': state['players'][0]['hand'][-1], 'advance': True}).json
+        # 一次请求推进到下一个人类决策点，事件按序号连续返回
+        assert [e['seq'] for e in state['events']] == list(range(since + 1, state['seq'] + 1))
+        assert _at_human_decision(app.matches.store.load(match_id))
+
+
+def test_advance_is_idempotent_at_human_turn(client):
+    match_id = client.post('/api/match/start').json['match_id']
+    state = client.post('/api/match/advance', json={'match_id': match_id, 'since': 0}).json
+    assert state['current_turn'] == 0 and state['seq'] == 1 and len(state['events']) == 1
+    again = client.post('/api/match/advance', json={'match_id': match_id, 'since': state['seq']}).json
+    assert again['events'] == [] and again['seq'] == state['seq']
+
+
+def test_advance_reports_busy_evaluator(client, monkeypatch):
+    state = client.post('/api/match/start').json
+    match_id = state['match_id']
+    _discard(client, match_id, state['players'][0]['hand'][0])
+    seq = app.matches.store.load(match_id).seq
+
+    def busy(*args, **kwargs): raise EvaluatorBusy("busy")
+
+    monkeypatch.setattr(app.evaluator, 'recommend_discards', busy)
+    state = client.post('/api/match/advance', json={'match_id': match_id, 'since': seq}).json
+    # 停在原地并带上错误，稍后重试 advance 即可继续
+    assert state['error'] == "busy" and state['current_turn'] == 1
+    monkeypatch.undo()
+    state = client.post('/api/match/advance', json={'match_id': match_id, 'since': seq}).json
+    assert 'error' not in state and _at_human_decision(app.matches.store.load(match_id))
@@ -0,0 +1,64 @@
+import copy
+import random
+
+import pytest
+from mahjong.shanten import Shanten
+
+from conftest import structured_hand
+from engine import RuleEngine
+from match_ai import ai_take_turn, check_ron, handle_ai_melds
+from match_engine import MatchManager
+
+REFERENCE = Shanten()
+
+
+def _reference_waits(hand: list) -> list:
+    waits = []
+    for t in range(34):
+        if hand[t] == 4: continue
+        hand[t] += 1
+        if REFERENCE.calculate_shanten(hand) == -1: waits.append(t)
+        hand[t] -= 1
+    return waits
+
+
+@pytest.mark.parametrize("size", [13, 10, 7, 4, 1])
+def test_waits_match_reference(rng, size):
+    engine = RuleEngine(search_depth=0)
+    for _ in range(100):
+        hand = structured_hand(rng, size)
+        assert engine.get_waits(hand) == _reference_waits(hand)
+
+
+def _expected_ron(match: MatchManager, discarder: int, tile: int) -> int:
+    for offset in range(1, 4):
+        seat = match.players[(discarder + offset) % 4]
+        if seat.tile_count % 3 != 1: continue
+        waits = _reference_waits(list(seat.counts))
+        if tile in waits and not any(seat.discarded >> t & 1 for t in waits):
+            return (discarder + offset) % 4
+    return -1
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_check_ron_follows_hands_and_furiten(seed):
+    engine = RuleEngine(search_depth=0)
+    rng = random.Random(seed)
+    match = MatchManager(rng=rng)
+    while not match.is_game_over:
+        seat = match.current_turn
+        tile = ai_take_turn(engine, match, seat, budget=0)
+        if tile is None: break
+        # 掩码是按座位缓存的，每次都和现算的结果比对
+        expected = _expected_ron(match, seat, tile)
+        if expected < 0:
+            assert not check_ron(engine, match, seat, tile)
+        else:
+            # 同一局面下，和了者打过这张牌就是振听，不能荣和
+            furiten = copy.deepcopy(match)
+            furiten.players[expected].discarded |= 1 << tile
+            check_ron(engine, furiten, seat, tile)
+            assert furiten.winner != expected
+            assert check_ron(engine, match, seat, tile) and match.winner == expected
+            break
+        handle_ai_melds(match, seat, tile, ai_seats=(0, 1, 2, 3), rng=rng)
@@ -0,0 +1,98 @@
+import pytest
+
+from conftest import random_hand
+from engine import RuleEngine
+
+INF = float('inf')
+
+
+def _positions(rng, count: int, shanten: range):
+    """(手牌, 可见牌) 局面：可见牌含自己的手牌与随机若干张牌河"""
+    probe = RuleEngine(search_depth=0)
+    positions = []
+    while len(positions) < count:
+        hand = random_hand(rng)
+        if probe.get_shanten(hand) not in shanten: continue
+        visible = list(hand)
+        for _ in range(rng.randrange(20)):
+            t = rng.randrange(34)
+            if visible[t] < 4: visible[t] += 1
+        positions.append((hand, visible))
+    return positions
+
+
+def test_ev_deterministic_under_node_budget(rng):
+    warm = RuleEngine(search_time_budget=INF)
+    positions = _positions(rng, 12, range(3))
+    first = [warm.recommend_discards(list(h), list(v), dora_indicators=[0]) for h, v in positions]
+    # 缓存已热、调用顺序打乱、全新实例，结果都必须一致
+    again = [warm.recommend_discards(list(h), list(v), dora_indicators=[0]) for h, v in reversed(positions)][::-1]
+    fresh = [RuleEngine(search_time_budget=INF).recommend_discards(list(h), list(v), dora_indicators=[0])
+             for h, v in positions]
+    assert first == again == fresh
+
+
+@pytest.mark.parametrize("budget", [10, 50, 200])
+def test_exact_scoring_counts_against_node_budget(rng, monkeypatch, budget):
+    engine = RuleEngine(search_node_budget=budget, search_time_budget=INF)
+    calls = [0]
+    score = engine.calculate_exact_score
+
+    def counted(*args, **kwargs):
+        calls[0] += 1
+        return score(*args, **kwargs)
+
+    monkeypatch.setattr(engine, 'calculate_exact_score', counted)
+    # 两向听的候选不会直接和牌，算分全部发生在前瞻搜索的听牌节点里
+    for hand, visible in _positions(rng, 10, range(2, 3)):
+        calls[0] = 0
+        engine.recommend_discards(list(hand), list(visible), dora_indicators=[0])
+        assert calls[0] <= budget
+
+
+def test_time_budget_truncates(rng):
+    engine = RuleEngine(search_time_budget=1e-9)
+    for hand, visible in _positions(rng, 10, range(1, 3)):
+        _, recs = engine.recommend_discards(list(hand), list(visible))
+        assert all(rec['ev'] is None and rec['truncated'] for rec in recs)
+
+
+def test_truncated_candidates_rank_by_own_ukeire(rng):
+    engine = RuleEngine(search_node_budget=5, search_time_budget=INF)
+    seen = False
+    for hand, visible in _positions(rng, 10, range(2)):
+        _, recs = engine.recommend_discards(list(hand), list(visible))
+        if not any(rec['ev'] is None for rec in recs): continue
+        seen = True
+        assert all(rec.get('truncated') for rec in recs)
+        for a, b in zip(recs, recs[1:]):
+            if a['shanten_after_discard'] == b['shanten_after_discard'] and a['ev'] is None:
+                # 未算完的候选排在同向听已算出期望的候选之后，彼此按进张数/战略价值排序
+                assert b['ev'] is None
+                assert (a['total_ukeire'], a['quality_score']) >= (b['total_ukeire'], b['quality_score'])
+    assert seen
+
+
+def _strip(recs):
+    """truncated 表示整份排序里有没算完的候选，取前缀时可能不同，比较时去掉"""
+    return [{k: v for k, v in rec.items() if k != 'truncated'} for rec in recs]
+
+
+@pytest.mark.parametrize("top_k", [1, 3, 5])
+def test_pure_efficiency_top_k_is_prefix(rng, top_k):
+    engine = RuleEngine(search_depth=0)
+    for _ in range(100):
+        hand = random_hand(rng)
+        _, full = engine.evaluate_pure_efficiency(list(hand), list(hand), [5])
+        _, top = engine.evaluate_pure_efficiency(list(hand), list(hand), [5], top_k=top_k)
+        assert top == full[:top_k]
+
+
+@pytest.mark.parametrize("top_k", [1, 3, 5])
+def test_recommend_top_k_is_prefix(rng, top_k):
+    engine = RuleEngine(search_time_budget=INF)
+    for hand, visible in _positions(rng, 15, range(3)):
+        shanten, full = engine.recommend_discards(list(hand), list(visible), dora_indicators=[4])
+        top_shanten, top = engine.recommend_discards(list(hand), list(visible), dora_indicators=[4], top_k=top_k)
+        assert top_shanten == shanten
+        assert _strip(top) == _strip(full[:top_k])
@@ -0,0 +1,25 @@
+import pytest
+from mahjong.shanten import Shanten
+
+from conftest import random_hand, structured_hand
+from engine import SuitShanten
+
+REFERENCE = Shanten()
+
+
+@pytest.mark.parametrize("size", [14, 13, 11, 8, 5, 2])
+def test_suit_shanten_matches_reference(rng, size):
+    hands = [random_hand(rng, size) for _ in range(300)] + [structured_hand(rng, size) for _ in range(300)]
+    assert [SuitShanten(h).shanten() for h in hands] == [REFERENCE.calculate_shanten(h) for h in hands]
+
+
+def test_shanten_with_matches_reference(rng):
+    for _ in range(100):
+        hand = structured_hand(rng, 13)
+        probe = SuitShanten(hand)
+        for t in range(34):
+            if hand[t] == 4: continue
+            hand[t] += 1
+            assert probe.shanten_with(t) == REFERENCE.calculate_shanten(hand)
+            hand[t] -= 1
+
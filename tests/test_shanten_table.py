@@ -0,0 +1,48 @@
+import itertools
+
+import pytest
+
+from engine import _honor_distance, _number_suit_distance
+from shanten_table import MAX_SUIT_TILES, _honor_patterns, _walk_number_patterns, load_suit_table, pattern_index
+
+
+def _counts(idx: int, length: int) -> tuple:
+    """pattern_index 的逆运算"""
+    digits = []
+    for _ in range(length):
+        idx, c = divmod(idx, 5)
+        digits.append(c)
+    return tuple(digits)
+
+
+@pytest.mark.parametrize("prefix", [(0, 0, 0, 0, 0), (1, 1, 1, 0, 2), (0, 3, 0, 1, 4), (2, 0, 2, 0, 0, 1)])
+def test_number_records_match_dp(prefix):
+    records = _walk_number_patterns(prefix)
+    assert records
+    for idx, record in records:
+        counts = _counts(idx, 9)
+        assert counts[:len(prefix)] == prefix
+        assert tuple(record) == _number_suit_distance(counts)
+
+
+def test_honor_records_match_dp():
+    records = _honor_patterns()
+    assert len(records) == sum(1 for c in itertools.product(range(5), repeat=7) if sum(c) <= MAX_SUIT_TILES)
+    for idx, record in records:
+        counts = _counts(idx, 7)
+        assert pattern_index(counts) == idx
+        # 引擎按张数排序后查 DP，表按原顺序生成，两者必须一致
+        assert tuple(record) == _honor_distance(tuple(sorted(counts, reverse=True)))
+
+
+def test_loaded_table_matches_dp(rng):
+    table = load_suit_table()
+    if table is None:
+        pytest.skip("向听表未生成 (python shanten_table.py)")
+    for _ in range(5000):
+        counts = tuple(rng.randrange(5) for _ in range(9))
+        if sum(counts) > MAX_SUIT_TILES: continue
+        assert table.lookup(rng.randrange(3), counts) == _number_suit_distance(counts)
+    for counts in itertools.product(range(5), repeat=7):
+        if sum(counts) > MAX_SUIT_TILES: continue
+        assert table.lookup(3, counts) == _honor_distance(tuple(sorted(counts, reverse=True)))
@@ -0,0 +1,20 @@
+from engine import RuleEngine
+from simulate import play_game, summarize
+
+
+def test_same_seed_same_game():
+    # 冷/热缓存的引擎给出同一局
+    warm = RuleEngine(search_depth=0)
+    play_game(3, engine=warm)
+    for seed in (3, 4):
+        a = play_game(seed, engine=RuleEngine(search_depth=0))
+        b = play_game(seed, engine=warm)
+        assert (a['winner'], a['turns'], a['decisions']) == (b['winner'], b['turns'], b['decisions'])
+
+
+def test_summary_rates():
+    results = [play_game(seed, engine=RuleEngine(search_depth=0)) for seed in range(4)]
+    summary = summarize(results, wall_time=1.0)
+    assert summary['games'] == 4
+    assert abs(sum(summary['win_rate']) + summary['ryuukyoku_rate'] - 1.0) < 1e-9
+    assert summary['decisions'] == sum(r['decisions'] for r in results)
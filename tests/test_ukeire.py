@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from mahjong.shanten import Shanten
+
+from conftest import random_hand, structured_hand
+from engine import RuleEngine, SuitShanten, batch_shanten
+
+REFERENCE = Shanten()
+
+
+@pytest.mark.parametrize("size", [14, 13, 11, 8, 5, 2])
+def test_batch_shanten_matches_reference(rng, size):
+    hands = [random_hand(rng, size) for _ in range(300)] + [structured_hand(rng, size) for _ in range(300)]
+    assert batch_shanten(np.array(hands, dtype=np.int8)).tolist() == [REFERENCE.calculate_shanten(h) for h in hands]
+
+
+def test_ukeire_candidates_match_per_candidate_loop(rng):
+    engine = RuleEngine(search_depth=0)
+    for n in range(150):
+        hand = structured_hand(rng) if n % 2 else random_hand(rng)
+        visible = list(hand)
+        for _ in range(rng.randrange(30)):
+            t = rng.randrange(34)
+            if visible[t] < 4: visible[t] += 1
+        current, discards, shanten_after, draw_shanten, effective, left = engine._ukeire_candidates(hand, visible)
+        assert current == SuitShanten(hand).shanten()
+        assert discards == [t for t in range(34) if hand[t]]
+        assert left == [max(4 - v, 0) for v in visible]
+        for i, d in enumerate(discards):
+            hand[d] -= 1
+            after = SuitShanten(hand)
+            assert shanten_after[i] == after.shanten()
+            for t in range(34):
+                if hand[t] == 4: continue
+                assert draw_shanten[i, t] == after.shanten_with(t)
+                assert effective[i, t] == (left[t] > 0 and draw_shanten[i, t] < shanten_after[i])
+            hand[d] += 1
+
+
+def test_pure_efficiency_totals(rng):
+    engine = RuleEngine(search_depth=0)
+    for _ in range(100):
+        hand = random_hand(rng)
+        _, recs = engine.evaluate_pure_efficiency(list(hand), list(hand))
+        assert sorted(r['discard_tile'] for r in recs) == [t for t in range(34) if hand[t]]
+        for rec in recs:
+            assert rec['total_ukeire'] == sum(d['left_count'] for d in rec['details'])
+            assert all(d['left_count'] == 4 - hand[d['tile']] for d in rec['details'])
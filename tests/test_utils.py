@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from cache import decision_key
+from conftest import random_hand
+from utils import decode_hands, encode_hands, format_tiles_bulk, hand_array_to_tenhou_str, pack_hand, \
+    pack_hand_bytes, parse_tiles, parse_tiles_bulk, unpack_hand, unpack_hand_bytes
+
+
+def test_pack_round_trip(rng):
+    for _ in range(200):
+        hand = [rng.randrange(8) for _ in range(34)]
+        assert unpack_hand(pack_hand(hand)) == hand
+        assert unpack_hand_bytes(pack_hand_bytes(hand)) == hand
+
+
+@pytest.mark.parametrize("count", [8, -1])
+def test_pack_rejects_out_of_range_counts(count):
+    hand = [0] * 34
+    hand[5] = count
+    with pytest.raises(ValueError):
+        pack_hand(hand)
+    with pytest.raises(ValueError):
+        encode_hands([hand])
+
+
+def test_bulk_codecs_match_scalar(rng):
+    hands = np.array([random_hand(rng, rng.randrange(15)) for _ in range(300)], dtype=np.uint8)
+    packed = encode_hands(hands)
+    assert packed.shape == (300, 13)
+    assert [bytes(row) for row in packed] == [pack_hand_bytes(h) for h in hands.tolist()]
+    assert np.array_equal(decode_hands(packed), hands)
+    assert np.array_equal(decode_hands(packed.tobytes()), hands)
+
+    strings = format_tiles_bulk(hands)
+    assert strings == [hand_array_to_tenhou_str(h) for h in hands.tolist()]
+    assert np.array_equal(parse_tiles_bulk(strings), hands)
+
+
+def test_parse_bulk_matches_parse_tiles():
+    strings = ['123m456p789s1122z', '', '0m0p0s', '19m19p19s1234567z', '55z']
+    for string, row in zip(strings, parse_tiles_bulk(strings).tolist()):
+        assert row == [parse_tiles(string).count(t) for t in range(34)]
+
+
+def test_decision_key_clamps_visible(rng):
+    hand = random_hand(rng)
+    visible = [min(h + rng.randrange(3), 4) for h in hand]
+    over = [v + 3 if v == 4 else v for v in visible]
+    args = ([], [0], 27, 28, True)
+    assert decision_key(hand, visible, *args) == decision_key(hand, over, *args)
+    with pytest.raises(ValueError):
+        decision_key([8] + hand[1:], visible, *args)
@@ -1,4 +1,6 @@
-from typing import List
+from typing import Iterable, List, Union
+
+import numpy as np
 
 
 def parse_tiles(hand_str: str) -> List[int]:
@@ -6,6 +8,7 @@ def parse_tiles(hand_str: str) -> List[int]:
     将天凤格式的字符串解析为牌的 ID 列表。
     支持的格式例如: '123m456p789s1122z'
     m: 万(0-8), p: 筒(9-17), s: 索(18-26), z: 字牌(27-33, 1-7分别对应东南西北白发中)
+    数牌的 '0' 表示赤五，按普通的 5 计入
 
     返回:
         List[int]: 包含牌 ID 的列表，例如 [0, 1, 2, ...]
@@ -21,7 +24,7 @@ def parse_tiles(hand_str: str) -> List[int]:
             offset = offsets[char]
             for num in current_numbers:
                 # 牌面数字 1-9，对应的内部索引是 0-8，所以要减 1
-                result.append(num - 1 + offset)
+                result.append((num or 5) - 1 + offset)
             current_numbers = []
 
     return result
@@ -85,6 +88,94 @@ def hand_array_to_tenhou_str(hand_array: List[int]) -> str:
     return res
 
 
+# --- 紧凑编码 (Packed Hand) ---
+# 每种牌的张数占 3 bit (0-7，足够表示 0-4 张)，34 种牌共 102 bit：
+#   整数形式: 第 t 种牌的张数位于 bit [3t, 3t+3)，可直接作为哈希键
+#   字节形式: 同一个整数的 13 字节小端序，用于 API 传输与日志存储
+PACKED_SIZE = 13
+_BIT_WEIGHTS = np.array([1, 2, 4], dtype=np.uint8)
+_SUIT_OFFSETS = np.full(256, -1, dtype=np.int16)
+_SUIT_OFFSETS[[ord('m'), ord('p'), ord('s'), ord('z')]] = [0, 9, 18, 27]
+
+
+def pack_hand(hand_array: List[int]) -> int:
+    """34 格计数数组 -> 102 bit 整数 (张数超出 0-7 会串进相邻的牌，直接报错)"""
+    packed = 0
+    for t_id in range(33, -1, -1):
+        count = int(hand_array[t_id])
+        if not 0 <= count <= 7:
+            raise ValueError(f"牌 {t_id} 的张数 {count} 超出紧凑编码的范围 (0-7)")
+        packed = (packed << 3) | count
+    return packed
+
+
+def unpack_hand(packed: int) -> List[int]:
+    """102 bit 整数 -> 34 格计数数组"""
+    return [(packed >> (3 * t_id)) & 7 for t_id in range(34)]
+
+
+def pack_hand_bytes(hand_array: List[int]) -> bytes:
+    return pack_hand(hand_array).to_bytes(PACKED_SIZE, 'little')
+
+
+def unpack_hand_bytes(blob: bytes) -> List[int]:
+    return unpack_hand(int.from_bytes(blob, 'little'))
+
+
+def encode_hands(counts: np.ndarray) -> np.ndarray:
+    """批量编码：(n, 34) 计数矩阵 -> (n, 13) uint8，每行与 pack_hand_bytes 的结果相同"""
+    counts = np.asarray(counts).reshape(-1, 34)
+    if counts.size and (counts.min() < 0 or counts.max() > 7):
+        raise ValueError("张数超出紧凑编码的范围 (0-7)")
+    bits = (counts.astype(np.uint8)[:, :, None] >> np.arange(3, dtype=np.uint8)) & 1
+    bits = bits.reshape(len(counts), 102)
+    return np.packbits(np.pad(bits, ((0, 0), (0, PACKED_SIZE * 8 - 102))), axis=1, bitorder='little')
+
+
+def decode_hands(packed: Union[np.ndarray, bytes]) -> np.ndarray:
+    """批量解码：(n, 13) uint8 (或 n * 13 字节的连续 bytes) -> (n, 34) uint8 计数矩阵"""
+    packed = np.frombuffer(packed, dtype=np.uint8) if isinstance(packed, (bytes, bytearray)) else \
+        np.asarray(packed, dtype=np.uint8)
+    packed = packed.reshape(-1, PACKED_SIZE)
+    bits = np.unpackbits(packed, axis=1, bitorder='little')[:, :102].reshape(len(packed), 34, 3)
+    return bits @ _BIT_WEIGHTS
+
+
+def parse_tiles_bulk(hand_strs: Iterable[str]) -> np.ndarray:
+    """
+    批量解析天凤格式字符串，返回 (n, 34) uint8 计数矩阵 (第 i 行对应第 i 个字符串)。
+    所有字符串拼成一个字节数组后整体向量化处理：每个数字归属于其后第一个花色字母，
+    换行符作为行分隔；'0' 视为赤五 (计入 5)。
+    """
+    hand_strs = list(hand_strs)
+    n = len(hand_strs)
+    buf = np.frombuffer(('\n'.join(hand_strs) + '\n').encode('ascii'), dtype=np.uint8)
+    positions = np.arange(len(buf))
+    newline = buf == ord('\n')
+    offsets = _SUIT_OFFSETS[buf]
+    # 每个位置之后 (含自身) 第一个花色字母或换行符的位置
+    stop = np.where((offsets >= 0) | newline, positions, len(buf) - 1)
+    stop = np.minimum.accumulate(stop[::-1])[::-1]
+
+    digits = (buf >= ord('0')) & (buf <= ord('9')) & (offsets[stop] >= 0)
+    numbers = buf[digits].astype(np.int64) - ord('0')
+    numbers[numbers == 0] = 5
+    tiles = offsets[stop[digits]] + numbers - 1
+    rows = np.cumsum(newline)[digits]
+    return np.bincount(rows * 34 + tiles, minlength=n * 34).reshape(n, 34).astype(np.uint8)
+
+
+def format_tiles_bulk(counts: np.ndarray) -> List[str]:
+    """parse_tiles_bulk 的逆操作：(n, 34) 计数矩阵 -> 天凤格式字符串列表"""
+    return [hand_array_to_tenhou_str(row) for row in np.asarray(counts).tolist()]
+
+
+def tile_ids_from_packed(packed_hex: str) -> List[int]:
+    """API 的紧凑传输格式：26 位十六进制 (13 字节小端序) -> 牌 ID 列表 (与 parse_tiles 的输出同格式)"""
+    hand_array = unpack_hand_bytes(bytes.fromhex(packed_hex))
+    return [t_id for t_id in range(34) for _ in range(hand_array[t_id])]
+
+
 # --- 简单的单元测试 ---
 if __name__ == "__main__":
     # 1. 测试字符串转 ID